@@ -5,11 +5,15 @@ from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from ai.engine import AIEngine
 from ai.rag_index import RAGIndex
+from ai import metrics, profiling
+from ai.profiling import span
 
 API_KEY = os.environ.get('THEFOOL_AI_API_KEY', 'local-dev-key')
 MODEL_ID = os.environ.get('THEFOOL_MODEL_ID', 'mistralai/mistral-7b')
 
 app = FastAPI(title='TheFool AI Service (lab-only)')
+metrics.instrument_app(app)
+profiling.instrument_app(app)
 engine = AIEngine(model_id=MODEL_ID, load_in_8bit=True)
 _model_loaded = False
 rag = RAGIndex()
@@ -58,9 +62,11 @@ async def chat(req: ChatReq, request: Request):
     if key != API_KEY:
         raise HTTPException(status_code=401, detail='invalid api key')
     try:
-        hits = rag.search(req.query, k=req.top_k)
-        context = "\n\n".join([f"Source: {h['id']}\n{h['text'][:800]}" for h in hits])
-        prompt = f"You are a defensive security assistant. Use the context to answer.\n\nContext:\n{context}\n\nQuery:\n{req.query}\n\nAnswer:"
+        with span("chat.retrieve"):
+            hits = rag.search(req.query, k=req.top_k)
+        with span("chat.prompt_build"):
+            context = "\n\n".join([f"Source: {h['id']}\n{h['text'][:800]}" for h in hits])
+            prompt = f"You are a defensive security assistant. Use the context to answer.\n\nContext:\n{context}\n\nQuery:\n{req.query}\n\nAnswer:"
         ensure_loaded()
         out = engine.generate(prompt, max_new_tokens=256, temperature=0.2)
         return {'answer': out, 'retrieved': hits}
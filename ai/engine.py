@@ -7,6 +7,8 @@ import os
 import re
 import json
 import time
+import uuid
+import hashlib
 import logging
 from typing import Optional, Dict, Any
 
@@ -26,6 +28,9 @@ try:
 except Exception:
     LoraConfig = get_peft_model = prepare_model_for_kbit_training = PeftModel = None
 
+from ai import metrics
+from ai.profiling import span
+
 LOG_DIR = os.environ.get("THEFOOL_AI_LOG_DIR", "ai/logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 
@@ -70,18 +75,35 @@ class AIEngine:
         self.peft_applied = False
         self.mode = os.environ.get("THEFOOL_AI_MODE", "mock")  # 'mock' or 'live'
         self._loaded = False
+        metrics.track_model_memory(self)
 
     def _mock_response(self, prompt: str) -> str:
-        # deterministic safe stub for dev/testing
-        h = str(abs(hash(prompt)))[:8]
+        # deterministic safe stub for dev/testing (sha256, not hash(): that is salted per process)
+        h = str(int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16))[:8]
         return f"[MOCK-ANSWER {h}] This is a safe mock response from TheFool AI engine."
 
+    def _count_tokens(self, text: str) -> int:
+        # real token count once a tokenizer is loaded; whitespace words otherwise (mock mode)
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return len(text.split())
+
+    def _observe_generation(self, prompt: str, output: str, seconds: float):
+        n_prompt = self._count_tokens(prompt)
+        n_out = self._count_tokens(output)
+        metrics.GENERATE_SECONDS.labels(self.mode).observe(seconds)
+        metrics.PROMPT_TOKENS.labels(self.mode).observe(n_prompt)
+        metrics.OUTPUT_TOKENS.labels(self.mode).observe(n_out)
+        if seconds > 0:
+            metrics.TOKENS_PER_SECOND.labels(self.mode).observe(n_out / seconds)
+
     def load(self):
         """Load tokenizer and model. This is lazy-load safe; call in background if desired."""
         if self._loaded:
             return
         if self.mode == "mock":
             logger.info("AIEngine: running in MOCK mode; skipping large model load.")
+            metrics.record_load_phase("mock", 0.0)
             self._loaded = True
             return
 
@@ -89,9 +111,12 @@ class AIEngine:
             raise RuntimeError("transformers not installed in environment. Install requirements before loading model.")
 
         logger.info("AIEngine: loading tokenizer for %s", self.model_id)
+        t0 = time.perf_counter()
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_id, use_fast=True)
+        metrics.record_load_phase("tokenizer", time.perf_counter() - t0)
 
         logger.info("AIEngine: loading model (8bit=%s, device_map=%s)", self.load_in_8bit, self.device_map)
+        t0 = time.perf_counter()
         try:
             if self.load_in_8bit:
                 self.model = AutoModelForCausalLM.from_pretrained(self.model_id, load_in_8bit=True, device_map=self.device_map)
@@ -100,40 +125,57 @@ class AIEngine:
         except Exception as e:
             logger.exception("Model load failed: %s", e)
             raise
+        metrics.record_load_phase("model", time.perf_counter() - t0)
 
         # pipeline for convenience
+        t0 = time.perf_counter()
         device = 0 if torch and torch.cuda.is_available() and self.device_map != "cpu" else -1
         self.pipe = pipeline("text-generation", model=self.model, tokenizer=self.tokenizer, device=device)
+        metrics.record_load_phase("pipeline", time.perf_counter() - t0)
         self._loaded = True
         logger.info("AIEngine: model loaded")
 
     def generate(self, prompt: str, max_new_tokens: int = 256, temperature: float = 0.2, do_sample: bool = True) -> Dict[str, Any]:
         """Generate text and moderate. Returns dict: {blocked:bool, text:, meta:...}"""
-        meta = {"prompt_len": len(prompt), "timestamp": int(time.time())}
-        audit_event({"event":"generate.request","prompt_snippet":prompt[:800],"meta":meta})
+        t0 = time.time()
+        meta = {"prompt_len": len(prompt), "timestamp": int(t0)}
+        # ties the generate.* audit events of one call together (requests are served concurrently)
+        rid = uuid.uuid4().hex
+        with span("engine.audit"):
+            audit_event({"event":"generate.request","request_id":rid,"ts":round(t0, 6),"prompt_snippet":prompt[:800],"meta":meta})
         if self.mode == "mock":
-            out = self._mock_response(prompt)
-            audit_event({"event":"generate.response","mode":"mock","text_snippet":out[:1000]})
+            with span("engine.mock"):
+                out = self._mock_response(prompt)
+            self._observe_generation(prompt, out, time.time() - t0)
+            audit_event({"event":"generate.response","request_id":rid,"mode":"mock","text_snippet":out[:1000],"elapsed_ms":round((time.time()-t0)*1000, 3)})
             return {"blocked": False, "text": out, "meta": meta}
 
         if not self._loaded:
-            self.load()
+            with span("engine.load"):
+                self.load()
 
         # generate via pipeline (guard for token limits)
+        g0 = time.perf_counter()
         try:
-            result = self.pipe(prompt, max_new_tokens=max_new_tokens, do_sample=do_sample, temperature=temperature)
+            with span("engine.pipeline"):
+                result = self.pipe(prompt, max_new_tokens=max_new_tokens, do_sample=do_sample, temperature=temperature)
             text = result[0].get("generated_text","") if isinstance(result, list) else str(result)
+            # generated_text echoes the prompt; count only the continuation
+            self._observe_generation(prompt, text[len(prompt):] if text.startswith(prompt) else text, time.perf_counter() - g0)
         except Exception as e:
             logger.exception("Generation error: %s", e)
             text = "[ERROR] model generation failed."
 
         # moderate before returning
-        mod = moderate_text(text)
+        with span("engine.moderation"):
+            mod = moderate_text(text)
         if not mod.get("ok", False):
-            audit_event({"event":"generate.blocked","reason":mod.get("reason"),"excerpt":mod.get("excerpt")})
+            metrics.MODERATION_BLOCKS.labels(mod.get("reason")).inc()
+            audit_event({"event":"generate.blocked","request_id":rid,"reason":mod.get("reason"),"excerpt":mod.get("excerpt"),
+                         "elapsed_ms":round((time.time()-t0)*1000, 3)})
             return {"blocked": True, "reason": mod.get("reason"), "meta": meta}
 
-        audit_event({"event":"generate.response","text_snippet":text[:1000],"meta":meta})
+        audit_event({"event":"generate.response","request_id":rid,"text_snippet":text[:1000],"meta":meta,"elapsed_ms":round((time.time()-t0)*1000, 3)})
         return {"blocked": False, "text": text, "meta": meta}
 
     def apply_lora(self, **kwargs):
@@ -162,6 +204,8 @@ class AIEngine:
             raise RuntimeError("peft.PeftModel required to load adapter")
         if not self._loaded:
             self.load()
+        t0 = time.perf_counter()
         self.model = PeftModel.from_pretrained(self.model, adapter_dir)
+        metrics.record_load_phase("adapter", time.perf_counter() - t0)
         self.peft_applied = True
         logger.info("AIEngine: loaded adapter from %s", adapter_dir)
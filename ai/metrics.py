@@ -0,0 +1,283 @@
+# ai/metrics.py
+# Minimal Prometheus-style metrics for TheFool AI stack (stdlib only, no prometheus_client needed).
+# Updates are a dict lookup + a few float adds under a lock; gauges that are expensive to
+# compute (memory) are evaluated only when /metrics is scraped.
+import os
+import time
+import bisect
+import threading
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (1, 4, 16, 64, 128, 256, 512, 1024, 2048, 4096, 16384)
+RATE_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels(*([""] * len(self.labelnames))) if self.labelnames else self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self, lock):
+        self.value = 0.0
+        self.lock = lock
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = float(value)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(child.value)}"]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._fn: Optional[Callable[[], float]] = None
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, fn: Callable[[], float]):
+        """Evaluate fn at scrape time instead of tracking a value."""
+        self._fn = fn
+
+    def render(self):
+        if self._fn is not None:
+            try:
+                self.set(self._fn())
+            except Exception:
+                pass
+        return super().render()
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(child.value)}"]
+
+class _HistValue:
+    __slots__ = ("buckets", "counts", "sum", "count", "lock")
+
+    def __init__(self, buckets, lock):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = lock
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistValue(self.buckets, self._lock)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def _render_child(self, key, child):
+        lines = []
+        acc = 0
+        for le, n in zip(self.buckets + (float("inf"),), child.counts):
+            acc += n
+            le_label = 'le="%s"' % _fmt_value(le)
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le_label)} {acc}")
+        lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(child.sum)}")
+        lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {child.count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+# --- TheFool metrics --------------------------------------------------------------------------
+
+REQUEST_LATENCY = histogram("thefool_request_latency_seconds", "HTTP request latency", ("route", "status"))
+INFLIGHT = gauge("thefool_inflight_requests", "HTTP requests currently being handled")
+GENERATE_SECONDS = histogram("thefool_generate_seconds", "Time spent in model generation", ("mode",))
+PROMPT_TOKENS = histogram("thefool_prompt_tokens", "Prompt length in tokens", ("mode",), TOKEN_BUCKETS)
+OUTPUT_TOKENS = histogram("thefool_output_tokens", "Generated tokens per request", ("mode",), TOKEN_BUCKETS)
+TOKENS_PER_SECOND = histogram("thefool_tokens_per_second", "Generation throughput per request", ("mode",), RATE_BUCKETS)
+RAG_SEARCH_SECONDS = histogram("thefool_rag_search_seconds", "RAG search latency (embedding + index lookup)")
+EMBED_SECONDS = histogram("thefool_embed_seconds", "Sentence embedding time", ("op",))
+MODERATION_BLOCKS = counter("thefool_moderation_blocks_total", "Generations blocked by moderation", ("reason",))
+CACHE_REQUESTS = counter("thefool_cache_requests_total", "Lookups of in-process caches", ("cache", "result"))
+LOAD_PHASES = counter("thefool_load_phase_total", "Completed model/index load phases", ("phase",))
+LOAD_PHASE_SECONDS = counter("thefool_load_phase_seconds_total", "Time spent in model/index load phases", ("phase",))
+MODEL_MEMORY = gauge("thefool_model_memory_bytes", "Memory footprint of the loaded model (0 if not loaded)")
+PROCESS_RSS = gauge("thefool_process_resident_memory_bytes", "Resident set size of this process")
+
+_served = {"peak_inflight": 0, "served": 0}
+
+def _rss_bytes() -> float:
+    try:
+        with open("/proc/self/statm", "r") as fh:
+            return float(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        import resource
+        return float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024
+
+PROCESS_RSS.set_function(_rss_bytes)
+
+def track_model_memory(engine):
+    """Report engine.model's footprint at scrape time."""
+    def _mem():
+        model = getattr(engine, "model", None)
+        if model is None or not hasattr(model, "get_memory_footprint"):
+            return 0.0
+        return float(model.get_memory_footprint())
+    MODEL_MEMORY.set_function(_mem)
+
+def queue_stats() -> Dict[str, float]:
+    return {"inflight": int(INFLIGHT._default().value), **_served}
+
+class timed:
+    """Context manager observing elapsed seconds into a histogram child: `with timed(H.labels("x")):`"""
+    __slots__ = ("target", "t0", "elapsed")
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.t0
+        self.target.observe(self.elapsed)
+        return False
+
+def record_load_phase(phase: str, seconds: float):
+    LOAD_PHASES.labels(phase).inc()
+    LOAD_PHASE_SECONDS.labels(phase).inc(seconds)
+
+def render() -> str:
+    return REGISTRY.render()
+
+def instrument_app(app):
+    """Add in-flight / latency middleware and a /metrics route to a FastAPI app."""
+    from fastapi import Request
+    from fastapi.responses import PlainTextResponse
+
+    routes = set()
+
+    @app.middleware("http")
+    async def _metrics_middleware(request: Request, call_next):
+        if not routes:
+            routes.update(getattr(r, "path", None) for r in app.routes)
+        path = request.url.path
+        route = path if path in routes else "other"
+        INFLIGHT.inc()
+        _served["peak_inflight"] = max(_served["peak_inflight"], int(INFLIGHT._default().value))
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            resp = await call_next(request)
+            status = resp.status_code
+            return resp
+        finally:
+            INFLIGHT.dec()
+            _served["served"] += 1
+            REQUEST_LATENCY.labels(route, status).observe(time.perf_counter() - t0)
+
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+    return app
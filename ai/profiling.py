@@ -0,0 +1,180 @@
+# ai/profiling.py
+# Opt-in per-request profiling for TheFool AI services (CPU via cProfile, memory via tracemalloc).
+#
+# Off by default. Enable with either:
+#   THEFOOL_PROFILE_RATE=0.05          profile ~5% of requests (1 = every request)
+#   THEFOOL_PROFILE_KEY=<secret>       profile requests sending header  x-thefool-profile: <secret>
+# THEFOOL_PROFILE_MEMORY=1 adds a tracemalloc snapshot; output goes to THEFOOL_PROFILE_DIR
+# (default ai/logs/profiles) as <request_id>.prof / .json / .tracemalloc.
+# When no request is being profiled, span() returns a shared no-op after one ContextVar lookup.
+#
+# Both profilers are wider than the request. cProfile is enabled on the event-loop thread, so a
+# CPU profile also contains whatever other requests ran on the loop while this one was awaiting.
+# tracemalloc is process-wide: the snapshot and span memory deltas include concurrent requests'
+# allocations. Profile under low concurrency (or with THEFOOL_PROFILE_KEY) for clean numbers.
+import os
+import json
+import time
+import uuid
+import random
+import cProfile
+import pstats
+import io
+import threading
+import tracemalloc
+import contextvars
+from typing import Optional
+
+PROFILE_RATE = float(os.environ.get("THEFOOL_PROFILE_RATE", "0") or 0)
+PROFILE_KEY = os.environ.get("THEFOOL_PROFILE_KEY", "")
+PROFILE_MEMORY = os.environ.get("THEFOOL_PROFILE_MEMORY", "0") == "1"
+PROFILE_DIR = os.environ.get("THEFOOL_PROFILE_DIR", os.path.join(os.environ.get("THEFOOL_AI_LOG_DIR", "ai/logs"), "profiles"))
+PROFILE_HEADER = "x-thefool-profile"
+
+ENABLED = PROFILE_RATE > 0 or bool(PROFILE_KEY)
+
+_current: contextvars.ContextVar = contextvars.ContextVar("thefool_profile", default=None)
+# cProfile can only run one profiler per thread; concurrent profiled requests fall back to spans only
+_cpu_lock = threading.Lock()
+# tracemalloc is shared by concurrent memory-profiled requests: started by the first, stopped by
+# the last (and never stopped if something else had started it)
+_mem_lock = threading.Lock()
+_mem_users = 0
+_mem_started = False
+
+def _tracemalloc_acquire():
+    global _mem_users, _mem_started
+    with _mem_lock:
+        if _mem_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _mem_started = True
+        _mem_users += 1
+
+def _tracemalloc_release():
+    """Snapshot for the releasing request (None if tracing was stopped elsewhere)."""
+    global _mem_users, _mem_started
+    with _mem_lock:
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        _mem_users -= 1
+        if _mem_users == 0 and _mem_started:
+            tracemalloc.stop()
+            _mem_started = False
+    return snapshot
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopSpan()
+
+class _Span:
+    __slots__ = ("prof", "name", "t0", "m0", "depth")
+
+    def __init__(self, prof, name):
+        self.prof = prof
+        self.name = name
+
+    def __enter__(self):
+        self.depth = self.prof.depth
+        self.prof.depth += 1
+        self.m0 = tracemalloc.get_traced_memory()[0] if self.prof.memory else None
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter()
+        self.prof.depth -= 1
+        rec = {"name": self.name, "depth": self.depth, "start_ms": round((self.t0 - self.prof.t0) * 1000, 3),
+               "duration_ms": round((t1 - self.t0) * 1000, 3)}
+        if self.m0 is not None:
+            rec["mem_delta_bytes"] = tracemalloc.get_traced_memory()[0] - self.m0
+        self.prof.spans.append(rec)
+        return False
+
+def span(name: str):
+    """Named timing span around a stage; free when the current request is not profiled."""
+    prof = _current.get()
+    if prof is None:
+        return _NOOP
+    return _Span(prof, name)
+
+class RequestProfile:
+    def __init__(self, request_id: str, route: str, memory: bool = PROFILE_MEMORY, out_dir: str = PROFILE_DIR):
+        self.request_id = request_id
+        self.route = route
+        self.memory = memory
+        self.out_dir = out_dir
+        self.spans = []
+        self.depth = 0
+        self.cpu: Optional[cProfile.Profile] = None
+        self._token = None
+
+    def __enter__(self):
+        if self.memory:
+            _tracemalloc_acquire()
+        if _cpu_lock.acquire(blocking=False):
+            self.cpu = cProfile.Profile()
+            self.cpu.enable()
+        self._token = _current.set(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.t0
+        _current.reset(self._token)
+        if self.cpu is not None:
+            self.cpu.disable()
+            _cpu_lock.release()
+        snapshot = _tracemalloc_release() if self.memory else None
+        try:
+            self._save(wall, snapshot)
+        except Exception:
+            pass
+        return False
+
+    def _save(self, wall, snapshot):
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, self.request_id)
+        report = {"request_id": self.request_id, "route": self.route, "wall_ms": round(wall * 1000, 3),
+                  "created_at": time.time(), "spans": sorted(self.spans, key=lambda s: s["start_ms"])}
+        if self.cpu is not None:
+            self.cpu.dump_stats(base + ".prof")
+            buf = io.StringIO()
+            pstats.Stats(self.cpu, stream=buf).sort_stats("cumulative").print_stats(25)
+            report["cpu_top"] = buf.getvalue().splitlines()
+        if snapshot is not None:
+            snapshot.dump(base + ".tracemalloc")
+            report["memory_top"] = [str(s) for s in snapshot.statistics("lineno")[:25]]
+        with open(base + ".json", "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+
+def should_profile(headers) -> bool:
+    if not ENABLED:
+        return False
+    if PROFILE_KEY and headers.get(PROFILE_HEADER, "") == PROFILE_KEY:
+        return True
+    return PROFILE_RATE > 0 and random.random() < PROFILE_RATE
+
+def instrument_app(app):
+    """Profile selected requests of a FastAPI app; the request id is returned in x-thefool-profile-id."""
+    if not ENABLED:
+        return app
+    from fastapi import Request
+
+    @app.middleware("http")
+    async def _profile_middleware(request: Request, call_next):
+        if not should_profile(request.headers):
+            return await call_next(request)
+        request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+        request_id = "".join(c for c in request_id if c.isalnum() or c in "-_")[:64] or uuid.uuid4().hex
+        with RequestProfile(request_id, request.url.path):
+            resp = await call_next(request)
+        resp.headers["x-thefool-profile-id"] = request_id
+        return resp
+
+    return app
@@ -1,7 +1,9 @@
 # RAG index helper supporting FAISS (default) and optional Chroma (if configured)
-import os, json
+import os, json, time
 from sentence_transformers import SentenceTransformer
 import numpy as np
+from ai import metrics
+from ai.profiling import span
 
 USE_CHROMA = os.environ.get("THEFOOL_USE_CHROMA", "0") == "1"
 
@@ -23,13 +25,16 @@ INDEX_PATH = os.environ.get("THEFOOL_FAISS_INDEX", "ai/faiss_index.bin")
 
 class RAGIndex:
     def __init__(self, embed_model=EMBED_MODEL):
+        t0 = time.perf_counter()
         self.embedder = SentenceTransformer(embed_model)
+        metrics.record_load_phase("embedder", time.perf_counter() - t0)
         self.index = None
         self.docs = []
 
     def build(self, docs, index_path=INDEX_PATH):
         texts = [d["text"] for d in docs]
-        vecs = self.embedder.encode(texts, convert_to_numpy=True, show_progress_bar=True)
+        with metrics.timed(metrics.EMBED_SECONDS.labels("build")):
+            vecs = self.embedder.encode(texts, convert_to_numpy=True, show_progress_bar=True)
         d = vecs.shape[1]
         if not USE_CHROMA:
             if faiss is None:
@@ -52,14 +57,26 @@ class RAGIndex:
             self.docs = docs
 
     def search(self, query, k=4, index_path=INDEX_PATH):
-        qv = self.embedder.encode([query], convert_to_numpy=True)
+        with metrics.timed(metrics.RAG_SEARCH_SECONDS):
+            return self._search(query, k, index_path)
+
+    def _search(self, query, k, index_path):
+        with span("rag.embed"), metrics.timed(metrics.EMBED_SECONDS.labels("query")):
+            qv = self.embedder.encode([query], convert_to_numpy=True)
         if not USE_CHROMA:
             if self.index is None:
-                self.index = faiss.read_index(index_path)
-                with open(index_path + ".meta.json", "r", encoding="utf-8") as fh:
-                    self.docs = json.load(fh)
-            faiss.normalize_L2(qv)
-            D, I = self.index.search(qv, k)
+                metrics.CACHE_REQUESTS.labels("rag_index", "miss").inc()
+                t0 = time.perf_counter()
+                with span("rag.index_load"):
+                    self.index = faiss.read_index(index_path)
+                    with open(index_path + ".meta.json", "r", encoding="utf-8") as fh:
+                        self.docs = json.load(fh)
+                metrics.record_load_phase("rag_index", time.perf_counter() - t0)
+            else:
+                metrics.CACHE_REQUESTS.labels("rag_index", "hit").inc()
+            with span("rag.faiss_search"):
+                faiss.normalize_L2(qv)
+                D, I = self.index.search(qv, k)
             results = []
             for dist, idx in zip(D[0], I[0]):
                 if idx < 0: continue
@@ -68,9 +85,10 @@ class RAGIndex:
             return results
         else:
             # Chroma search
-            client = chromadb.Client()
-            collection = client.get_collection("thefool")
-            hits = collection.query(query_embeddings=qv.tolist(), n_results=k)
+            with span("rag.chroma_search"):
+                client = chromadb.Client()
+                collection = client.get_collection("thefool")
+                hits = collection.query(query_embeddings=qv.tolist(), n_results=k)
             results = []
             for i in range(len(hits["ids"][0])):
                 idx_id = hits["ids"][0][i]
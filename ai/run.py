@@ -7,6 +7,8 @@ import uvicorn
 from ai.engine import AIEngine
 from ai.tutor import tutor
 from ai.rag_index import RAGIndex
+from ai import metrics, profiling
+from ai.profiling import span
 
 
 
@@ -15,6 +17,8 @@ BIND_HOST = os.environ.get("THEFOOL_BIND_HOST", "127.0.0.1")
 BIND_PORT = int(os.environ.get("THEFOOL_BIND_PORT", "9200"))
 
 app = FastAPI(title="TheFool AI inference (lab-only)")
+metrics.instrument_app(app)
+profiling.instrument_app(app)
 
 _engine = AIEngine(model_id=os.environ.get("THEFOOL_MODEL_ID"), load_in_8bit=os.environ.get("THEFOOL_LOAD_8BIT","true").lower()!="false")
 
@@ -28,7 +32,7 @@ rag = RAGIndex()
 
 @app.get("/ai/status")
 async def status():
-    return {"status": "ok", "mode": _engine.mode, "model_id": _engine.model_id, "loaded": _engine._loaded}
+    return {"status": "ok", "mode": _engine.mode, "model_id": _engine.model_id, "loaded": _engine._loaded, **metrics.queue_stats()}
 
 @app.post("/ai/run")
 async def run(req: RunReq, request: Request):
@@ -64,19 +68,21 @@ async def chat(payload: dict, request: Request):
     if not query:
         raise HTTPException(status_code=400, detail="missing query")
     # ensure index exists
-    try:
-        retrieved = rag.search(query, k=top_k)
-    except Exception:
-        # fallback: try to build from docs
+    with span("chat.retrieve"):
         try:
-            import ai.index_docs as index_docs
-            index_docs.main()
             retrieved = rag.search(query, k=top_k)
-        except Exception as e:
-            retrieved = []
+        except Exception:
+            # fallback: try to build from docs
+            try:
+                import ai.index_docs as index_docs
+                index_docs.main()
+                retrieved = rag.search(query, k=top_k)
+            except Exception as e:
+                retrieved = []
     # build prompt with sources
-    context = "\n\n".join([f"Source: {r['id']}\\n{r['text'][:800]}" for r in retrieved])
-    prompt = f"You're TheFool lab assistant. Use only the context to answer. Cite sources in square brackets like [ROE.md]. Context:\\n{context}\\n\\nQuery:\\n{query}\\n\\nAnswer concisely and cite sources."
+    with span("chat.prompt_build"):
+        context = "\n\n".join([f"Source: {r['id']}\\n{r['text'][:800]}" for r in retrieved])
+        prompt = f"You're TheFool lab assistant. Use only the context to answer. Cite sources in square brackets like [ROE.md]. Context:\\n{context}\\n\\nQuery:\\n{query}\\n\\nAnswer concisely and cite sources."
     # use engine
     result = _engine.generate(prompt, max_new_tokens=300, temperature=0.2)
     return {"answer": result, "retrieved": retrieved}
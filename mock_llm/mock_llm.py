@@ -1,17 +1,41 @@
 # TheFool - Mock LLM service (deterministic & safe)
 # Author: RafalW3bCraft
+#
+# Simulates model latency so clients, timeouts and Suricata/Zeek rules can be
+# exercised without a real model:
+#   python3 mock_llm/mock_llm.py --profile gpu-7b                    # Flask, threaded
+#   python3 mock_llm/mock_llm.py --server async --workers 4 --profile cpu-7b
+# POST /v1/generate {"prompt": "...", "max_new_tokens": 64, "stream": true|"sse"|"chunked"}
+# Per-request overrides: "latency_profile" (name) and any of ttft_ms/tokens_per_s/jitter/tail_prob/tail_ms.
 
-from flask import Flask, request, jsonify
-import hashlib
+import os
+import sys
+import json
 import time
+import math
+import random
+import asyncio
+import threading
+import hashlib
 import argparse
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--mode", choices=("safe","vuln","noisy"), default="safe")
-args = parser.parse_args()
-MODE = args.mode
+from flask import Flask, request, jsonify, Response, stream_with_context
 
-app = Flask(__name__)
+# Configuration comes from the environment so async workers (separate processes) see the same values.
+MODE = os.environ.get("THEFOOL_MOCK_MODE", "safe")
+PROFILE = os.environ.get("THEFOOL_MOCK_PROFILE", "instant")
+MAX_TOKENS = int(os.environ.get("THEFOOL_MOCK_MAX_TOKENS", "4096"))
+
+# Latency profiles. ttft_ms: delay before the first token; tokens_per_s: decode rate (0 = instant);
+# jitter: +/- fraction applied to every delay; tail_prob/tail_ms: chance of an extra stall before the first token.
+PROFILES = {
+    "instant": {"ttft_ms": 0, "tokens_per_s": 0, "jitter": 0.0, "tail_prob": 0.0, "tail_ms": 0},
+    "gpu-7b": {"ttft_ms": 150, "tokens_per_s": 40, "jitter": 0.1, "tail_prob": 0.01, "tail_ms": 1000},
+    "cpu-7b": {"ttft_ms": 1500, "tokens_per_s": 4, "jitter": 0.2, "tail_prob": 0.02, "tail_ms": 5000},
+    "slow-tail": {"ttft_ms": 100, "tokens_per_s": 50, "jitter": 0.1, "tail_prob": 0.05, "tail_ms": 10000},
+}
+
+_rng = random.Random(int(os.environ["THEFOOL_MOCK_SEED"])) if os.environ.get("THEFOOL_MOCK_SEED") else random.Random()
 
 # deterministic canned responses for safe testing. No external model downloads.
 RESPONSES = {
@@ -19,14 +43,77 @@ RESPONSES = {
     'default': 'This is a safe mock response from TheFool lab. Use only in authorized labs.'
 }
 
-@app.route('/health', methods=['GET'])
-def health():
-    return jsonify({'status': 'ok', 'time': time.time()})
+# vocabulary for deterministic filler text of a requested token count
+_VOCAB = ("lab scope evidence request response header session traffic report finding severity "
+          "remediation checklist recon endpoint input validation proxy capture sanitized authorized "
+          "sandbox rule alert zeek suricata flow mock safe deterministic benign review").split()
 
-@app.route('/v1/generate', methods=['POST'])
-def generate():
-    data = request.get_json(force=True) or {}
+_stats = {"inflight": 0, "served": 0}
+# the Flask server runs each request on its own thread
+_stats_lock = threading.Lock()
+
+def _request_started():
+    with _stats_lock:
+        _stats['inflight'] += 1
+
+def _request_done():
+    with _stats_lock:
+        _stats['inflight'] -= 1
+        _stats['served'] += 1
+
+def _env_profile():
+    prof = dict(PROFILES.get(PROFILE, PROFILES["instant"]))
+    for key, cast in (("ttft_ms", float), ("tokens_per_s", float), ("jitter", float), ("tail_prob", float), ("tail_ms", float)):
+        val = os.environ.get("THEFOOL_MOCK_" + key.upper())
+        if val is not None:
+            prof[key] = cast(val)
+    return prof
+
+_DEFAULT_PROFILE = _env_profile()
+
+def resolve_profile(data):
+    """Server profile, optionally replaced by a named profile and per-field overrides from the request
+    (ValueError unless an override is a finite, non-negative number)."""
+    prof = dict(PROFILES.get(data.get("latency_profile"), _DEFAULT_PROFILE))
+    for key in prof:
+        if key in data:
+            try:
+                val = float(data[key])
+            except (TypeError, ValueError):
+                val = math.nan
+            if not (math.isfinite(val) and val >= 0):
+                raise ValueError(f'{key} must be a finite, non-negative number')
+            prof[key] = val
+    return prof
+
+def _jitter(seconds, prof):
+    j = prof["jitter"]
+    return max(0.0, seconds * (1.0 + _rng.uniform(-j, j))) if j else seconds
+
+def schedule(n_tokens, prof):
+    """Delays (seconds) before each of n_tokens tokens: first entry is time-to-first-token."""
+    ttft = prof["ttft_ms"] / 1000.0
+    if prof["tail_prob"] and _rng.random() < prof["tail_prob"]:
+        ttft += prof["tail_ms"] / 1000.0
+    step = 1.0 / prof["tokens_per_s"] if prof["tokens_per_s"] > 0 else 0.0
+    delays = [_jitter(ttft, prof)]
+    delays.extend(_jitter(step, prof) for _ in range(max(0, n_tokens - 1)))
+    return delays
+
+def requested_tokens(data):
+    """max_new_tokens (or max_tokens) of a request payload; None if absent, ValueError if not an integer."""
+    n = data.get('max_new_tokens', data.get('max_tokens'))
+    if n is None:
+        return None
+    try:
+        return int(n)
+    except (TypeError, ValueError):
+        raise ValueError('max_new_tokens must be an integer') from None
+
+def build_response(data):
+    """Deterministic response body + token list for a request payload (ValueError on a bad max_new_tokens)."""
     prompt = data.get('prompt', '')
+    n = requested_tokens(data)
     # simple deterministic fingerprint to simulate varying responses
     h = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
 
@@ -48,6 +135,17 @@ def generate():
             resp = RESPONSES['default'] + ' (variant C)'
         flagged = False
 
+    if n is not None and not flagged:
+        # requested length: canned text followed by deterministic filler, exactly n whitespace tokens
+        n = max(1, min(n, MAX_TOKENS))
+        words = resp.split()[:n]
+        rnd = random.Random(int(h[:16], 16))
+        words.extend(rnd.choice(_VOCAB) for _ in range(n - len(words)))
+        resp = ' '.join(words)
+    tokens = [w + ' ' for w in resp.split()]
+    if tokens:
+        tokens[-1] = tokens[-1].rstrip()
+
     out = {
         'id': h[:12],
         'prompt_summary': prompt[:200],
@@ -55,10 +153,174 @@ def generate():
         'flagged': flagged,
         'meta': {
             'length': len(prompt),
+            'tokens': len(tokens),
             'server_time': time.time()
         }
     }
-    return jsonify(out)
+    return out, tokens
+
+def _stream_kind(data):
+    s = data.get('stream')
+    if s in (True, 'sse', 'true', '1', 1):
+        return 'sse'
+    if s == 'chunked':
+        return 'chunked'
+    return None
+
+def _sse(obj):
+    return 'data: ' + json.dumps(obj) + '\n\n'
+
+def _stream_events(out, tokens, kind):
+    """Yield the text pieces of a streamed response (one per token, then the trailer)."""
+    for i, tok in enumerate(tokens):
+        yield _sse({'id': out['id'], 'index': i, 'token': tok}) if kind == 'sse' else tok
+    if kind == 'sse':
+        yield _sse({'id': out['id'], 'done': True, 'flagged': out['flagged'], 'meta': out['meta']})
+        yield 'data: [DONE]\n\n'
+
+def _health():
+    with _stats_lock:
+        stats = dict(_stats)
+    return {'status': 'ok', 'time': time.time(), 'mode': MODE, 'profile': PROFILE, **stats}
+
+# --- Flask (threaded dev server) -------------------------------------------------------------
+
+app = Flask(__name__)
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify(_health())
+
+@app.route('/v1/generate', methods=['POST'])
+def generate():
+    data = request.get_json(force=True) or {}
+    try:
+        out, tokens = build_response(data)
+        prof = resolve_profile(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    delays = schedule(len(tokens), prof)
+    kind = _stream_kind(data)
+    if kind is None:
+        _request_started()
+        try:
+            time.sleep(sum(delays))
+            return jsonify(out)
+        finally:
+            _request_done()
+
+    def gen():
+        # counted from the first iteration: a response that is never consumed never enters the body
+        _request_started()
+        try:
+            pieces = _stream_events(out, tokens, kind)
+            for d in delays:
+                if d:
+                    time.sleep(d)
+                yield next(pieces)
+            for piece in pieces:
+                yield piece
+        finally:
+            _request_done()
+    mimetype = 'text/event-stream' if kind == 'sse' else 'text/plain'
+    return Response(stream_with_context(gen()), mimetype=mimetype, headers={'Cache-Control': 'no-cache'})
+
+# --- ASGI (uvicorn, multi-worker) --------------------------------------------------------------
+
+async def _send_json(send, status, obj):
+    body = json.dumps(obj).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def asgi_app(scope, receive, send):
+    """Minimal ASGI app with the same routes as the Flask app; delays are non-blocking."""
+    if scope['type'] == 'lifespan':
+        while True:
+            msg = await receive()
+            if msg['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif msg['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    path, method = scope['path'], scope['method']
+    if path == '/health' and method == 'GET':
+        return await _send_json(send, 200, _health())
+    if path != '/v1/generate' or method != 'POST':
+        return await _send_json(send, 404, {'error': 'not found'})
+
+    chunks = []
+    while True:
+        msg = await receive()
+        chunks.append(msg.get('body', b''))
+        if not msg.get('more_body'):
+            break
+    try:
+        data = json.loads(b''.join(chunks) or b'{}') or {}
+    except ValueError:
+        return await _send_json(send, 400, {'error': 'invalid json'})
+
+    try:
+        out, tokens = build_response(data)
+        prof = resolve_profile(data)
+    except ValueError as e:
+        return await _send_json(send, 400, {'error': str(e)})
+    delays = schedule(len(tokens), prof)
+    kind = _stream_kind(data)
+    _request_started()
+    try:
+        if kind is None:
+            await asyncio.sleep(sum(delays))
+            return await _send_json(send, 200, out)
+        ctype = b'text/event-stream' if kind == 'sse' else b'text/plain; charset=utf-8'
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', ctype), (b'cache-control', b'no-cache')]})
+        pieces = _stream_events(out, tokens, kind)
+        for d in delays:
+            if d:
+                await asyncio.sleep(d)
+            await send({'type': 'http.response.body', 'body': next(pieces).encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': ''.join(pieces).encode('utf-8')})
+    finally:
+        _request_done()
+
+def main():
+    global MODE, PROFILE, _DEFAULT_PROFILE, _rng
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=("safe","vuln","noisy"), default=MODE)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=PROFILE)
+    parser.add_argument("--ttft_ms", type=float, default=None)
+    parser.add_argument("--tokens_per_s", type=float, default=None)
+    parser.add_argument("--jitter", type=float, default=None)
+    parser.add_argument("--tail_prob", type=float, default=None)
+    parser.add_argument("--tail_ms", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=None, help="seed jitter/tail RNG for reproducible runs")
+    parser.add_argument("--server", choices=("flask", "async"), default="flask")
+    parser.add_argument("--workers", type=int, default=1, help="async server worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    os.environ["THEFOOL_MOCK_MODE"] = args.mode
+    os.environ["THEFOOL_MOCK_PROFILE"] = args.profile
+    for key in ("ttft_ms", "tokens_per_s", "jitter", "tail_prob", "tail_ms"):
+        if getattr(args, key) is not None:
+            os.environ["THEFOOL_MOCK_" + key.upper()] = str(getattr(args, key))
+    if args.seed is not None:
+        os.environ["THEFOOL_MOCK_SEED"] = str(args.seed)
+
+    if args.server == "async":
+        import uvicorn
+        # workers re-import this module by name and read the settings back from the environment
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        uvicorn.run("mock_llm:asgi_app", host=args.host, port=args.port, workers=args.workers,
+                    log_level="warning", access_log=False)
+    else:
+        MODE, PROFILE = args.mode, args.profile
+        _DEFAULT_PROFILE = _env_profile()
+        if args.seed is not None:
+            _rng = random.Random(args.seed)
+        app.run(host=args.host, port=args.port, threaded=True)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    main()
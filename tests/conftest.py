@@ -0,0 +1,7 @@
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# unsupervised/ scripts import their siblings by bare name (they run as scripts from there)
+for p in (ROOT, os.path.join(ROOT, "unsupervised")):
+    if p not in sys.path:
+        sys.path.insert(0, p)
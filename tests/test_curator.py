@@ -0,0 +1,32 @@
+import json
+
+import curator
+
+BODY = "the lab notes describe how the scanner reached the staging host and what it reported back to the console"
+
+def _write_raw(path, texts):
+    with open(path, "w", encoding="utf-8") as fh:
+        for i, text in enumerate(texts):
+            fh.write(json.dumps({"id": f"r{i}-{hash(text) & 0xffff}", "source": "notes", "collected_at": "2026-01-01T00:00:00Z", "text": text}) + "\n")
+
+def _curate(tmp_path):
+    cur, rvw = tmp_path / "curated.jsonl", tmp_path / "review.jsonl"
+    curator.curate(str(tmp_path / "raw.jsonl"), str(cur), str(rvw),
+                   near_dup_index=str(tmp_path / "near.sqlite"), near_dup_report=str(tmp_path / "near.json"),
+                   cache_path=str(tmp_path / "cache.sqlite"))
+    return cur.read_text(encoding="utf-8").splitlines()
+
+def test_rerun_on_same_raw_gives_same_output(tmp_path):
+    _write_raw(tmp_path / "raw.jsonl", [f"note {i}: {BODY}" for i in range(5)] + ["an unrelated short entry"])
+    first = _curate(tmp_path)
+    second = _curate(tmp_path)
+    assert first
+    assert second == first
+
+def test_rerun_keeps_near_duplicate_of_record_no_longer_in_raw(tmp_path):
+    _write_raw(tmp_path / "raw.jsonl", [f"note 1: {BODY}"])
+    assert len(_curate(tmp_path)) == 1
+    # the earlier representative is gone from the raw data; its near-duplicate must now be kept
+    _write_raw(tmp_path / "raw.jsonl", [f"note 2: {BODY}"])
+    out = _curate(tmp_path)
+    assert len(out) == 1 and "note 2" in json.loads(out[0])["text"]
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import threading
+
+from mock_llm import mock_llm
+
+def _asgi_post(body):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': json.dumps(body).encode('utf-8')}
+
+    async def send(msg):
+        sent.append(msg)
+
+    asyncio.run(mock_llm.asgi_app({'type': 'http', 'path': '/v1/generate', 'method': 'POST'}, receive, send))
+    return sent[0]['status'], json.loads(sent[-1]['body'])
+
+def test_non_numeric_max_tokens_is_a_400():
+    client = mock_llm.app.test_client()
+    for key in ('max_new_tokens', 'max_tokens'):
+        resp = client.post('/v1/generate', json={'prompt': 'hi', key: 'many'})
+        assert resp.status_code == 400
+        assert _asgi_post({'prompt': 'hi', key: [3]})[0] == 400
+    resp = client.post('/v1/generate', json={'prompt': 'hi', 'max_new_tokens': '5'})
+    assert resp.status_code == 200 and resp.get_json()['meta']['tokens'] == 5
+    assert _asgi_post({'prompt': 'hi', 'max_tokens': 5})[1]['meta']['tokens'] == 5
+
+def test_stream_inflight_counter_is_balanced():
+    client = mock_llm.app.test_client()
+    before = dict(mock_llm._stats)
+    with mock_llm.app.test_request_context('/v1/generate', method='POST', json={'prompt': 'hi', 'stream': True}):
+        mock_llm.generate().close()     # client went away before the body was iterated
+    assert mock_llm._stats['inflight'] == before['inflight']
+    resp = client.post('/v1/generate', json={'prompt': 'hi', 'stream': True})
+    assert resp.get_data(as_text=True).endswith('data: [DONE]\n\n')
+    assert mock_llm._stats['inflight'] == before['inflight']
+
+def test_negative_or_non_finite_latency_overrides_are_a_400():
+    client = mock_llm.app.test_client()
+    for override in ({'ttft_ms': -50, 'jitter': 0}, {'tokens_per_s': 'nan'}, {'tail_ms': float('inf')},
+                     {'jitter': -1}, {'tail_prob': 'often'}):
+        body = dict({'prompt': 'hi'}, **override)
+        assert client.post('/v1/generate', data=json.dumps(body), content_type='application/json').status_code == 400
+        assert _asgi_post(body)[0] == 400
+    assert client.post('/v1/generate', json={'prompt': 'hi', 'ttft_ms': 0, 'jitter': 0.1}).status_code == 200
+
+def test_counters_are_consistent_under_concurrent_requests():
+    client = mock_llm.app.test_client()
+    served = mock_llm._stats['served']
+
+    def hammer():
+        for _ in range(50):
+            client.post('/v1/generate', json={'prompt': 'hi'})
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    health = client.get('/health').get_json()
+    assert health['served'] == served + 400 and health['inflight'] == 0
@@ -0,0 +1,30 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+from transformers import Trainer, TrainingArguments
+
+from packing import IdLists, PackedBlocks, PackedCollator
+
+class _TinyLM(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.emb = torch.nn.Embedding(32, 4)
+
+    def forward(self, input_ids=None, attention_mask=None, position_ids=None, labels=None):
+        return {"loss": self.emb(input_ids).sum() * 0}
+
+def test_doc_mask_batches_survive_the_trainer_collator_wrapping(tmp_path):
+    blocks = PackedBlocks(IdLists([[1, 2, 3], [4, 5], [6, 7, 8, 9, 10]]), 4, eos_id=0, doc_masks=True)
+    # same setting train_lora_trainer.py uses with --pack
+    args = TrainingArguments(output_dir=str(tmp_path), per_device_train_batch_size=2, report_to="none",
+                             remove_unused_columns=False)
+    trainer = Trainer(model=_TinyLM(), args=args, train_dataset=blocks, data_collator=PackedCollator(31, doc_masks=True))
+    rows = []
+    for batch in trainer.get_train_dataloader():
+        n, width = batch["input_ids"].shape
+        assert batch["attention_mask"].shape == (n, 1, width, width)
+        rows.extend(batch["position_ids"].tolist())
+    # block [4, 5, EOS, 6]: positions restart where the third document begins
+    assert [0, 1, 2, 0] in rows
+    assert len(rows) == len(blocks)
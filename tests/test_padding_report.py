@@ -0,0 +1,12 @@
+from packing import padding_report, format_report
+
+def test_untruncated_lengths_account_for_truncation_and_packing():
+    rep = padding_report([10, 3, 1], block_size=4, batch_size=1)
+    assert rep["truncate_pad"]["truncated_tokens"] == 6
+    assert rep["packed"]["real_tokens"] == 17 and rep["packed"]["sequences"] == 5
+
+def test_already_truncated_lengths_leave_the_unknowns_unset():
+    rep = padding_report([4, 3, 1], block_size=4, batch_size=1, truncated=True)
+    assert rep["truncate_pad"]["real_tokens"] == 8
+    assert rep["truncate_pad"]["truncated_tokens"] is None and rep["packed"] is None
+    assert "unknown" in format_report(rep)
@@ -0,0 +1,18 @@
+import tracemalloc
+
+from ai.profiling import RequestProfile, span
+
+def test_overlapping_memory_profiles_both_get_a_snapshot(tmp_path):
+    first = RequestProfile("first", "/a", memory=True, out_dir=str(tmp_path))
+    second = RequestProfile("second", "/b", memory=True, out_dir=str(tmp_path))
+    first.__enter__()
+    second.__enter__()
+    with span("work"):
+        blob = [bytes(64) for _ in range(100)]
+    # the request that started tracemalloc finishes first
+    first.__exit__(None, None, None)
+    assert tracemalloc.is_tracing()
+    second.__exit__(None, None, None)
+    assert not tracemalloc.is_tracing()
+    assert (tmp_path / "first.tracemalloc").exists() and (tmp_path / "second.tracemalloc").exists()
+    del blob
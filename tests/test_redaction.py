@@ -0,0 +1,25 @@
+import json
+import os
+
+import pytest
+
+from curator import redact, is_sensitive, RedactionScanner
+
+GOLDEN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      "unsupervised", "golden", "redaction_golden.jsonl")
+EXCERPT = 2000      # bench_redaction.py / curator review excerpt length
+
+def _golden():
+    with open(GOLDEN, "r", encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+ROWS = _golden()
+
+@pytest.mark.parametrize("row", ROWS, ids=range(len(ROWS)))
+def test_fused_scanner_matches_reference_passes(row):
+    text = row["text"]
+    sensitive = is_sensitive(text)
+    expected = redact(text[:EXCERPT]) if sensitive else redact(text)
+    assert (sensitive, expected) == (row["sensitive"], row["redacted"])
+    got_sensitive, got_redacted, _ = RedactionScanner(EXCERPT).scan(text)
+    assert (got_sensitive, got_redacted) == (sensitive, expected)
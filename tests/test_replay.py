@@ -0,0 +1,37 @@
+import json
+
+from tools.replay import load_audit, compare_recorded, text_digest
+
+def _write(path, events):
+    with open(path, "w", encoding="utf-8") as fh:
+        for ev in events:
+            fh.write(json.dumps(ev) + "\n")
+
+def test_interleaved_audit_events_pair_by_request_id(tmp_path):
+    long_prompt = "x" * 900
+    _write(tmp_path / "audit.jsonl", [
+        {"event": "generate.request", "request_id": "a", "ts": 1.0, "prompt_snippet": "first", "meta": {"prompt_len": 5}},
+        {"event": "generate.request", "request_id": "b", "ts": 1.1, "prompt_snippet": "second", "meta": {"prompt_len": 6}},
+        {"event": "generate.request", "request_id": "c", "ts": 1.2, "prompt_snippet": long_prompt[:800],
+         "meta": {"prompt_len": 900}},
+        {"event": "generate.request", "request_id": "d", "ts": 1.3, "prompt_snippet": "lost", "meta": {"prompt_len": 4}},
+        {"event": "generate.response", "request_id": "b", "text_snippet": "B", "elapsed_ms": 200.0},
+        {"event": "generate.blocked", "request_id": "c", "reason": "r", "elapsed_ms": 300.0},
+        {"event": "generate.response", "request_id": "a", "text_snippet": "A", "elapsed_ms": 100.0},
+    ])
+    a, b, c, d = load_audit(str(tmp_path / "audit.jsonl"))
+    assert (a["prompt"], a["recorded"]) == ("first", {"latency": 0.1, "digest": text_digest("A"), "blocked": False})
+    assert (b["prompt"], b["recorded"]) == ("second", {"latency": 0.2, "digest": text_digest("B"), "blocked": False})
+    assert c["recorded"] == {"latency": 0.3, "digest": None, "blocked": True} and c["prompt_truncated"]
+    assert d["recorded"] == {"latency": None, "digest": None, "blocked": None}
+
+def test_truncated_prompt_is_digest_unknown_not_a_mismatch(tmp_path):
+    _write(tmp_path / "audit.jsonl", [
+        {"event": "generate.request", "request_id": "a", "prompt_snippet": "p" * 800, "meta": {"prompt_len": 1200}},
+        {"event": "generate.response", "request_id": "a", "text_snippet": "full answer", "elapsed_ms": 50.0},
+    ])
+    records = load_audit(str(tmp_path / "audit.jsonl"))
+    records[0]["index"] = 0
+    results = [{"text_digest": text_digest("answer to the cut prompt"), "latency": 0.05, "error": None}]
+    cmp = compare_recorded(records, results)
+    assert (cmp["digest_match"], cmp["digest_mismatch"], cmp["digest_unknown"]) == (0, 0, 1)
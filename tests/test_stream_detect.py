@@ -0,0 +1,54 @@
+import io
+import json
+import random
+
+from tools.stream_detect import (Detector, PartitionedDetector, bench_lines, events_from_json, run, uri_of_line,
+                                 _events)
+
+def test_window_counts_match_a_brute_force_count():
+    rnd = random.Random(3)
+    det = Detector(window=10.0, buckets=10, beacon_count=10**9, long_bytes=10**9)
+    seen = {}
+    ts = 0.0
+    for _ in range(5000):
+        ts += rnd.expovariate(20.0) if rnd.random() < 0.95 else rnd.uniform(5, 30)
+        src = f"10.0.0.{rnd.randrange(40)}"
+        body = rnd.randrange(1000)
+        det.observe(ts, src, body)
+        seen.setdefault(src, []).append((ts // 1.0, body))
+        bucket = ts // 1.0
+        recent = [b for k, b in seen[src] if k > bucket - 10]
+        s = det.sources[src]
+        assert (s.count - s.floor, s.nbytes - s.floor_bytes) == (len(recent), sum(recent))
+
+def test_events_fast_path_and_fallback():
+    canonical = json.dumps({"ts": "1700000000.25", "src": "10.0.0.1", "dst": "10.0.0.2", "uri": '/a"b',
+                            "request_body_len": 900}) + "\n"
+    legacy = json.dumps({"ts": "$(date -u +%s)", "src": "10.0.0.3", "uri": "/v1/generate", "body_length": 2048}) + "\n"
+    numeric_ts = json.dumps({"ts": 1700000001.5, "src": "10.0.0.4", "uri": "/x", "request_body_len": 7})
+    events = _events([canonical, legacy, "not json\n", numeric_ts])
+    assert [(src, body) for _, src, body, _ in events] == [("10.0.0.1", 900), ("10.0.0.3", 2048), ("10.0.0.4", 7)]
+    assert (events[0][0], events[2][0]) == (1700000000.25, 1700000001.5)
+    assert [uri_of_line(line) for *_, line in events] == ['/a"b', "/v1/generate", "/x"]
+
+def test_partitioned_detector_raises_the_same_alerts():
+    lines = bench_lines([], n=20000, sources=300, rate=200.0, beacon_fraction=0.05, long_fraction=0.05, seed=2)
+    one = io.StringIO()
+    run(Detector(), events_from_json(lines), one, uri_of_line)
+    many = io.StringIO()
+    det = PartitionedDetector(3)
+    try:
+        run(det, events_from_json(lines), many, uri_of_line)
+        assert det.stats()["events"] == len(lines)
+    finally:
+        det.close()
+    assert one.getvalue() and sorted(many.getvalue().splitlines()) == sorted(one.getvalue().splitlines())
+
+def test_idle_source_starts_over_whether_or_not_swept():
+    det = Detector(idle_ttl=100.0, long_bytes=10**9)
+    for ts in range(20):
+        det.observe(float(ts), "10.0.0.1", 100)
+    det.next_sweep = float("inf")       # no sweep gets to it
+    det.observe(500.0, "10.0.0.1", 100)
+    s = det.sources["10.0.0.1"]
+    assert (s.count, s.count - s.floor, det.evicted) == (1, 1, 1)
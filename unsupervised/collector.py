@@ -1,10 +1,28 @@
 #!/usr/bin/env python3
 # Collect logs, reports, and AI history into a deduped raw JSONL dataset.
 # Designed for TheFool lab. Runs offline inside the lab.
+#
+# --incremental keeps a file-state manifest in unsupervised/storage: unchanged files
+# (same inode/size/mtime) are skipped without being read, append-only logs (Zeek,
+# Suricata) are read from the last offset, and only new records are appended.
+# --workers N reads and hashes files in a process pool with bounded streaming reads;
+# records are still written in discovery order.
+#
+# Zeek TSV/JSON and Suricata EVE logs are read event by event (structured_logs) and emitted
+# as one record per event, or per --window seconds, with the parsed fields attached;
+# --no-structured keeps the old one-record-per-file behaviour.
+#
+# --near-dup T drops records whose MinHash similarity to an already collected record is >= T
+# (near_dedupe; index and cluster report in unsupervised/storage).
 
-import os, glob, json, hashlib, argparse, time
+import os, glob, json, hashlib, argparse, time, codecs
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+from structured_logs import ZeekHeader, sniff_format, iter_records
+from near_dedupe import NearDuplicateIndex, reset_index
+
 DEFAULT_SOURCES = [
     "zeek/logs",           # Zeek outputs (http.log etc)
     "suricata/log",        # Suricata alerts (json/evt)
@@ -13,57 +31,360 @@ DEFAULT_SOURCES = [
     "mock_llm/logs"        # any mock-llm logs
 ]
 
+# sources whose files only ever grow; incremental mode reads them from the last offset
+APPEND_ONLY_SOURCES = ["zeek/logs", "suricata/log"]
+
 OUT_RAW = "unsupervised/dataset_raw.jsonl"
 META_DIR = "unsupervised/storage"
+STATE_FILE = os.path.join(META_DIR, "collector_state.json")
+EMITTED_FILE = os.path.join(META_DIR, "collector_emitted.txt")
+SPOOL_DIR = os.path.join(META_DIR, "spool")   # per-file record spools handed from workers to the writer
+NEAR_DUP_INDEX = os.path.join(META_DIR, "near_dup_collector.sqlite")
+NEAR_DUP_REPORT = os.path.join(META_DIR, "near_dup_collector_report.json")
+
+MAX_TEXT_CHARS = 2000000   # larger files are trimmed to a snippet
+SNIPPET_CHARS = 20000
+HEAD_BYTES = 4096          # prefix hashed to detect rotation/truncation of append-only logs
+SETTLE_SECONDS = 5         # append-only files untouched this long are treated as complete
+READ_CHUNK = 1 << 20       # bytes per read; text kept in memory never exceeds ~MAX_TEXT_CHARS
 
 def sha256_text(s: str) -> str:
     h = hashlib.sha256()
     h.update(s.encode("utf-8"))
     return h.hexdigest()
 
-def read_file_text(path):
-    try:
-        with open(path, "r", errors="ignore", encoding="utf-8") as fh:
-            return fh.read()
-    except Exception:
+def iter_source_files(paths):
+    for base in paths:
+        for p in glob.glob(os.path.join(base, "**/*"), recursive=True):
+            if os.path.isdir(p):
+                continue
+            yield base, p
+
+def make_payload(source, text, **extra):
+    """Build a raw record (or None for empty text); ids are the hash of the text, not the filename."""
+    if not text or len(text.strip()) == 0:
         return None
+    # Trim extremely large files (store metadata only)
+    if len(text) > MAX_TEXT_CHARS:
+        text_snippet = text[:SNIPPET_CHARS]
+    else:
+        text_snippet = text
+    payload = {
+        "source": source,
+        "collected_at": datetime.utcnow().isoformat() + "Z",
+        "text": text_snippet
+    }
+    payload.update(extra)
+    payload["id"] = sha256_text(payload["text"])
+    return payload
+
+def load_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return {"version": 1, "files": {}}
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+def save_state(state, path=STATE_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(state, fh)
+    os.replace(tmp, path)
+
+def load_emitted(path=EMITTED_FILE):
+    seen = set()
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    seen.add(line)
+    return seen
+
+def _is_append_only(base):
+    base = os.path.normpath(base)
+    return any(base == os.path.normpath(a) or base.startswith(os.path.normpath(a) + os.sep) for a in APPEND_ONLY_SOURCES)
+
+def _head_sha(fh, n):
+    fh.seek(0)
+    return hashlib.sha256(fh.read(n)).hexdigest()
+
+def read_text_bounded(path, start=0, end=None, hash_all=False):
+    """Stream bytes [start, end) of a file keeping at most ~MAX_TEXT_CHARS decoded characters.
+
+    Decoding matches a text-mode read (utf-8, errors ignored, universal newlines). Once the
+    text passes MAX_TEXT_CHARS only the snippet is kept and, unless hash_all, reading stops.
+    Returns (text, sha256 of all bytes in the range or None).
+    """
+    dec = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    h = hashlib.sha256() if hash_all else None
+    parts, nchars, over, cr = [], 0, False, ""
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            chunk = fh.read(READ_CHUNK if remaining is None else min(READ_CHUNK, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            if h is not None:
+                h.update(chunk)
+            if over:
+                continue
+            text = cr + dec.decode(chunk)
+            # hold back a trailing \r: it may be the first half of a \r\n split across chunks
+            cr = "\r" if text.endswith("\r") else ""
+            text = (text[:-1] if cr else text).replace("\r\n", "\n").replace("\r", "\n")
+            parts.append(text)
+            nchars += len(text)
+            if nchars > MAX_TEXT_CHARS:
+                over = True
+                parts = ["".join(parts)[:SNIPPET_CHARS]]
+                if h is None:
+                    break
+    if not over:
+        parts.append((cr + dec.decode(b"", final=True)).replace("\r", "\n"))
+    return "".join(parts), (h.hexdigest() if h is not None else None)
+
+def _complete_lines_end(fh, start, end):
+    """Offset just past the last newline in [start, end), or start if there is none."""
+    pos = end
+    while pos > start:
+        n = min(65536, pos - start)
+        fh.seek(pos - n)
+        block = fh.read(n)
+        i = block.rfind(b"\n")
+        if i >= 0:
+            return pos - n + i + 1
+        pos -= n
+    return start
+
+def spool_records(path, fmt, start=0, end=None, header=None, window=0.0, hasher=None):
+    """Write the records of a structured log to a spool file; returns its path.
+
+    Records go through disk rather than the result tuple so a worker never holds
+    more than one event in memory, however large the log.
+    """
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    spool = os.path.join(SPOOL_DIR, f"{hashlib.sha1(path.encode('utf-8')).hexdigest()}.{os.getpid()}.jsonl")
+    with open(spool, "w", encoding="utf-8") as out:
+        for rec in iter_records(path, fmt, start, end, header, window, hasher):
+            text = rec.pop("text")
+            payload = make_payload(path, text, **rec)
+            if payload is not None:
+                out.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    return spool
+
+def iter_payloads(result):
+    """Payloads of an ingest result: a single record, none, or a spool path (consumed and removed)."""
+    if result is None:
+        return
+    if isinstance(result, dict):
+        yield result
+        return
+    try:
+        with open(result, "r", encoding="utf-8") as fh:
+            for line in fh:
+                yield json.loads(line)
+    finally:
+        os.remove(result)
 
-def collect(paths):
+def ingest(task):
+    """Read one file (or the new tail of an append-only log) and build its record(s).
+
+    Pure function of its task so it can run in a worker process. Returns
+    (path, payload / spool path / None, new state entry or None, start offset).
+    """
+    path, prev, incremental, append_only, structured, window = task
+    try:
+        if not incremental:
+            fmt = sniff_format(path) if structured else None
+            if fmt:
+                return path, spool_records(path, fmt, header=ZeekHeader(), window=window), None, 0
+            text, _ = read_text_bounded(path)
+            return path, make_payload(path, text), None, 0
+        st = os.stat(path)
+        entry = {"inode": st.st_ino, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        with open(path, "rb") as fh:
+            head_len = min(HEAD_BYTES, st.st_size)
+            head = _head_sha(fh, head_len)
+            start = 0
+            if (append_only and prev and prev.get("inode") == st.st_ino and prev.get("offset", 0) <= st.st_size
+                    and prev.get("head_len", 0) <= st.st_size and _head_sha(fh, prev.get("head_len", 0)) == prev.get("head_sha256")):
+                start = prev["offset"]
+            end = st.st_size
+            if append_only and time.time() - st.st_mtime < SETTLE_SECONDS:
+                # never consume a partially written last line of a live log; it is picked up on the next run
+                end = _complete_lines_end(fh, start, end)
+        # a tailed log keeps the format (and Zeek column map) seen when it was first read
+        fmt = (prev.get("format") if start else sniff_format(path)) if structured else None
+        if fmt:
+            header = (ZeekHeader.from_dict(prev.get("zeek_header")) if start else None) or ZeekHeader()
+            h = hashlib.sha256()
+            result = spool_records(path, fmt, start, end, header, window, h)
+            seg_sha = h.hexdigest()
+            entry["format"] = fmt
+            if fmt == "zeek_tsv":
+                entry["zeek_header"] = header.to_dict()
+        else:
+            text, seg_sha = read_text_bounded(path, start, end, hash_all=True)
+            result = make_payload(path, text, offset=start) if start else make_payload(path, text)
+        if start:
+            # content hash of an append-only file is chained over the segments read so far
+            entry["sha256"] = hashlib.sha256((prev.get("sha256", "") + seg_sha).encode("ascii")).hexdigest()
+        else:
+            entry["sha256"] = seg_sha
+        entry.update(offset=end, head_len=head_len, head_sha256=head)
+        return path, result, entry, start
+    except OSError:
+        return path, None, None, 0
+
+def ordered_map(fn, tasks, workers=1):
+    """Map fn over tasks in a process pool, yielding results in input order.
+
+    At most workers * 4 tasks are in flight, so memory stays bounded even when
+    one slow file holds up the ordered writer.
+    """
+    if workers <= 1:
+        for t in tasks:
+            yield fn(t)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        window = deque()
+        for t in tasks:
+            window.append(pool.submit(fn, t))
+            if len(window) >= workers * 4:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+def _is_near_dup(near, payload):
+    return near is not None and near.check(payload["id"], payload["text"], payload["source"]) is not None
+
+def _close_near(near):
+    if near is not None:
+        rep = near.write_report(NEAR_DUP_REPORT)
+        near.close()
+        print(f"[collector] near-duplicates dropped: {rep['run']['near_duplicates']} "
+              f"({rep['clusters']} clusters) -> {NEAR_DUP_REPORT}")
+
+def collect(paths, incremental=False, workers=1, structured=True, window=0.0, near_dup=0.0, emit=None):
+    """Write OUT_RAW; emit(payload), if given, is called for every record written (pipeline.py)."""
     os.makedirs(os.path.dirname(OUT_RAW), exist_ok=True)
     os.makedirs(META_DIR, exist_ok=True)
-    seen = set()
-    count = 0
-    with open(OUT_RAW, "w", encoding="utf-8") as out:
-        for base in paths:
-            for p in glob.glob(os.path.join(base, "**/*"), recursive=True):
-                if os.path.isdir(p):
-                    continue
-                text = read_file_text(p)
-                if not text or len(text.strip()) == 0:
+    if not incremental:
+        return _collect_full(paths, workers, structured, window, near_dup, emit)
+
+    t0 = time.time()
+    if os.path.exists(OUT_RAW):
+        state = load_state()
+        if os.path.exists(EMITTED_FILE):
+            seen = load_emitted()
+        else:
+            # first incremental run over a fully collected dataset: adopt its ids
+            seen = {json.loads(line).get("id") for line in open(OUT_RAW, "r", encoding="utf-8") if line.strip()}
+            with open(EMITTED_FILE, "w", encoding="utf-8") as fh:
+                fh.writelines(sid + "\n" for sid in seen if sid)
+    else:
+        # dataset was removed (make clean): the manifest no longer describes it, start over
+        state, seen = {"version": 1, "files": {}}, set()
+        open(EMITTED_FILE, "w").close()
+    files = state.setdefault("files", {})
+    if not seen:
+        # nothing collected yet: an index left from an earlier dataset would drop records it never kept
+        reset_index(NEAR_DUP_INDEX)
+    near = NearDuplicateIndex(NEAR_DUP_INDEX, near_dup) if near_dup else None
+    count = tailed = 0
+    skipped = [0]
+    visited = set()
+
+    def tasks():
+        for base, p in iter_source_files(paths):
+            visited.add(p)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            prev = files.get(p)
+            if prev and prev["inode"] == st.st_ino and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+                skipped[0] += 1
+                continue
+            yield p, prev, True, _is_append_only(base), structured, window
+
+    with open(OUT_RAW, "a", encoding="utf-8") as out, open(EMITTED_FILE, "a", encoding="utf-8") as emitted:
+        for p, result, entry, start in ordered_map(ingest, tasks(), workers):
+            if entry is None:
+                continue
+            files[p] = entry
+            if start:
+                tailed += 1
+            for payload in iter_payloads(result):
+                if payload["id"] in seen:
                     continue
-                # Trim extremely large files (store metadata only)
-                if len(text) > 2000000:
-                    text_snippet = text[:20000]
-                else:
-                    text_snippet = text
-                payload = {
-                    "source": p,
-                    "collected_at": datetime.utcnow().isoformat() + "Z",
-                    "text": text_snippet
-                }
-                # dedupe by hash of text (not filename)
-                sid = sha256_text(payload["text"])
-                if sid in seen:
+                seen.add(payload["id"])
+                if _is_near_dup(near, payload):
                     continue
-                seen.add(sid)
-                payload["id"] = sid
                 out.write(json.dumps(payload, ensure_ascii=False) + "\n")
+                emitted.write(payload["id"] + "\n")
                 count += 1
+                if emit is not None:
+                    emit(payload)
+    # forget files that disappeared from the scanned sources
+    roots = tuple(os.path.join(b, "") for b in paths)
+    for p in [p for p in files if p.startswith(roots) and p not in visited]:
+        del files[p]
+    save_state(state)
+    _close_near(near)
+    print(f"[collector] incremental: {count} new items, {skipped[0]} unchanged files skipped, "
+          f"{tailed} logs tailed in {time.time() - t0:.2f}s -> {OUT_RAW}")
+    return OUT_RAW
+
+def _collect_full(paths, workers=1, structured=True, window=0.0, near_dup=0.0, emit=None):
+    # a full rewrite invalidates the incremental manifest; the next --incremental run re-seeds from OUT_RAW
+    for p in (STATE_FILE, EMITTED_FILE):
+        if os.path.exists(p):
+            os.remove(p)
+    reset_index(NEAR_DUP_INDEX)
+    near = NearDuplicateIndex(NEAR_DUP_INDEX, near_dup) if near_dup else None
+    seen = set()
+    count = 0
+    tasks = ((p, None, False, False, structured, window) for _, p in iter_source_files(paths))
+    # written aside and swapped in at the end: a failed or aborted run keeps the previous dataset
+    tmp = OUT_RAW + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as out:
+            for _, result, _, _ in ordered_map(ingest, tasks, workers):
+                for payload in iter_payloads(result):
+                    # dedupe by hash of text (not filename)
+                    if payload["id"] in seen:
+                        continue
+                    seen.add(payload["id"])
+                    if _is_near_dup(near, payload):
+                        continue
+                    out.write(json.dumps(payload, ensure_ascii=False) + "\n")
+                    count += 1
+                    if emit is not None:
+                        emit(payload)
+        os.replace(tmp, OUT_RAW)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    _close_near(near)
     print(f"[collector] collected {count} items -> {OUT_RAW}")
     return OUT_RAW
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--sources", nargs="*", help="list of source base dirs", default=DEFAULT_SOURCES)
+    parser.add_argument("--incremental", action="store_true",
+                        help="append only new data, using the file-state manifest in " + META_DIR)
+    parser.add_argument("--workers", type=int, default=1, help="ingestion processes (0 = one per CPU)")
+    parser.add_argument("--window", type=float, default=0.0,
+                        help="group structured log events into one record per N seconds (0 = one record per event)")
+    parser.add_argument("--no-structured", action="store_true",
+                        help="store Zeek/Suricata logs as whole-file text records like any other file")
+    parser.add_argument("--near-dup", type=float, default=0.0,
+                        help="drop records at least this similar (MinHash Jaccard, e.g. 0.85) to one already collected; 0 = off")
     args = parser.parse_args()
-    collect(args.sources)
+    collect(args.sources, incremental=args.incremental, workers=args.workers or os.cpu_count() or 1,
+            structured=not args.no_structured, window=args.window, near_dup=args.near_dup)
@@ -3,14 +3,26 @@
 # - PII redaction (emails, phones, IPs, API keys)
 # - Flagging of sensitive/exploit-like content (moved to human review)
 # - Basic dedupe retained from collector
+# - Near-duplicate collapsing (MinHash/LSH, near_dedupe) with a cluster report
+# - --workers N curates byte-range shards in parallel; parts are merged back in input order
+# - Redaction decisions are cached by (record id, rules version) in unsupervised/storage
 
-import re, json, os, argparse
+import re, json, os, argparse, hashlib, time, inspect, sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from typing import Dict
 
+from near_dedupe import NearDuplicateIndex, Signer, reset_index, sig_to_hex, sig_from_hex
+
 RAW = "unsupervised/dataset_raw.jsonl"
 CURATED = "unsupervised/curated.jsonl"
 REVIEW = "unsupervised/human_review.jsonl"
+NEAR_DUP_INDEX = "unsupervised/storage/near_dup_curator.sqlite"
+NEAR_DUP_REPORT = "unsupervised/storage/near_dup_curator_report.json"
+NEAR_DUP_THRESHOLD = 0.85
+SHARD_DIR = "unsupervised/storage/curate_shards"   # per-shard part files of a --workers run
+PROGRESS_EVERY = 100000
+CACHE_FILE = "unsupervised/storage/curate_cache.sqlite"
 
 # Patterns for redaction and sensitive content
 EMAIL_RE = re.compile(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+")
@@ -32,48 +44,401 @@ def redact(text: str) -> str:
 def is_sensitive(text: str) -> bool:
     return bool(SENSITIVE_RE.search(text))
 
-def curate(raw_path=RAW, curated_out=CURATED, review_out=REVIEW):
+# Literal/short prefilters: a redaction pass is skipped when the text lacks something every
+# match of its pattern contains ('@', "\d.\d", a keyword plus '\' (APIKEY_RE requires a literal
+# backslash after the separator), a 40-char base64 run).
+_SECRET_HINT_RE = re.compile(r"(?i)api_key|apikey|secret|token|passwd|password")
+_B64_HINT_RE = re.compile(r"[A-Za-z0-9+/]{40}")
+_IP_HINT_RE = re.compile(r"\d\.\d")
+# PHONE_RE matches start at '+', '(' or a digit and only span [\d+\-.\s()]; each such run with
+# at least 4 characters is matched on its own instead of trying PHONE_RE at every text position
+_PHONE_RUN_RE = re.compile(r"[\d+(][\d+\-.\s()]{3,}")
+# literal prefix of every SENSITIVE_RE alternative; for ASCII text, str.lower() agrees with
+# re.IGNORECASE, so SENSITIVE_RE can only match if one of these occurs in the lowered text
+_SENSITIVE_PREFIXES = ("reverse shell", "meterpreter", "nc -e", "bash -i", "chmod 777", "rm -rf /", "curl ", "wget ",
+                       "base64 -d", "exploit", "sqlmap", "payload", "rce", "ssh -i", "msfconsole")
+
+def _sensitive(text: str) -> bool:
+    if text.isascii():
+        low = text.lower()
+        if not any(p in low for p in _SENSITIVE_PREFIXES):
+            return False
+    return SENSITIVE_RE.search(text) is not None
+
+class RedactionScanner:
+    """Fused redaction + sensitivity scan, output-identical to redact()/is_sensitive().
+
+    The sensitivity check runs once on the raw text, behind a literal-prefix prefilter, and
+    decides how much is redacted (the review excerpt for sensitive records, the whole text
+    otherwise). Redaction classes keep redact()'s order, because a single alternation would
+    pick different leftmost matches (e.g. "12 34john@x.com"), but a class is only scanned for
+    when its prefilter hits.
+    """
+
+    def __init__(self, excerpt_chars: int = 2000):
+        self.excerpt_chars = excerpt_chars
+
+    def redact(self, text: str) -> str:
+        return self._redact(text, {})
+
+    def scan(self, text: str):
+        """Returns (sensitive, redacted text or review excerpt, {class: replacements})."""
+        sensitive = _sensitive(text)
+        counts: Dict[str, int] = {}
+        return sensitive, self._redact(text[:self.excerpt_chars] if sensitive else text, counts), counts
+
+    def _redact(self, t: str, counts: Dict[str, int]) -> str:
+        if "@" in t:
+            t, counts["email"] = EMAIL_RE.subn("[REDACTED_EMAIL]", t)
+        phones = [0]
+
+        def _phone_run(m):
+            s, n = PHONE_RE.subn("[REDACTED_PHONE]", m.group())
+            phones[0] += n
+            return s
+
+        t = _PHONE_RUN_RE.sub(_phone_run, t)
+        counts["phone"] = phones[0]
+        if _IP_HINT_RE.search(t):
+            t, counts["ip"] = IP_RE.subn("[REDACTED_IP]", t)
+        if "\\" in t and _SECRET_HINT_RE.search(t):
+            t, counts["secret"] = APIKEY_RE.subn("[REDACTED_SECRET]", t)
+        if _B64_HINT_RE.search(t):
+            t, counts["b64"] = BASE64_RE.subn("[REDACTED_B64]", t)
+        return t
+
+def rules_version() -> str:
+    """Hash of everything that decides a record's curation: the patterns and the scanner code
+    (prefilters, replacement tokens). Editing either invalidates the curation cache."""
+    h = hashlib.sha256()
+    for rx in (EMAIL_RE, PHONE_RE, IP_RE, APIKEY_RE, BASE64_RE, SENSITIVE_RE,
+               _SECRET_HINT_RE, _B64_HINT_RE, _IP_HINT_RE, _PHONE_RUN_RE):
+        h.update(f"{rx.pattern}\0{rx.flags}\0".encode("utf-8"))
+    h.update(repr(_SENSITIVE_PREFIXES).encode("utf-8"))
+    for fn in (_sensitive, RedactionScanner):
+        try:
+            h.update(inspect.getsource(fn).encode("utf-8"))
+        except (OSError, TypeError):
+            h.update(fn.__qualname__.encode("utf-8"))
+    return h.hexdigest()[:16]
+
+class CurationCache:
+    """Persistent (record id, rules version) -> (sensitive, redacted text) store in SQLite.
+
+    Record ids are content hashes from the collector, so a hit is always valid for the
+    current rules; entries written under other rules are dropped when the cache is opened.
+    """
+
+    def __init__(self, path=CACHE_FILE, readonly=False, commit_every=1000):
+        self.path = path
+        self.rules = rules_version()
+        self.hits = 0
+        self.misses = 0
+        self.commit_every = commit_every
+        self._pending = 0
+        if readonly:
+            self.db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS cache (id TEXT, rules TEXT, sensitive INTEGER, red TEXT, PRIMARY KEY (id, rules)) WITHOUT ROWID")
+        self.db.execute("DELETE FROM cache WHERE rules != ?", (self.rules,))
+        self.db.commit()
+
+    def get(self, rid):
+        row = self.db.execute("SELECT sensitive, red FROM cache WHERE id=? AND rules=?", (rid, self.rules)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bool(row[0]), row[1]
+
+    def put(self, rid, sensitive, red):
+        self.db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", (rid, self.rules, int(sensitive), red))
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.db.commit()
+            self._pending = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+def _scan_cached(scanner, cache, rid, text):
+    """(sensitive, redacted, hit): reuse the cached decision for rid or scan the text."""
+    if cache is not None:
+        hit = cache.get(rid)
+        if hit is not None:
+            return hit[0], hit[1], True
+    sensitive, red, _ = scanner.scan(text)
+    return sensitive, red, False
+
+def _record_id(obj, text):
+    return obj.get("id") or hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _render(obj, text, sensitive, red):
+    """(kind, output JSON line) for a scanned record; kind is 'curated' or 'review'."""
+    # short metadata
+    meta = {
+        "id": obj.get("id"),
+        "source": obj.get("source"),
+        "collected_at": obj.get("collected_at", datetime.utcnow().isoformat() + "Z")
+    }
+    # If sensitive, push to review queue (do not include in training)
+    if sensitive:
+        return "review", json.dumps({"meta": meta, "raw_excerpt": text[:2000], "flag": "sensitive", "curated_excerpt": red}, ensure_ascii=False)
+    # Otherwise write curated record
+    return "curated", json.dumps({"meta": meta, "text": red}, ensure_ascii=False)
+
+def _new_timing():
+    return {"decode": 0.0, "near_dup": 0.0, "scan": 0.0, "encode": 0.0, "write": 0.0}
+
+def _print_summary(count_in, count_cur, count_rev, count_near, timing, wall, cache_hits=None):
+    stages = " ".join(f"{k}={v:.2f}s" for k, v in timing.items())
+    print(f"[curator] in:{count_in} curated:{count_cur} review:{count_rev} near_dup:{count_near}"
+          + (f" cache_hits:{cache_hits}" if cache_hits is not None else ""))
+    print(f"[curator] timing: {stages} wall={wall:.2f}s")
+
+def open_run_index(path, threshold):
+    """Empty near-duplicate index for one run that rewrites the curated output (None if off)."""
+    if not threshold:
+        return None
+    reset_index(path)
+    return NearDuplicateIndex(path, threshold)
+
+def curate(raw_path=RAW, curated_out=CURATED, review_out=REVIEW, near_dup=NEAR_DUP_THRESHOLD,
+           near_dup_index=NEAR_DUP_INDEX, near_dup_report=NEAR_DUP_REPORT, workers=1, cache_path=CACHE_FILE):
     os.makedirs(os.path.dirname(curated_out) or ".", exist_ok=True)
     os.makedirs(os.path.dirname(review_out) or ".", exist_ok=True)
-    count_in = 0
-    count_cur = 0
-    count_rev = 0
-    with open(raw_path, "r", encoding="utf-8") as inf, \
-         open(curated_out, "w", encoding="utf-8") as cout, \
-         open(review_out, "w", encoding="utf-8") as rvw:
+    # curated.jsonl is rewritten from scratch, so the index must only hold this run's
+    # representatives: a stale one would collapse records onto text no longer in the output
+    near = open_run_index(near_dup_index, near_dup)
+    # unchanged records (same content id, same rules) reuse their earlier decision
+    cache = CurationCache(cache_path) if cache_path else None
+    if workers > 1:
+        _curate_parallel(raw_path, curated_out, review_out, near, workers, cache)
+    else:
+        _curate_serial(raw_path, curated_out, review_out, near, cache)
+    if cache is not None:
+        cache.close()
+    if near is not None:
+        rep = near.write_report(near_dup_report)
+        near.close()
+        print(f"[curator] near-duplicate clusters: {rep['clusters']} -> {near_dup_report}")
+    return curated_out, review_out
+
+def _new_counts():
+    return {"in": 0, "curated": 0, "review": 0, "near_dup": 0}
+
+def _iter_raw(raw_path, counts, timing):
+    t_start = time.perf_counter()
+    with open(raw_path, "r", encoding="utf-8") as inf:
         for line in inf:
+            counts["in"] += 1
+            if counts["in"] % PROGRESS_EVERY == 0:
+                print(f"[curator] {counts['in']} records ({time.perf_counter() - t_start:.1f}s)")
+            t0 = time.perf_counter()
+            try:
+                obj = json.loads(line)
+            except Exception:
+                continue
+            timing["decode"] += time.perf_counter() - t0
+            yield obj
+
+def curate_stream(objs, cout, rvw, near=None, cache=None, counts=None, timing=None):
+    """Curate decoded raw records into the open curated/review files, in order.
+
+    Yields the redacted text of every record written to the curated file, so a
+    downstream stage (pipeline.py tokenizer) can consume it without re-reading.
+    """
+    scanner = RedactionScanner()
+    counts = counts if counts is not None else _new_counts()
+    timing = timing if timing is not None else _new_timing()
+    for obj in objs:
+        t1 = time.perf_counter()
+        text = obj.get("text","")
+        if not text.strip():
+            continue
+        rid = _record_id(obj, text)
+        if near is not None:
+            dup = near.check(rid, text, obj.get("source"))
+            t0, t1 = t1, time.perf_counter()
+            timing["near_dup"] += t1 - t0
+            if dup is not None:
+                counts["near_dup"] += 1
+                continue
+        # redact + sensitivity in one scan (only the review excerpt is redacted for sensitive records)
+        sensitive, red, hit = _scan_cached(scanner, cache, rid, text)
+        if cache is not None and not hit:
+            cache.put(rid, sensitive, red)
+        t2 = time.perf_counter()
+        kind, out = _render(obj, text, sensitive, red)
+        t3 = time.perf_counter()
+        if kind == "review":
+            rvw.write(out + "\n")
+            counts["review"] += 1
+        else:
+            cout.write(out + "\n")
+            counts["curated"] += 1
+        timing["scan"] += t2 - t1
+        timing["encode"] += t3 - t2
+        timing["write"] += time.perf_counter() - t3
+        if kind == "curated":
+            yield red
+
+def _curate_serial(raw_path, curated_out, review_out, near, cache=None):
+    t_start = time.perf_counter()
+    timing = _new_timing()
+    counts = _new_counts()
+    with open(curated_out, "w", encoding="utf-8") as cout, open(review_out, "w", encoding="utf-8") as rvw:
+        for _ in curate_stream(_iter_raw(raw_path, counts, timing), cout, rvw, near, cache, counts, timing):
+            pass
+    _print_summary(counts["in"], counts["curated"], counts["review"], counts["near_dup"], timing,
+                   time.perf_counter() - t_start, cache.hits if cache is not None else None)
+
+def shard_ranges(path, n):
+    """Split a file into at most n byte ranges that start and end on line boundaries."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as fh:
+        for i in range(1, n):
+            pos = size * i // n
+            if pos <= bounds[-1]:
+                continue
+            # the line containing pos-1 belongs to the previous shard
+            fh.seek(pos - 1)
+            fh.readline()
+            pos = fh.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+def curate_shard(task):
+    """Curate bytes [start, end) of the raw file into a part file (worker process).
+
+    Part lines are "kind<TAB>cache miss<TAB>record id<TAB>signature hex<TAB>source json<TAB>output line";
+    near-duplicate decisions depend on record order, so they are left to the merge, which
+    only needs the MinHash signature computed here. Workers read the curation cache; new
+    decisions are written back by the merge (SQLite has a single writer).
+    """
+    raw_path, start, end, part_path, signer_args, cache_path = task
+    scanner = RedactionScanner()
+    signer = Signer(*signer_args) if signer_args else None
+    cache = CurationCache(cache_path, readonly=True) if cache_path else None
+    hits = 0
+    timing = _new_timing()
+    count_in = 0
+    with open(raw_path, "rb") as fh, open(part_path, "w", encoding="utf-8") as part:
+        fh.seek(start)
+        pos = start
+        while pos < end:
+            line = fh.readline()
+            if not line:
+                break
+            pos += len(line)
             count_in += 1
+            t0 = time.perf_counter()
             try:
                 obj = json.loads(line)
             except Exception:
                 continue
             text = obj.get("text","")
+            t1 = time.perf_counter()
+            timing["decode"] += t1 - t0
             if not text.strip():
                 continue
-            # redact
-            red = redact(text)
-            # short metadata
-            meta = {
-                "id": obj.get("id"),
-                "source": obj.get("source"),
-                "collected_at": obj.get("collected_at", datetime.utcnow().isoformat() + "Z")
-            }
-            # If sensitive, push to review queue (do not include in training)
-            if is_sensitive(text):
-                rvw.write(json.dumps({"meta": meta, "raw_excerpt": text[:2000], "flag": "sensitive", "curated_excerpt": redact(text[:2000])}, ensure_ascii=False) + "\n")
-                count_rev += 1
-                continue
-            # Otherwise write curated record
-            rec = {"meta": meta, "text": red}
-            cout.write(json.dumps(rec, ensure_ascii=False) + "\n")
-            count_cur += 1
-    print(f"[curator] in:{count_in} curated:{count_cur} review:{count_rev}")
-    return curated_out, review_out
+            rid, sig, src = _record_id(obj, text), "-", "null"
+            if signer is not None:
+                sig, src = sig_to_hex(signer(text)), json.dumps(obj.get("source"))
+                t0, t1 = t1, time.perf_counter()
+                timing["near_dup"] += t1 - t0
+            sensitive, red, hit = _scan_cached(scanner, cache, rid, text)
+            hits += hit
+            t2 = time.perf_counter()
+            kind, out = _render(obj, text, sensitive, red)
+            t3 = time.perf_counter()
+            part.write(f"{kind[0]}\t{'-' if hit else 'm'}\t{rid}\t{sig}\t{src}\t{out}\n")
+            timing["scan"] += t2 - t1
+            timing["encode"] += t3 - t2
+            timing["write"] += time.perf_counter() - t3
+    if cache is not None:
+        cache.close()
+    return part_path, count_in, timing, hits
+
+def _curate_parallel(raw_path, curated_out, review_out, near, workers, cache=None):
+    """Curate byte-range shards in a process pool and merge the parts in input order, so the
+    outputs are identical to a serial run. Stage timings are summed over workers (CPU time)."""
+    t_start = time.perf_counter()
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    ranges = shard_ranges(raw_path, workers * 4)
+    signer_args = near.signer_args if near is not None else None
+    cache_path = cache.path if cache is not None else None
+    if cache is not None:
+        cache.db.commit()   # workers open it read-only
+    tasks = [(raw_path, a, b, os.path.join(SHARD_DIR, f"part-{i:05d}.tsv"), signer_args, cache_path)
+             for i, (a, b) in enumerate(ranges)]
+    timing = _new_timing()
+    timing["merge"] = 0.0
+    count_in = 0
+    count_cur = 0
+    count_rev = 0
+    count_near = 0
+    count_hits = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+         open(curated_out, "w", encoding="utf-8") as cout, \
+         open(review_out, "w", encoding="utf-8") as rvw:
+        # map() yields in task order; parts of later shards wait on disk, not in memory
+        for i, (part_path, n_in, t, hits) in enumerate(pool.map(curate_shard, tasks)):
+            for k, v in t.items():
+                timing[k] += v
+            count_in += n_in
+            count_hits += hits
+            t0 = time.perf_counter()
+            t_near = 0.0
+            with open(part_path, "r", encoding="utf-8") as part:
+                for line in part:
+                    kind, miss, rid, sig, src, out = line.split("\t", 5)
+                    if cache is not None and miss == "m":
+                        rec = json.loads(out)
+                        cache.put(rid, kind == "r", rec["curated_excerpt"] if kind == "r" else rec["text"])
+                    if near is not None:
+                        t1 = time.perf_counter()
+                        dup = near.check(rid, None, json.loads(src), sig_from_hex(sig))
+                        t_near += time.perf_counter() - t1
+                        if dup is not None:
+                            count_near += 1
+                            continue
+                    if kind == "r":
+                        rvw.write(out)
+                        count_rev += 1
+                    else:
+                        cout.write(out)
+                        count_cur += 1
+            os.remove(part_path)
+            timing["near_dup"] += t_near
+            timing["merge"] += time.perf_counter() - t0 - t_near
+            print(f"[curator] shard {i + 1}/{len(tasks)} merged: {count_in} records ({time.perf_counter() - t_start:.1f}s)")
+    _print_summary(count_in, count_cur, count_rev, count_near, timing, time.perf_counter() - t_start,
+                   count_hits if cache is not None else None)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--raw", default=RAW)
     parser.add_argument("--curated", default=CURATED)
     parser.add_argument("--review", default=REVIEW)
+    parser.add_argument("--near-dup", type=float, default=NEAR_DUP_THRESHOLD,
+                        help="collapse records at least this similar (MinHash Jaccard) to an earlier one; 0 = off")
+    parser.add_argument("--near-dup-index", default=NEAR_DUP_INDEX)
+    parser.add_argument("--near-dup-report", default=NEAR_DUP_REPORT)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="curate byte-range shards in this many processes (0 = one per CPU); output order is unchanged")
+    parser.add_argument("--cache", default=CACHE_FILE, help="curation cache keyed by (record id, rules version)")
+    parser.add_argument("--no-cache", action="store_true", help="rescan every record")
     args = parser.parse_args()
-    curate(args.raw, args.curated, args.review)
+    curate(args.raw, args.curated, args.review, args.near_dup, args.near_dup_index, args.near_dup_report,
+           workers=args.workers or os.cpu_count() or 1, cache_path=None if args.no_cache else args.cache)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# Compare LoRA adapters across models/iteration_* on quality and speed.
+#
+# The base model is loaded once and each adapter is swapped in with peft's load_adapter /
+# set_adapter (then dropped again), so evaluating N iterations costs one model load. Per
+# adapter (and the bare base model):
+#   - perplexity on the held-out split of curated.jsonl (token_shards.in_holdout, the records
+#     train_lora_trainer.py leaves out), batched
+#   - greedy generation latency and new tokens/s on a fixed prompt set
+# Results are kept in unsupervised/storage/eval_report.json; an adapter whose weights and
+# eval settings are unchanged is not re-evaluated. manifest_tool.py copies the comparison
+# table into the snapshot manifest.
+#
+#   python3 unsupervised/eval_adapters.py --batch_size 8 --max-eval-records 500
+
+import os, json, math, glob, time, hashlib, argparse
+from datetime import datetime
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from peft import PeftModel
+
+from token_shards import HOLDOUT_FRACTION, in_holdout
+from manifest_tool import HashCache, hash_files
+from train_lora_trainer import cpu_threads
+
+BASE_MODEL = os.environ.get("THEFOOL_MODEL_ID", "mistralai/mistral-7b")
+CURATED_FILE = "unsupervised/curated.jsonl"
+MODELS_DIR = "models"
+REPORT = "unsupervised/storage/eval_report.json"
+
+# fixed prompts: lab-style questions the adapters are meant to answer
+PROMPTS = [
+    "Summarise this Zeek http.log entry: POST /v1/generate from 10.0.0.5 with a 48000 byte body.",
+    "What does a Suricata alert 'LLM long prompt' indicate?",
+    "List three signs of prompt injection in an HTTP request body.",
+    "Explain what a beacon pattern in conn.log looks like.",
+    "Write a one-line triage note for repeated 401 responses from one source.",
+    "Which fields of an EVE alert identify the flow?",
+    "How would you rate-limit an LLM endpoint behind nginx?",
+    "Describe a benign scan in two sentences.",
+]
+
+def adapter_dirs(models_dir):
+    return sorted(d for d in glob.glob(os.path.join(models_dir, "iteration_*"))
+                  if os.path.exists(os.path.join(d, "adapter_config.json")))
+
+def adapter_digest(path, cache=None):
+    """Hash of the adapter weights + config (what decides its outputs)."""
+    files = sorted(os.path.join(path, n) for n in os.listdir(path) if n.startswith("adapter_"))
+    digests = hash_files(files, cache)
+    h = hashlib.sha256()
+    for f in files:
+        h.update(os.path.basename(f).encode("utf-8"))
+        h.update(digests[f].encode("utf-8"))
+    return h.hexdigest()
+
+def heldout_texts(curated, fraction, limit):
+    out = []
+    with open(curated, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            text = json.loads(line).get("text") or ""
+            if text.strip() and in_holdout(text, fraction):
+                out.append(text)
+                if limit and len(out) >= limit:
+                    break
+    return out
+
+@torch.no_grad()
+def perplexity(model, tokenizer, texts, batch_size, block_size, device):
+    tokenizer.padding_side = "right"
+    nll, tokens = 0.0, 0
+    t0 = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        enc = tokenizer(texts[i:i + batch_size], truncation=True, max_length=block_size, padding=True,
+                        return_tensors="pt").to(device)
+        logits = model(**enc).logits[:, :-1].float()
+        target = enc["input_ids"][:, 1:].masked_fill(enc["attention_mask"][:, 1:] == 0, -100)
+        nll += torch.nn.functional.cross_entropy(logits.reshape(-1, logits.size(-1)), target.reshape(-1),
+                                                 ignore_index=-100, reduction="sum").item()
+        tokens += int((target != -100).sum())
+    dt = time.perf_counter() - t0
+    return {
+        "perplexity": round(math.exp(nll / tokens), 4) if tokens else None,
+        "eval_tokens": tokens,
+        "eval_tokens_per_s": round(tokens / dt, 1) if dt > 0 else None,
+    }
+
+@torch.no_grad()
+def generation(model, tokenizer, prompts, batch_size, max_new_tokens, device):
+    tokenizer.padding_side = "left"
+    latencies, new_tokens, total = [], 0, 0.0
+    for i in range(0, len(prompts), batch_size):
+        enc = tokenizer(prompts[i:i + batch_size], padding=True, return_tensors="pt").to(device)
+        t0 = time.perf_counter()
+        out = model.generate(**enc, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tokenizer.pad_token_id)
+        dt = time.perf_counter() - t0
+        gen = out[:, enc["input_ids"].shape[1]:]
+        new_tokens += int((gen != tokenizer.pad_token_id).sum())
+        total += dt
+        latencies.append(dt / gen.shape[0])
+    latencies.sort()
+    return {
+        "gen_latency_mean_s": round(sum(latencies) / len(latencies), 4) if latencies else None,
+        "gen_latency_p95_s": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 4) if latencies else None,
+        "gen_tokens_per_s": round(new_tokens / total, 1) if total > 0 else None,
+    }
+
+def evaluate(model, tokenizer, texts, args, device):
+    row = perplexity(model, tokenizer, texts, args.batch_size, args.block_size, device)
+    row.update(generation(model, tokenizer, PROMPTS, args.batch_size, args.max_new_tokens, device))
+    return row
+
+def load_report(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    return {"rows": []}
+
+def load_base(args):
+    device = "cuda" if torch.cuda.is_available() and args.profile != "cpu" else "cpu"
+    if device == "cuda":
+        model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float16, device_map="auto")
+    else:
+        torch.set_num_threads(args.threads or cpu_threads())
+        model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+    model.eval()
+    return model, device
+
+def comparison(rows):
+    """Best adapter on quality (lowest perplexity) and on speed (highest generation tokens/s)."""
+    scored = [r for r in rows if r["adapter"] != "base"]
+    by_ppl = [r for r in scored if r.get("perplexity") is not None]
+    by_speed = [r for r in scored if r.get("gen_tokens_per_s") is not None]
+    return {
+        "best_perplexity": min(by_ppl, key=lambda r: r["perplexity"])["adapter"] if by_ppl else None,
+        "fastest": max(by_speed, key=lambda r: r["gen_tokens_per_s"])["adapter"] if by_speed else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models_dir", default=MODELS_DIR)
+    parser.add_argument("--model", default=BASE_MODEL, help="base model the adapters were trained on")
+    parser.add_argument("--curated", default=CURATED_FILE)
+    parser.add_argument("--holdout", type=float, default=HOLDOUT_FRACTION, help="same as train_lora_trainer.py --holdout")
+    parser.add_argument("--max-eval-records", type=int, default=500)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--block_size", type=int, default=1024)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--profile", choices=["auto", "cpu"], default="auto")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--report", default=REPORT)
+    parser.add_argument("--force", action="store_true", help="re-evaluate adapters already in the report")
+    args = parser.parse_args()
+
+    texts = heldout_texts(args.curated, args.holdout, args.max_eval_records)
+    if not texts:
+        print(f"[eval] no held-out records in {args.curated} (holdout={args.holdout}); perplexity will be empty")
+    settings = {"model": args.model, "heldout_sha256": hashlib.sha256("\n".join(texts).encode("utf-8")).hexdigest(),
+                "block_size": args.block_size, "max_new_tokens": args.max_new_tokens,
+                "prompts_sha256": hashlib.sha256("\n".join(PROMPTS).encode("utf-8")).hexdigest()}
+    settings_key = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    report = load_report(args.report)
+    previous = {(r["adapter"], r.get("key")): r for r in report.get("rows", [])}
+    hashes = HashCache()
+    targets = [("base", None)] + [(d, adapter_digest(d, hashes)) for d in adapter_dirs(args.models_dir)]
+    hashes.close()
+    rows, todo = [], []
+    for name, digest in targets:
+        key = f"{settings_key}:{digest}" if digest else settings_key
+        row = None if args.force else previous.get((name, key))
+        if row is not None:
+            rows.append(row)
+        else:
+            todo.append((name, key))
+            rows.append({"adapter": name, "key": key})
+
+    if todo:
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        t0 = time.perf_counter()
+        base, device = load_base(args)
+        print(f"[eval] base model loaded on {device} in {time.perf_counter() - t0:.1f}s")
+        model = None
+        for name, key in todo:
+            t0 = time.perf_counter()
+            if name == "base":
+                # first in todo, so no LoRA layers have been injected into base yet
+                result = evaluate(base, tokenizer, texts, args, device)
+            else:
+                label = os.path.basename(name)
+                if model is None:
+                    model = PeftModel.from_pretrained(base, name, adapter_name=label)
+                else:
+                    model.load_adapter(name, adapter_name=label)
+                model.set_adapter(label)
+                model.eval()
+                result = evaluate(model, tokenizer, texts, args, device)
+                # keep one adapter resident at a time
+                if len(model.peft_config) > 1:
+                    for other in [a for a in model.peft_config if a != label]:
+                        model.delete_adapter(other)
+            row = dict(adapter=name, key=key, evaluated_at=datetime.utcnow().isoformat() + "Z",
+                       eval_seconds=round(time.perf_counter() - t0, 3), **result)
+            rows[[r["adapter"] for r in rows].index(name)] = row
+            print(f"[eval] {name}: ppl={row['perplexity']} gen={row['gen_tokens_per_s']} tok/s "
+                  f"latency={row['gen_latency_mean_s']}s ({row['eval_seconds']}s)")
+
+    report = {"generated_at": datetime.utcnow().isoformat() + "Z", "settings": settings,
+              "heldout_records": len(texts), "rows": rows, **comparison(rows)}
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"{'adapter':<28} {'ppl':>10} {'gen tok/s':>10} {'latency s':>10}")
+    for r in rows:
+        print(f"{r['adapter']:<28} {str(r.get('perplexity')):>10} {str(r.get('gen_tokens_per_s')):>10} "
+              f"{str(r.get('gen_latency_mean_s')):>10}")
+    print(f"[eval] best perplexity: {report['best_perplexity']}  fastest: {report['fastest']}  -> {args.report}")
+
+if __name__ == "__main__":
+    main()
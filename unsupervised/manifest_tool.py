@@ -1,23 +1,189 @@
 #!/usr/bin/env python3
 # Create manifest for latest iteration and snapshot dataset + model checksums.
+#
+# Model directories are hashed by content as a Merkle tree (file leaves, one node per
+# directory), so any change to any adapter/checkpoint byte changes the iteration's dir_hash.
+# File digests are cached in SQLite keyed by (path, inode, size, mtime_ns), and a whole
+# iteration's tree is reused when its file listing is unchanged, so re-snapshotting only
+# reads files that are new or were rewritten. Cache misses are hashed in a thread pool
+# (hashlib releases the GIL on large buffers; big files are mmapped).
 
-import os, json, hashlib, glob, argparse, subprocess
+import os, json, mmap, time, sqlite3, hashlib, glob, argparse, subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+HASH_CACHE = "unsupervised/storage/hash_cache.sqlite"
+READ_BUFFER = 4 << 20        # buffered reads below MMAP_MIN, in chunks of this size
+MMAP_MIN = 64 << 20          # files at least this large are hashed through mmap
+HASH_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
 def sha256_file(path):
     h = hashlib.sha256()
-    with open(path, "rb") as fh:
-        for chunk in iter(lambda: fh.read(8192), b""):
-            h.update(chunk)
+    with open(path, "rb", buffering=0) as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if size >= MMAP_MIN:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for off in range(0, size, READ_BUFFER):
+                    h.update(mm[off:off + READ_BUFFER])
+            return h.hexdigest()
+        buf = bytearray(READ_BUFFER)
+        view = memoryview(buf)
+        while True:
+            n = fh.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
     return h.hexdigest()
 
-def build_manifest(models_dir="models", dataset="unsupervised/curated.jsonl", out="unsupervised/manifests"):
+class HashCache:
+    """Persistent path -> sha256 store, valid while (inode, size, mtime_ns) are unchanged,
+    plus per-directory Merkle trees keyed by a signature of the directory's file listing."""
+
+    def __init__(self, path=HASH_CACHE):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, ino INTEGER, size INTEGER, mtime_ns INTEGER, sha256 TEXT);
+            CREATE TABLE IF NOT EXISTS trees (path TEXT PRIMARY KEY, sig TEXT, tree TEXT);
+        """)
+
+    def get(self, path, st):
+        row = self.db.execute("SELECT ino, size, mtime_ns, sha256 FROM files WHERE path=?", (path,)).fetchone()
+        if row is not None and tuple(row[:3]) == (st.st_ino, st.st_size, st.st_mtime_ns):
+            self.hits += 1
+            return row[3]
+        self.misses += 1
+        return None
+
+    def put(self, path, st, digest):
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                        (path, st.st_ino, st.st_size, st.st_mtime_ns, digest))
+
+    def get_tree(self, path, sig):
+        row = self.db.execute("SELECT sig, tree FROM trees WHERE path=?", (path,)).fetchone()
+        return json.loads(row[1]) if row is not None and row[0] == sig else None
+
+    def put_tree(self, path, sig, tree):
+        self.db.execute("INSERT OR REPLACE INTO trees VALUES (?, ?, ?)", (path, sig, json.dumps(tree)))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+def hash_files(paths, cache, workers=HASH_WORKERS):
+    """{path: sha256} for existing files, hashing cache misses in a thread pool."""
+    out, todo = {}, []
+    for p in paths:
+        st = os.stat(p)
+        digest = cache.get(p, st) if cache is not None else None
+        if digest is None:
+            todo.append((p, st))
+        else:
+            out[p] = digest
+    if todo:
+        # largest first so one big checkpoint does not start last
+        todo.sort(key=lambda t: -t[1].st_size)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for (p, st), digest in zip(todo, pool.map(lambda t: sha256_file(t[0]), todo)):
+                out[p] = digest
+                if cache is not None:
+                    cache.put(p, st, digest)
+    return out
+
+def _listing(root):
+    """[(relative path, stat)] of every regular file under root, sorted by relative path."""
+    out = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            if os.path.isfile(full):
+                out.append((os.path.relpath(full, root).replace(os.sep, "/"), os.stat(full)))
+    out.sort(key=lambda t: t[0])
+    return out
+
+def merkle_root(files):
+    """Root of the tree over {relative path: sha256}. A directory node hashes its sorted
+    "kind name digest" lines, so renames, moves and content changes all change the root.
+    Returns (root, {top-level subdirectory: its node hash})."""
+    tree = {}
+    for rel, digest in files.items():
+        node = tree
+        parts = rel.split("/")
+        for d in parts[:-1]:
+            node = node.setdefault(d, {})
+        node[parts[-1]] = digest
+
+    def node_hash(node):
+        h = hashlib.sha256()
+        for name in sorted(node):
+            child = node[name]
+            if isinstance(child, dict):
+                h.update(f"dir {name} {node_hash(child)}\n".encode("utf-8"))
+            else:
+                h.update(f"file {name} {child}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    subtrees = {name: node_hash(child) for name, child in sorted(tree.items()) if isinstance(child, dict)}
+    return node_hash(tree), subtrees
+
+def hash_tree(root, cache, workers=HASH_WORKERS):
+    """{"root", "subtrees", "files", "bytes", "reused"} for a directory; unchanged directories
+    are answered from the cached tree without opening any file."""
+    listing = _listing(root)
+    sig = hashlib.sha256("\n".join(f"{rel} {st.st_ino} {st.st_size} {st.st_mtime_ns}"
+                                     for rel, st in listing).encode("utf-8")).hexdigest()
+    cached = cache.get_tree(root, sig) if cache is not None else None
+    if cached is not None:
+        return dict(cached, reused=True)
+    digests = hash_files([os.path.join(root, rel) for rel, _ in listing], cache, workers)
+    files = {rel: digests[os.path.join(root, rel)] for rel, _ in listing}
+    top, subtrees = merkle_root(files)
+    tree = {"root": top, "subtrees": subtrees, "files": files, "bytes": sum(st.st_size for _, st in listing)}
+    if cache is not None:
+        cache.put_tree(root, sig, tree)
+    return dict(tree, reused=False)
+
+EVAL_REPORT = "unsupervised/storage/eval_report.json"
+
+def load_evaluation(path):
+    """Comparison table written by eval_adapters.py, or None if it has not been run."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as fh:
+        rep = json.load(fh)
+    cols = ["adapter", "perplexity", "eval_tokens", "eval_tokens_per_s", "gen_latency_mean_s", "gen_latency_p95_s",
+            "gen_tokens_per_s", "evaluated_at"]
+    return {
+        "report": path,
+        "generated_at": rep.get("generated_at"),
+        "settings": rep.get("settings"),
+        "heldout_records": rep.get("heldout_records"),
+        "best_perplexity": rep.get("best_perplexity"),
+        "fastest": rep.get("fastest"),
+        "table": [{c: r.get(c) for c in cols} for r in rep.get("rows", [])],
+    }
+
+def build_manifest(models_dir="models", dataset="unsupervised/curated.jsonl", out="unsupervised/manifests",
+                   eval_report=EVAL_REPORT, cache_path=HASH_CACHE, workers=HASH_WORKERS):
+    t0 = time.perf_counter()
     os.makedirs(out, exist_ok=True)
+    cache = HashCache(cache_path) if cache_path else None
     # find latest iteration
-    iterations = sorted([d for d in glob.glob(os.path.join(models_dir,"iteration_*"))])
+    iterations = sorted([d for d in glob.glob(os.path.join(models_dir,"iteration_*")) if os.path.isdir(d)])
     manifest = {"generated_at": datetime.utcnow().isoformat()+"Z", "dataset": None, "models": []}
     if dataset and os.path.exists(dataset):
-        manifest["dataset"] = {"path": dataset, "sha256": sha256_file(dataset)}
+        manifest["dataset"] = {"path": dataset, "sha256": hash_files([dataset], cache, workers)[dataset]}
+    evaluation = load_evaluation(eval_report)
+    if evaluation is not None:
+        manifest["evaluation"] = evaluation
+    eval_rows = {r["adapter"]: r for r in evaluation["table"]} if evaluation else {}
+    reused = 0
     for it in iterations:
         m = {"path": it}
         mf = os.path.join(it, "manifest.json")
@@ -25,16 +191,21 @@ def build_manifest(models_dir="models", dataset="unsupervised/curated.jsonl", ou
             with open(mf, "r", encoding="utf-8") as fh:
                 data = json.load(fh)
             m.update(data)
-            # compute model dir hash (hash of files list)
-            files = sorted(glob.glob(os.path.join(it, "**/*"), recursive=True))
-            # compute combined hash
-            hh = hashlib.sha256()
-            for f in files:
-                if os.path.isfile(f):
-                    hh.update(f.encode("utf-8"))
-                    hh.update(str(os.path.getsize(f)).encode("utf-8"))
-            m["dir_hash"] = hh.hexdigest()
+        # content hash of the whole iteration directory (Merkle root over every file)
+        tree = hash_tree(it, cache, workers)
+        reused += tree["reused"]
+        m["dir_hash"] = tree["root"]
+        m["dir_hash_kind"] = "merkle-sha256"
+        m["subtrees"] = tree["subtrees"]
+        m["files"] = tree["files"]
+        m["bytes"] = tree["bytes"]
+        if it in eval_rows:
+            m["eval"] = eval_rows[it]
         manifest["models"].append(m)
+    if cache is not None:
+        print(f"[manifest] hashed in {time.perf_counter() - t0:.2f}s: {reused}/{len(iterations)} iterations unchanged, "
+              f"{cache.hits} file digests cached, {cache.misses} computed")
+        cache.close()
     outfile = os.path.join(out, f"manifest_{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.json")
     with open(outfile, "w", encoding="utf-8") as fh:
         json.dump(manifest, fh, indent=2)
@@ -57,9 +228,14 @@ if __name__ == "__main__":
     parser.add_argument("--models_dir", default="models")
     parser.add_argument("--dataset", default="unsupervised/curated.jsonl")
     parser.add_argument("--out", default="unsupervised/manifests")
+    parser.add_argument("--eval", default=EVAL_REPORT, help="eval_adapters.py report to include (comparison table)")
+    parser.add_argument("--hash-cache", default=HASH_CACHE, help="file digest cache keyed by (path, inode, size, mtime_ns)")
+    parser.add_argument("--no-hash-cache", action="store_true", help="hash every file again")
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS, help="hashing threads")
     parser.add_argument("--sign", action="store_true")
     parser.add_argument("--gpg_key", default=None)
     args = parser.parse_args()
-    mf = build_manifest(args.models_dir, args.dataset, args.out)
+    mf = build_manifest(args.models_dir, args.dataset, args.out, args.eval,
+                        cache_path=None if args.no_hash_cache else args.hash_cache, workers=args.workers)
     if args.sign:
         sign_manifest(mf, args.gpg_key)
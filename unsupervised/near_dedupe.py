@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# Near-duplicate detection for the unsupervised pipeline: MinHash signatures over word
+# shingles of normalised text (numbers, IPs and hex ids masked, so log lines that differ
+# only in timestamps/addresses collide) and a banded LSH index kept in SQLite, so the
+# index survives across runs and memory stays bounded regardless of dataset size.
+# numpy is used for signatures when installed; the pure-Python path gives identical results.
+#
+#   python3 unsupervised/near_dedupe.py --index unsupervised/storage/near_dup_curator.sqlite --report out.json
+
+import os, re, json, zlib, sqlite3, hashlib, argparse, random
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # optional
+    np = None
+
+MERSENNE = (1 << 61) - 1
+MAX_SHINGLES = 5000        # long texts are signed on their first MAX_SHINGLES shingles
+NORMALIZE_VERSION = 1      # bump when normalise() changes; stored indexes are rebuilt
+
+_IP_RE = re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b|\b[0-9a-fA-F:]*:[0-9a-fA-F:]+:[0-9a-fA-F]*\b")
+_HEX_RE = re.compile(r"\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}\b")
+_NUM_RE = re.compile(r"\d+")
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def normalise(text):
+    t = text.lower()
+    t = _IP_RE.sub(" <ip> ", t)
+    t = _HEX_RE.sub(" <hex> ", t)
+    return _NUM_RE.sub("0", t)
+
+def shingles(text, k=3):
+    """crc32 of word k-grams of the normalised text (a single shingle for very short texts)."""
+    toks = _TOKEN_RE.findall(normalise(text))
+    if len(toks) <= k:
+        return {zlib.crc32(" ".join(toks).encode("utf-8"))}
+    out = set()
+    for i in range(min(len(toks) - k + 1, MAX_SHINGLES)):
+        out.add(zlib.crc32(" ".join(toks[i:i + k]).encode("utf-8")))
+    return out
+
+def lsh_params(threshold, num_perm):
+    """(bands, rows) with bands*rows <= num_perm whose S-curve midpoint is closest to threshold."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        mid = (1.0 / bands) ** (1.0 / rows)
+        err = abs(mid - threshold)
+        if best is None or err < best[0]:
+            best = (err, bands, rows)
+    return best[1], best[2]
+
+class MinHasher:
+    def __init__(self, num_perm=128, seed=1):
+        rnd = random.Random(seed)
+        self.num_perm = num_perm
+        self.a = [rnd.randrange(1, 1 << 32) for _ in range(num_perm)]
+        self.b = [rnd.randrange(0, 1 << 32) for _ in range(num_perm)]
+        if np is not None:
+            self._a = np.array(self.a, dtype=np.uint64)[:, None]
+            self._b = np.array(self.b, dtype=np.uint64)[:, None]
+
+    def signature(self, hashes):
+        """List of num_perm 32-bit minimum hash values ((a*x + b) mod 2^61-1, low 32 bits)."""
+        if np is not None:
+            x = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))[None, :]
+            return [int(v) for v in (((self._a * x + self._b) % MERSENNE) & 0xFFFFFFFF).min(axis=1)]
+        return [min(((a * x + b) % MERSENNE) & 0xFFFFFFFF for x in hashes) for a, b in zip(self.a, self.b)]
+
+class Signer:
+    """Picklable text -> signature function matching a NearDuplicateIndex's parameters."""
+
+    def __init__(self, num_perm=128, seed=1, shingle=3):
+        self.hasher = MinHasher(num_perm, seed)
+        self.shingle = shingle
+
+    def __call__(self, text):
+        return self.hasher.signature(shingles(text, self.shingle))
+
+def _pack(sig):
+    return b"".join(v.to_bytes(4, "little") for v in sig)
+
+def _unpack(blob):
+    return [int.from_bytes(blob[i:i + 4], "little") for i in range(0, len(blob), 4)]
+
+def sig_to_hex(sig):
+    return _pack(sig).hex()
+
+def sig_from_hex(h):
+    return _unpack(bytes.fromhex(h))
+
+def similarity(s1, s2):
+    return sum(1 for x, y in zip(s1, s2) if x == y) / len(s1)
+
+class NearDuplicateIndex:
+    """Persistent LSH index. check() returns (representative id, similarity) for a near-duplicate,
+    or None after registering the record as a new representative. Re-checking a known id returns
+    the earlier decision, so re-running a stage over the same data is idempotent."""
+
+    def __init__(self, path, threshold=0.85, num_perm=128, shingle=3, seed=1, commit_every=1000):
+        """threshold=None reopens an existing index with the parameters it was built with."""
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self.db.execute("SELECT value FROM meta WHERE key='params'").fetchone()
+        stored = json.loads(row[0]) if row else None
+        if threshold is None:
+            if stored is None:
+                raise ValueError(f"{path} holds no near-duplicate index")
+            threshold, num_perm, shingle, seed = stored["threshold"], stored["num_perm"], stored["shingle"], stored["seed"]
+        self.threshold = threshold
+        self.shingle = shingle
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.hasher = MinHasher(num_perm, seed)
+        self.signer_args = (num_perm, seed, shingle)   # for computing signatures in worker processes
+        self.commit_every = commit_every
+        self.stats = {"checked": 0, "near_duplicates": 0, "representatives": 0}
+        params = {"threshold": threshold, "num_perm": num_perm, "seed": seed, "shingle": shingle,
+                  "bands": self.bands, "rows": self.rows, "normalize": NORMALIZE_VERSION}
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS reps (id TEXT PRIMARY KEY, source TEXT, sig BLOB);
+            CREATE TABLE IF NOT EXISTS buckets (band INTEGER, key INTEGER, rep TEXT, PRIMARY KEY (band, key, rep)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS dups (id TEXT PRIMARY KEY, rep TEXT, source TEXT, similarity REAL);
+            CREATE INDEX IF NOT EXISTS dups_rep ON dups (rep);
+        """)
+        if stored != params:
+            # signatures/bands built with other parameters cannot be compared; start a fresh index
+            self.db.executescript("DELETE FROM reps; DELETE FROM buckets; DELETE FROM dups;")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('params', ?)", (json.dumps(params),))
+        self.db.commit()
+        self._pending = 0
+
+    def _band_keys(self, sig):
+        for band in range(self.bands):
+            chunk = _pack(sig[band * self.rows:(band + 1) * self.rows])
+            yield band, int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little", signed=True)
+
+    def check(self, rid, text, source=None, sig=None):
+        """sig: signature precomputed with Signer(*self.signer_args) (text may then be None)."""
+        self.stats["checked"] += 1
+        row = self.db.execute("SELECT rep, similarity FROM dups WHERE id=?", (rid,)).fetchone()
+        if row is not None:
+            self.stats["near_duplicates"] += 1
+            return row[0], row[1]
+        if self.db.execute("SELECT 1 FROM reps WHERE id=?", (rid,)).fetchone() is not None:
+            return None
+        if sig is None:
+            sig = self.hasher.signature(shingles(text, self.shingle))
+        keys = list(self._band_keys(sig))
+        cands = set()
+        for band, key in keys:
+            cands.update(r for (r,) in self.db.execute("SELECT rep FROM buckets WHERE band=? AND key=?", (band, key)))
+        best = None
+        # sorted: ties between equally similar representatives must not depend on set order
+        for rep in sorted(cands):
+            s = similarity(sig, _unpack(self.db.execute("SELECT sig FROM reps WHERE id=?", (rep,)).fetchone()[0]))
+            if s >= self.threshold and (best is None or s > best[1]):
+                best = (rep, s)
+        if best is not None:
+            self.db.execute("INSERT OR REPLACE INTO dups VALUES (?, ?, ?, ?)", (rid, best[0], source, best[1]))
+            self.stats["near_duplicates"] += 1
+        else:
+            self.db.execute("INSERT OR REPLACE INTO reps VALUES (?, ?, ?)", (rid, source, _pack(sig)))
+            self.db.executemany("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)", [(b, k, rid) for b, k in keys])
+            self.stats["representatives"] += 1
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.db.commit()
+            self._pending = 0
+        return best
+
+    def report(self, top=100, members=20):
+        """Clusters of collapsed records, largest first (computed in SQLite, not in memory)."""
+        self.db.commit()
+        clusters = []
+        q = "SELECT rep, COUNT(*), AVG(similarity), MIN(similarity) FROM dups GROUP BY rep ORDER BY COUNT(*) DESC LIMIT ?"
+        for rep, n, avg, low in self.db.execute(q, (top,)).fetchall():
+            src = self.db.execute("SELECT source FROM reps WHERE id=?", (rep,)).fetchone()
+            clusters.append({
+                "representative": rep,
+                "source": src[0] if src else None,
+                "collapsed": n,
+                "similarity_avg": round(avg, 4),
+                "similarity_min": round(low, 4),
+                "members": [{"id": i, "source": s, "similarity": round(sim, 4)} for i, s, sim in self.db.execute(
+                    "SELECT id, source, similarity FROM dups WHERE rep=? ORDER BY similarity LIMIT ?", (rep, members))],
+            })
+        total_dups, total_clusters = self.db.execute("SELECT COUNT(*), COUNT(DISTINCT rep) FROM dups").fetchone()
+        return {
+            "generated_at": datetime.utcnow().isoformat() + "Z",
+            "index": self.path,
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "rows": self.rows,
+            "run": dict(self.stats),
+            "representatives": self.db.execute("SELECT COUNT(*) FROM reps").fetchone()[0],
+            "collapsed_records": total_dups,
+            "clusters": total_clusters,
+            "top_clusters": clusters,
+        }
+
+    def write_report(self, path, top=100):
+        rep = self.report(top)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(rep, fh, indent=2)
+        return rep
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+def reset_index(path):
+    for p in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(p):
+            os.remove(p)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="print the cluster report of an existing near-duplicate index")
+    parser.add_argument("--index", required=True)
+    parser.add_argument("--top", type=int, default=100)
+    parser.add_argument("--report", default=None, help="write the report here instead of stdout")
+    args = parser.parse_args()
+    idx = NearDuplicateIndex(args.index, threshold=None)
+    if args.report:
+        idx.write_report(args.report, args.top)
+        print("[near-dedupe] wrote", args.report)
+    else:
+        print(json.dumps(idx.report(args.top), indent=2))
+    idx.close()
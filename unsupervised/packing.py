@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# Sequence packing for LoRA training: documents are concatenated with an EOS after each one
+# and cut into full block_size blocks, instead of truncating every record to block_size and
+# padding it to the longest record of its batch. Long logs keep their tail and short reports
+# no longer waste most of a block on padding.
+#
+# With doc_masks the collator also builds a block-diagonal causal attention mask and resets
+# position ids at document boundaries, so a document never attends to the one packed before
+# it. That mask is 4D (batch, 1, L, L): it needs a model whose attention accepts custom 4D
+# masks (Llama/Mistral family in recent transformers).
+
+import math, bisect
+from array import array
+
+class IdLists:
+    """In-memory token id lists (e.g. a tokenized datasets column) in the shape PackedBlocks reads."""
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def record(self, i):
+        return self.ids[i]
+
+class PackedBlocks:
+    """Map-style dataset of packed blocks over `docs` (token_shards.TokenShards or anything
+    with __len__ and record(i) -> sequence of token ids). Only the block offsets are kept in
+    memory; block contents are sliced from the documents on access. The last block may be short."""
+
+    def __init__(self, docs, block_size, eos_id, doc_masks=False):
+        self.docs = docs
+        self.block_size = block_size
+        self.eos_id = eos_id
+        self.doc_masks = doc_masks
+        # starts[i]: position of document i in the EOS-joined stream
+        self.starts = array("Q", [0])
+        for i in range(len(docs)):
+            self.starts.append(self.starts[-1] + len(docs.record(i)) + 1)
+        self.total = self.starts[-1]
+
+    def __len__(self):
+        return math.ceil(self.total / self.block_size)
+
+    def __getitem__(self, b):
+        if b < 0:
+            b += len(self)
+        if not 0 <= b < len(self):
+            raise IndexError(b)
+        lo = b * self.block_size
+        hi = min(lo + self.block_size, self.total)
+        d = bisect.bisect_right(self.starts, lo) - 1
+        ids, segments = [], []
+        pos = lo
+        while pos < hi:
+            doc = self.docs.record(d)
+            start = self.starts[d]
+            a = pos - start
+            e = min(hi - start, len(doc) + 1)
+            segments.append(len(ids))
+            ids.extend(doc[a:min(e, len(doc))])
+            if e == len(doc) + 1:
+                ids.append(self.eos_id)
+            pos = start + e
+            d += 1
+        item = {"input_ids": ids}
+        if self.doc_masks:
+            # offsets in the block where a document (or the continuation of one) begins
+            item["segments"] = segments
+        return item
+
+class PackedCollator:
+    """Stack packed blocks into a batch: labels are the inputs (the model shifts them), the
+    short last block is padded and masked out of the loss. With doc_masks, attention and
+    position ids are restricted to each document and the first token after a boundary is
+    not used as a target of the previous document's EOS."""
+
+    def __init__(self, pad_id, doc_masks=False):
+        self.pad_id = pad_id
+        self.doc_masks = doc_masks
+
+    def __call__(self, features):
+        import torch
+        width = max(len(f["input_ids"]) for f in features)
+        n = len(features)
+        input_ids = torch.full((n, width), self.pad_id, dtype=torch.long)
+        labels = torch.full((n, width), -100, dtype=torch.long)
+        attention = torch.zeros((n, width), dtype=torch.long)
+        for i, f in enumerate(features):
+            ids = torch.tensor(f["input_ids"], dtype=torch.long)
+            input_ids[i, :len(ids)] = ids
+            labels[i, :len(ids)] = ids
+            attention[i, :len(ids)] = 1
+        batch = {"input_ids": input_ids, "labels": labels, "attention_mask": attention}
+        if not self.doc_masks:
+            return batch
+        seg = torch.full((n, width), -1, dtype=torch.long)
+        positions = torch.zeros((n, width), dtype=torch.long)
+        for i, f in enumerate(features):
+            bounds = list(f["segments"]) + [len(f["input_ids"])]
+            for k, (a, e) in enumerate(zip(bounds[:-1], bounds[1:])):
+                seg[i, a:e] = k
+                positions[i, a:e] = torch.arange(e - a)
+                if a > 0:
+                    labels[i, a] = -100
+        causal = torch.tril(torch.ones((width, width), dtype=torch.bool))
+        allowed = (seg[:, :, None] == seg[:, None, :]) & causal & (seg >= 0)[:, :, None]
+        mask = torch.zeros((n, 1, width, width), dtype=torch.float32)
+        batch["attention_mask"] = mask.masked_fill(~allowed[:, None], torch.finfo(torch.float32).min)
+        batch["position_ids"] = positions
+        return batch
+
+def _batched_slots(lengths, batch_size):
+    """Token slots used when consecutive sequences are batched and padded to the batch's longest."""
+    slots = 0
+    for i in range(0, len(lengths), batch_size):
+        chunk = lengths[i:i + batch_size]
+        slots += len(chunk) * max(chunk)
+    return slots
+
+def padding_report(lengths, block_size, batch_size, truncated=False):
+    """Token accounting for one epoch: truncate-and-pad (the old behaviour, per-batch dynamic
+    padding and fixed padding to block_size) against packing. `lengths` are untruncated
+    document lengths in tokens; efficiency = real tokens / token slots computed. With
+    truncated=True the lengths were already cut to block_size (truncate-mode token cache), so
+    the truncated token count and the packed figures are unknown and reported as None."""
+    lengths = list(lengths)
+    kept = [min(n, block_size) for n in lengths]
+    real_trunc = sum(kept)
+    dyn_slots = _batched_slots(kept, batch_size) if kept else 0
+    total = sum(n + 1 for n in lengths)
+    blocks = math.ceil(total / block_size) if total else 0
+    block_lengths = [block_size] * (total // block_size) + ([total % block_size] if total % block_size else [])
+    packed_slots = _batched_slots(block_lengths, batch_size) if block_lengths else 0
+    rep = {
+        "documents": len(lengths),
+        "block_size": block_size,
+        "truncate_pad": {
+            "sequences": len(lengths),
+            "real_tokens": real_trunc,
+            "truncated_tokens": sum(lengths) - real_trunc,
+            "slots_dynamic_padding": dyn_slots,
+            "efficiency_dynamic_padding": round(real_trunc / dyn_slots, 4) if dyn_slots else None,
+            "efficiency_pad_to_block": round(real_trunc / (len(lengths) * block_size), 4) if lengths else None,
+        },
+        "packed": {
+            "sequences": blocks,
+            "real_tokens": total,
+            "truncated_tokens": 0,
+            "slots": packed_slots,
+            "efficiency": round(total / packed_slots, 4) if packed_slots else None,
+        },
+    }
+    if truncated:
+        rep["truncate_pad"]["truncated_tokens"] = None
+        rep["packed"] = None
+    return rep
+
+def format_report(rep):
+    t, p = rep["truncate_pad"], rep["packed"]
+    line = (f"[train] padding: truncate+pad {t['sequences']} seqs, efficiency {t['efficiency_dynamic_padding']} "
+            f"(pad-to-{rep['block_size']} {t['efficiency_pad_to_block']}), ")
+    if p is None:
+        return line + "truncated tokens and packed estimate unknown (cached ids are truncated; see --pack)"
+    return line + (f"{t['truncated_tokens']} tokens truncated; "
+                   f"packed {p['sequences']} blocks, efficiency {p['efficiency']}, nothing truncated")
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# Streaming collect -> curate -> tokenize runner (make pipeline).
+#
+# The three stages run concurrently, connected by bounded queues, instead of one after the
+# other through JSONL files: the collector hands each record to the curator as it is written
+# to dataset_raw.jsonl, and the curator hands each curated text to the tokenizer as it is
+# written to curated.jsonl. DVC-tracked outputs are still produced, each written once:
+#   unsupervised/dataset_raw.jsonl, unsupervised/curated.jsonl, unsupervised/human_review.jsonl
+# and the token ids land in the tokenization cache (token_shards.py) under the key
+# train_lora_trainer.py looks up, so training starts without tokenizing.
+#
+# Stages are threads: collector workers are processes and fast tokenizers release the GIL,
+# so the iteration takes about as long as its slowest stage. The run report shows, per stage,
+# busy time, time starved waiting for input and time blocked on a full output queue
+# (backpressure from the stage after it).
+#
+# dataset_raw.jsonl (full collection), curated.jsonl and human_review.jsonl are written to
+# temporary files and replace the previous outputs only when their stage completes. A
+# tokenize failure (unknown model id, no network) does not stop collection and curation:
+# their outputs are still written and the run exits non-zero with tokenize reported failed.
+#
+#   python3 unsupervised/pipeline.py --model gpt2 --collect-workers 4
+
+import os, sys, json, time, queue, hashlib, argparse, threading
+from collections import defaultdict
+
+import collector
+from curator import (CURATED, REVIEW, NEAR_DUP_THRESHOLD, NEAR_DUP_INDEX, NEAR_DUP_REPORT, CACHE_FILE,
+                     CurationCache, curate_stream, open_run_index)
+from token_shards import CACHE_ROOT, HOLDOUT_FRACTION, ShardWriter, tokenizer_fingerprint, tokenize_settings, tokenize_into, cache_key
+
+BASE_MODEL = os.environ.get("THEFOOL_MODEL_ID", "mistralai/mistral-7b")
+REPORT = "unsupervised/storage/pipeline_report.json"
+QUEUE_SIZE = 1024
+TOKENIZE_BATCH = 1000
+
+class _Aborted(Exception):
+    pass
+
+_END = object()
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.wait_in = 0.0
+        self.wait_out = 0.0
+        self.t0 = self.t1 = None
+
+    def report(self):
+        wall = (self.t1 or time.perf_counter()) - (self.t0 or time.perf_counter())
+        busy = max(0.0, wall - self.wait_in - self.wait_out)
+        return {
+            "stage": self.name,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "wall_s": round(wall, 3),
+            "busy_s": round(busy, 3),
+            "starved_s": round(self.wait_in, 3),
+            "backpressured_s": round(self.wait_out, 3),
+            "items_per_s": round(self.items_out / busy, 1) if busy > 0 else None,
+        }
+
+class Pipe:
+    """Bounded queue between two stages; each side's blocking time is charged to its stats."""
+
+    def __init__(self, maxsize, abort):
+        self.q = queue.Queue(maxsize)
+        self.abort = abort
+        self.dropped = False
+
+    def drop(self):
+        """The consumer is gone: from now on put() discards items instead of blocking."""
+        self.dropped = True
+
+    def put(self, item, stats):
+        t0 = time.perf_counter()
+        while True:
+            if self.dropped:
+                return
+            try:
+                self.q.put(item, timeout=0.2)
+                break
+            except queue.Full:
+                if self.abort.is_set():
+                    raise _Aborted()
+        stats.wait_out += time.perf_counter() - t0
+        stats.items_out += 1
+
+    def close(self):
+        while not (self.abort.is_set() or self.dropped):
+            try:
+                self.q.put(_END, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+    def consume(self, stats):
+        while True:
+            t0 = time.perf_counter()
+            while True:
+                try:
+                    item = self.q.get(timeout=0.2)
+                    break
+                except queue.Empty:
+                    if self.abort.is_set():
+                        raise _Aborted()
+            stats.wait_in += time.perf_counter() - t0
+            if item is _END:
+                return
+            stats.items_in += 1
+            yield item
+
+class HashingWriter:
+    """Text file writer that also hashes what it writes (sha256 of the file's bytes). It writes
+    to a temporary file that replaces `path` on commit(); close() without commit() discards it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp = path + ".tmp"
+        self.fh = open(self.tmp, "w", encoding="utf-8")
+        self.h = hashlib.sha256()
+
+    def write(self, s):
+        self.h.update(s.encode("utf-8"))
+        return self.fh.write(s)
+
+    def hexdigest(self):
+        return self.h.hexdigest()
+
+    def commit(self):
+        self.fh.close()
+        os.replace(self.tmp, self.path)
+
+    def close(self):
+        self.fh.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+def _run_stage(stats, fn, out, errors, on_error):
+    stats.t0 = time.perf_counter()
+    try:
+        fn()
+    except _Aborted:
+        pass
+    except BaseException as e:
+        errors.append((stats.name, e))
+        on_error()
+    finally:
+        stats.t1 = time.perf_counter()
+        if out is not None:
+            out.close()
+
+def run(args):
+    abort = threading.Event()
+    errors = []
+    s_collect, s_curate, s_tok = StageStats("collect"), StageStats("curate"), StageStats("tokenize")
+    raw_pipe = Pipe(args.queue_size, abort)
+    tok_pipe = Pipe(args.queue_size, abort) if args.tokenize else None
+    curate_counts, curate_timing = defaultdict(int), defaultdict(float)
+    curated_sha = {}
+
+    def collect_stage():
+        if args.incremental and os.path.exists(collector.OUT_RAW):
+            # curated.jsonl is rebuilt from the whole raw dataset: replay what is already there
+            with open(collector.OUT_RAW, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    if line.strip():
+                        raw_pipe.put(json.loads(line), s_collect)
+        collector.collect(args.sources, incremental=args.incremental, workers=args.collect_workers,
+                          structured=not args.no_structured, window=args.window, near_dup=args.collect_near_dup,
+                          emit=lambda payload: raw_pipe.put(payload, s_collect))
+
+    def curate_stage():
+        near = open_run_index(args.near_dup_index, args.near_dup)
+        cache = None if args.no_cache else CurationCache(args.cache)
+        cout, rvw = HashingWriter(args.curated), HashingWriter(args.review)
+        try:
+            for red in curate_stream(raw_pipe.consume(s_curate), cout, rvw, near, cache, curate_counts, curate_timing):
+                if tok_pipe is not None:
+                    tok_pipe.put(red, s_curate)
+                else:
+                    s_curate.items_out += 1
+            cout.commit()
+            rvw.commit()
+        finally:
+            cout.close()
+            rvw.close()
+            if cache is not None:
+                cache.close()
+            if near is not None:
+                near.write_report(args.near_dup_report)
+                near.close()
+        curated_sha["sha256"] = cout.hexdigest()
+
+    def tokenize_stage():
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+        settings = tokenize_settings(args.block_size, args.pack, args.holdout)
+        os.makedirs(args.token_cache, exist_ok=True)
+        writer = ShardWriter(args.token_cache, len(tokenizer), {"model": args.model, "dataset": args.curated,
+                                                                "settings": settings})
+        try:
+            tokenize_into(writer, tokenizer, tok_pipe.consume(s_tok), settings, args.tokenize_batch)
+        except BaseException:
+            writer.abort()
+            raise
+        s_tok.items_out = writer.records
+        if abort.is_set() or "sha256" not in curated_sha:
+            writer.abort()
+            return
+        writer.meta["dataset_sha256"] = curated_sha["sha256"]
+        writer.close(cache_key(curated_sha["sha256"], tokenizer_fingerprint(tokenizer), settings))
+
+    # collect or curate failing aborts every stage; tokenize failing only cuts the pipe feeding
+    # it, so curation still runs to the end and its outputs are written
+    stages = [(s_collect, collect_stage, raw_pipe, abort.set), (s_curate, curate_stage, tok_pipe, abort.set)]
+    if tok_pipe is not None:
+        stages.append((s_tok, tokenize_stage, None, tok_pipe.drop))
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=_run_stage, args=(st, fn, out, errors, on_error), name=st.name, daemon=True)
+               for st, fn, out, on_error in stages]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    for name, e in errors:
+        print(f"[pipeline] stage {name} failed: {e!r}", file=sys.stderr)
+    per_stage = [st.report() for st, _, _, _ in stages]
+    bottleneck = max(per_stage, key=lambda r: r["busy_s"])["stage"]
+    report = {
+        "wall_s": round(wall, 3),
+        "sum_of_stages_busy_s": round(sum(r["busy_s"] for r in per_stage), 3),
+        "bottleneck": bottleneck,
+        "stages": per_stage,
+        "curate": {"counts": dict(curate_counts, **{"in": s_curate.items_in}), "timing_s": {k: round(v, 3) for k, v in curate_timing.items()}},
+        "failed": [name for name, _ in errors],
+    }
+    for r in per_stage:
+        print(f"[pipeline] {r['stage']:<9} in={r['items_in']:<8} out={r['items_out']:<8} busy={r['busy_s']:.2f}s "
+              f"starved={r['starved_s']:.2f}s backpressured={r['backpressured_s']:.2f}s rate={r['items_per_s']}/s")
+    print(f"[pipeline] wall={wall:.2f}s (stages busy total {report['sum_of_stages_busy_s']:.2f}s) bottleneck={bottleneck}")
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sources", nargs="*", default=collector.DEFAULT_SOURCES)
+    parser.add_argument("--incremental", action="store_true", help="collect incrementally (see collector.py)")
+    parser.add_argument("--collect-workers", type=int, default=1, help="collector ingestion processes (0 = one per CPU)")
+    parser.add_argument("--window", type=float, default=0.0)
+    parser.add_argument("--no-structured", action="store_true")
+    parser.add_argument("--collect-near-dup", type=float, default=0.0)
+    parser.add_argument("--curated", default=CURATED)
+    parser.add_argument("--review", default=REVIEW)
+    parser.add_argument("--near-dup", type=float, default=NEAR_DUP_THRESHOLD)
+    parser.add_argument("--near-dup-index", default=NEAR_DUP_INDEX)
+    parser.add_argument("--near-dup-report", default=NEAR_DUP_REPORT)
+    parser.add_argument("--cache", default=CACHE_FILE)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--no-tokenize", dest="tokenize", action="store_false", help="stop after curation")
+    parser.add_argument("--model", default=BASE_MODEL, help="tokenizer to use (same as train_lora_trainer.py --model)")
+    parser.add_argument("--block_size", type=int, default=1024)
+    parser.add_argument("--pack", action="store_true", help="store untruncated ids for train_lora_trainer.py --pack")
+    parser.add_argument("--holdout", type=float, default=HOLDOUT_FRACTION, help="same as train_lora_trainer.py --holdout")
+    parser.add_argument("--tokenize-batch", type=int, default=TOKENIZE_BATCH)
+    parser.add_argument("--token-cache", default=CACHE_ROOT)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--report", default=REPORT)
+    args = parser.parse_args()
+    args.collect_workers = args.collect_workers or os.cpu_count() or 1
+    sys.exit(run(args))
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# Format-aware readers for structured lab logs: Zeek TSV (#fields/#types header), Zeek JSON
+# and Suricata EVE JSON. Each reader streams one event at a time (constant memory) and
+# yields typed fields plus a compact text rendering used as the training sample.
+
+import json, re
+from datetime import datetime
+
+SNIPPET_CHARS = 20000      # cap on a single rendered record / window
+SNIFF_BYTES = 65536
+
+_ZEEK_ESC_RE = re.compile(r"\\x([0-9a-fA-F]{2})")
+
+# column layout of the headerless http.log written by the lab's older Zeek setup
+# (same positions tools/zeek_to_json.parse_zeek_http_line relies on)
+LEGACY_HTTP_FIELDS = ["ts", "uid", "id.orig_h", "id.orig_p", "id.resp_h", "id.resp_p", "trans_depth", "method",
+                      "host", "uri", "referrer", "version", "request_body_len", "response_body_len", "status_code"]
+LEGACY_HTTP_TYPES = ["time", "string", "addr", "port", "addr", "port", "count", "string",
+                     "string", "string", "string", "string", "count", "count", "count"]
+LEGACY_MIN_FIELDS = 14
+
+def _unescape(v):
+    return _ZEEK_ESC_RE.sub(lambda m: chr(int(m.group(1), 16)), v) if "\\x" in v else v
+
+def _looks_legacy_http(line):
+    parts = line.split("\t")
+    if len(parts) < LEGACY_MIN_FIELDS:
+        return False
+    try:
+        float(parts[0])
+    except ValueError:
+        return False
+    return True
+
+def sniff_format(path):
+    """Return 'zeek_tsv', 'zeek_json', 'suricata_eve' or None (treat as an opaque text file)."""
+    try:
+        with open(path, "rb") as fh:
+            head = fh.read(SNIFF_BYTES)
+    except OSError:
+        return None
+    if head.startswith(b"#separator"):
+        return "zeek_tsv"
+    for raw in head.split(b"\n"):
+        raw = raw.strip()
+        if not raw:
+            continue
+        line = raw.decode("utf-8", errors="ignore")
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            return "zeek_tsv" if _looks_legacy_http(line) else None
+        if not isinstance(obj, dict):
+            return None
+        if "event_type" in obj:
+            return "suricata_eve"
+        if "ts" in obj and ("uid" in obj or "id.orig_h" in obj or "_path" in obj):
+            return "zeek_json"
+        return None
+    return None
+
+class ZeekHeader:
+    """Column map built from a Zeek ASCII log header."""
+
+    def __init__(self, separator="\t", set_separator=",", empty_field="(empty)", unset_field="-",
+                 path="", fields=None, types=None, legacy=False):
+        self.separator = separator
+        self.set_separator = set_separator
+        self.empty_field = empty_field
+        self.unset_field = unset_field
+        self.path = path
+        self.fields = list(fields or [])
+        self.types = list(types or [])
+        self.legacy = legacy
+
+    def to_dict(self):
+        return {"separator": self.separator, "set_separator": self.set_separator, "empty_field": self.empty_field,
+                "unset_field": self.unset_field, "path": self.path, "fields": self.fields, "types": self.types,
+                "legacy": self.legacy}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d) if d else None
+
+    def feed(self, line):
+        """Consume a '#' header line; returns True if it was one."""
+        if not line.startswith("#"):
+            return False
+        if line.startswith("#separator"):
+            self.separator = _unescape(line.split(" ", 1)[1]) if " " in line else "\t"
+            return True
+        key, _, rest = line[1:].partition(self.separator)
+        if key == "set_separator":
+            self.set_separator = rest
+        elif key == "empty_field":
+            self.empty_field = rest
+        elif key == "unset_field":
+            self.unset_field = rest
+        elif key == "path":
+            self.path = rest
+        elif key == "fields":
+            self.fields = rest.split(self.separator)
+        elif key == "types":
+            self.types = rest.split(self.separator)
+        return True
+
+    def convert(self, value, ztype):
+        if value == self.unset_field:
+            return None
+        if ztype.startswith(("set[", "vector[")):
+            if value == self.empty_field:
+                return []
+            inner = ztype[ztype.index("[") + 1:-1]
+            return [self.convert(v, inner) for v in value.split(self.set_separator)]
+        if value == self.empty_field:
+            return ""
+        try:
+            if ztype in ("count", "int", "port"):
+                return int(value)
+            if ztype in ("time", "interval", "double"):
+                return float(value)
+            if ztype == "bool":
+                return value == "T"
+        except ValueError:
+            return _unescape(value)
+        return _unescape(value)
+
+    def adopt_legacy(self, line):
+        """Fall back to the positional http.log layout when a file has no #fields header."""
+        if _looks_legacy_http(line):
+            self.path, self.fields, self.types, self.legacy = "http", LEGACY_HTTP_FIELDS, LEGACY_HTTP_TYPES, True
+
+    def parse(self, line):
+        parts = line.split(self.separator)
+        if self.legacy:
+            if len(parts) < LEGACY_MIN_FIELDS:
+                return None
+            parts = (parts + [self.unset_field] * len(self.fields))[:len(self.fields)]
+        elif not self.fields or len(parts) != len(self.fields):
+            return None
+        types = self.types if len(self.types) == len(self.fields) else ["string"] * len(self.fields)
+        return {f: self.convert(v, t) for f, v, t in zip(self.fields, parts, types)}
+
+def _flatten(obj, prefix=""):
+    for k, v in obj.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            yield from _flatten(v, key + ".")
+        else:
+            yield key, v
+
+def render_event(fmt, log, fields):
+    """Compact 'key=value' rendering of an event, skipping unset/empty values."""
+    kind = "suricata" if fmt == "suricata_eve" else "zeek"
+    parts = [kind, log or "-"]
+    for k, v in _flatten(fields):
+        if v is None or v == "" or v == []:
+            continue
+        if isinstance(v, list):
+            v = ",".join(str(x) for x in v)
+        parts.append(f"{k}={v}")
+    return " ".join(parts)[:SNIPPET_CHARS]
+
+def _event_ts(fmt, fields):
+    ts = fields.get("timestamp") if fmt == "suricata_eve" else fields.get("ts")
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    if isinstance(ts, str):
+        try:
+            return float(ts)
+        except ValueError:
+            pass
+        # Suricata: 2020-09-13T12:26:40.000000+0000
+        for parse in (lambda v: datetime.strptime(v, "%Y-%m-%dT%H:%M:%S.%f%z"), datetime.fromisoformat):
+            try:
+                return parse(ts).timestamp()
+            except ValueError:
+                continue
+        return ts
+    return None
+
+def _iter_lines(fh, start, end, hasher=None):
+    fh.seek(start)
+    pos = start
+    for raw in fh:
+        if end is not None and pos >= end:
+            break
+        if end is not None and pos + len(raw) > end:
+            raw = raw[:end - pos]
+        pos += len(raw)
+        if hasher is not None:
+            hasher.update(raw)
+        yield raw.decode("utf-8", errors="ignore").rstrip("\r\n")
+
+def iter_events(path, fmt, start=0, end=None, header=None, hasher=None):
+    """Yield (log, fields) per event in bytes [start, end). `header` (ZeekHeader) carries the
+    column map across incremental reads and is updated in place by header lines; `hasher`
+    (hashlib object) is fed every byte of the range."""
+    if fmt == "zeek_tsv" and header is None:
+        header = ZeekHeader()
+    with open(path, "rb") as fh:
+        for line in _iter_lines(fh, start, end, hasher):
+            if not line:
+                continue
+            if fmt == "zeek_tsv":
+                if header.feed(line):
+                    continue
+                if not header.fields:
+                    header.adopt_legacy(line)
+                fields = header.parse(line)
+                if fields is not None:
+                    yield header.path, fields
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(obj, dict):
+                continue
+            if fmt == "suricata_eve":
+                yield obj.get("event_type", ""), obj
+            else:
+                yield obj.get("_path", header.path if header else ""), obj
+
+def iter_records(path, fmt, start=0, end=None, header=None, window=0.0, hasher=None):
+    """Yield record dicts {text, format, log, ts, fields|events} for a structured log.
+
+    window=0 emits one record per event; window>0 groups consecutive events of the same
+    log whose numeric timestamps fall in the same window (records are capped at SNIPPET_CHARS).
+    """
+    buf, buf_key, buf_len, buf_ts, n = [], None, 0, None, 0
+
+    def flush():
+        return {"text": "\n".join(buf), "format": fmt, "log": buf_key[0], "ts": buf_ts, "events": n}
+
+    for log, fields in iter_events(path, fmt, start, end, header, hasher):
+        text = render_event(fmt, log, fields)
+        ts = _event_ts(fmt, fields)
+        if not window:
+            yield {"text": text, "format": fmt, "log": log, "ts": ts, "fields": fields}
+            continue
+        key = (log, int(ts // window) if isinstance(ts, float) else None)
+        if buf and (key != buf_key or buf_len + len(text) + 1 > SNIPPET_CHARS):
+            yield flush()
+            buf, buf_len, n = [], 0, 0
+        if not buf:
+            buf_key, buf_ts = key, ts
+        buf.append(text)
+        buf_len += len(text) + 1
+        n += 1
+    if buf:
+        yield flush()
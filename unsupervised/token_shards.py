@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# Tokenization cache for LoRA training: token ids of a curated dataset stored as flat
+# uint16/uint32 shards plus per-shard offsets, in a directory keyed by the dataset sha256,
+# a fingerprint of the tokenizer and the tokenization settings. Training maps the shards
+# read-only (mmap + memoryview, no copy of the dataset), so repeated experiments on the same
+# data skip tokenization entirely.
+#
+#   <root>/<key>/meta.json
+#   <root>/<key>/tokens-00000.bin    token ids, native byte order (recorded in meta.json)
+#   <root>/<key>/offsets-00000.bin   uint64, records+1 boundaries into that shard
+#
+#   python3 unsupervised/token_shards.py --list
+
+import os, sys, json, mmap, shutil, bisect, hashlib, argparse
+from array import array
+
+CACHE_ROOT = "unsupervised/storage/token_cache"
+SHARD_TOKENS = 1 << 26     # tokens per shard file (128MB at uint16); records never span shards
+KEEP_ENTRIES = 8           # older cache entries (by last use) are removed after a write
+FORMAT_VERSION = 1
+HOLDOUT_FRACTION = 0.05    # share of curated records kept out of training for eval_adapters.py
+
+def tokenizer_fingerprint(tokenizer):
+    """sha256 over everything that changes token ids: for fast tokenizers the serialized
+    pipeline (vocab, merges, normalizer, pre-tokenizer, added tokens) minus call-time
+    truncation/padding state; otherwise the class, vocabulary and special tokens. The pad
+    token is left out (callers set it after loading and it never appears in stored ids)."""
+    h = hashlib.sha256(type(tokenizer).__name__.encode("utf-8"))
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        spec = json.loads(backend.to_str())
+        spec.pop("truncation", None)
+        spec.pop("padding", None)
+        h.update(json.dumps(spec, sort_keys=True).encode("utf-8"))
+    else:
+        h.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode("utf-8"))
+        special = set(tokenizer.all_special_tokens) - {tokenizer.pad_token} | {tokenizer.eos_token}
+        h.update(json.dumps(sorted(t for t in special if t is not None)).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def cache_key(dataset_sha256, fingerprint, settings):
+    """settings: dict of tokenization options that change the stored ids (e.g. block_size)."""
+    blob = json.dumps({"dataset": dataset_sha256, "tokenizer": fingerprint, "settings": settings,
+                       "format": FORMAT_VERSION, "byteorder": sys.byteorder}, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:24]
+
+def dtype_for(vocab_size):
+    return "uint16" if vocab_size <= 1 << 16 else "uint32"
+
+_TYPECODE = {"uint16": "H", "uint32": "I"}
+
+class ShardWriter:
+    """Append tokenized records; close(key) publishes the entry atomically (rename of a temp dir),
+    so the key may depend on things only known once all records are written (the dataset hash)."""
+
+    def __init__(self, root, vocab_size, meta=None, shard_tokens=SHARD_TOKENS):
+        self.root = root
+        self.tmp = os.path.join(root, f".tmp-{os.getpid()}-{id(self):x}")
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.makedirs(self.tmp)
+        self.dtype = dtype_for(vocab_size)
+        self.code = _TYPECODE[self.dtype]
+        self.meta = dict(meta or {}, vocab_size=vocab_size, dtype=self.dtype, byteorder=sys.byteorder,
+                         format=FORMAT_VERSION)
+        self.shard_tokens = shard_tokens
+        self.shards = []
+        self.records = 0
+        self.fh = None
+        self._open_shard()
+
+    def _open_shard(self):
+        if self.fh is not None:
+            self._close_shard()
+        i = len(self.shards)
+        self.fh = open(os.path.join(self.tmp, f"tokens-{i:05d}.bin"), "wb")
+        self.offsets = array("Q", [0])
+
+    def _close_shard(self):
+        self.fh.close()
+        i = len(self.shards)
+        with open(os.path.join(self.tmp, f"offsets-{i:05d}.bin"), "wb") as fh:
+            self.offsets.tofile(fh)
+        self.shards.append({"records": len(self.offsets) - 1, "tokens": self.offsets[-1]})
+        self.fh = None
+
+    def add(self, batch_ids):
+        for ids in batch_ids:
+            if self.offsets[-1] and self.offsets[-1] + len(ids) > self.shard_tokens:
+                self._open_shard()
+            array(self.code, ids).tofile(self.fh)
+            self.offsets.append(self.offsets[-1] + len(ids))
+            self.records += 1
+
+    def abort(self):
+        if self.fh is not None:
+            self.fh.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def close(self, key):
+        self._close_shard()
+        final = os.path.join(self.root, key)
+        self.meta.update(key=key, shards=self.shards, records=sum(s["records"] for s in self.shards),
+                         tokens=sum(s["tokens"] for s in self.shards))
+        with open(os.path.join(self.tmp, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump(self.meta, fh, indent=2)
+        try:
+            os.rename(self.tmp, final)
+        except OSError:
+            # another run published the same key first; its contents are identical
+            shutil.rmtree(self.tmp, ignore_errors=True)
+        prune(self.root)
+        return final
+
+class TokenShards:
+    """Read-only, memory-mapped view of a cache entry. Items are {"input_ids": [...]}, the
+    form DataCollatorForLanguageModeling pads; only the requested record is materialised."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as fh:
+            self.meta = json.load(fh)
+        if self.meta.get("byteorder") != sys.byteorder:
+            raise ValueError(f"{path} was written on a {self.meta.get('byteorder')}-endian machine")
+        self._open()
+
+    def _map(self, name, code):
+        with open(os.path.join(self.path, name), "rb") as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                return None, memoryview(array(code))
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return mm, memoryview(mm).cast(code)
+
+    def _open(self):
+        code = _TYPECODE[self.meta["dtype"]]
+        self._maps, self._tokens, self._offsets, self._starts = [], [], [], []
+        start = 0
+        for i, shard in enumerate(self.meta["shards"]):
+            mt, tokens = self._map(f"tokens-{i:05d}.bin", code)
+            mo, offsets = self._map(f"offsets-{i:05d}.bin", "Q")
+            self._maps += [m for m in (mt, mo) if m is not None]
+            self._tokens.append(tokens)
+            self._offsets.append(offsets)
+            self._starts.append(start)
+            start += shard["records"]
+        self._len = start
+        os.utime(os.path.join(self.path, "meta.json"))   # last use, for prune()
+
+    def __getstate__(self):
+        # DataLoader workers re-map the files instead of pickling the maps
+        return {"path": self.path, "meta": self.meta}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def __len__(self):
+        return self._len
+
+    def record(self, i):
+        """memoryview of record i's token ids (no copy)."""
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+        s = bisect.bisect_right(self._starts, i) - 1
+        j = i - self._starts[s]
+        off = self._offsets[s]
+        return self._tokens[s][off[j]:off[j + 1]]
+
+    def __getitem__(self, i):
+        return {"input_ids": self.record(i).tolist()}
+
+    def lengths(self):
+        """Token count of every record, in order (read from the offsets only)."""
+        out = array("Q")
+        for off in self._offsets:
+            out.extend(off[j + 1] - off[j] for j in range(len(off) - 1))
+        return out
+
+    def close(self):
+        for v in self._tokens + self._offsets:
+            v.release()
+        self._tokens, self._offsets = [], []
+        for m in self._maps:
+            m.close()
+        self._maps = []
+
+def in_holdout(text, fraction):
+    """Deterministic, content-based evaluation split: the same text is always on the same side."""
+    if fraction <= 0:
+        return False
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16) < fraction * 0x100000000
+
+def tokenize_settings(block_size, pack=False, holdout=HOLDOUT_FRACTION):
+    """Options that change the stored ids; part of the cache key. Packed training cuts blocks
+    at load time, so its documents are stored untruncated and shared across block sizes."""
+    if pack:
+        return {"truncation": False, "holdout": holdout}
+    return {"block_size": block_size, "truncation": True, "holdout": holdout}
+
+def _encode(tokenizer, batch, settings):
+    if settings["truncation"]:
+        return tokenizer(batch, truncation=True, max_length=settings["block_size"])["input_ids"]
+    return tokenizer(batch)["input_ids"]
+
+def tokenize_into(writer, tokenizer, texts, settings, batch_size=1000):
+    """Batch-tokenize an iterable of texts into a ShardWriter, skipping the held-out split."""
+    holdout = settings.get("holdout", 0.0)
+    batch = []
+    for text in texts:
+        if in_holdout(text, holdout):
+            continue
+        batch.append(text)
+        if len(batch) >= batch_size:
+            writer.add(_encode(tokenizer, batch, settings))
+            batch = []
+    if batch:
+        writer.add(_encode(tokenizer, batch, settings))
+    return writer
+
+def lookup(root, key):
+    path = os.path.join(root, key)
+    return path if os.path.exists(os.path.join(path, "meta.json")) else None
+
+def prune(root, keep=KEEP_ENTRIES):
+    entries = []
+    for name in os.listdir(root):
+        if name.startswith(".tmp-"):
+            continue
+        meta = os.path.join(root, name, "meta.json")
+        if os.path.exists(meta):
+            entries.append((os.path.getmtime(meta), name))
+    for _, name in sorted(entries, reverse=True)[keep:]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="list tokenization cache entries")
+    parser.add_argument("--root", default=CACHE_ROOT)
+    parser.add_argument("--list", action="store_true")
+    parser.add_argument("--clear", action="store_true", help="remove every entry")
+    args = parser.parse_args()
+    if args.clear:
+        shutil.rmtree(args.root, ignore_errors=True)
+        print("[token-cache] cleared", args.root)
+    elif os.path.isdir(args.root):
+        for name in sorted(os.listdir(args.root)):
+            meta_path = os.path.join(args.root, name, "meta.json")
+            if os.path.exists(meta_path):
+                with open(meta_path, "r", encoding="utf-8") as fh:
+                    m = json.load(fh)
+                print(f"{name}  {m.get('model')}  records={m['records']} tokens={m['tokens']} {m['dtype']}  "
+                      f"dataset={m.get('dataset_sha256', '')[:12]}  settings={m.get('settings')}")
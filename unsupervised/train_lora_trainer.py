@@ -2,15 +2,25 @@
 # Train a LoRA adapter on unsupervised/curated.jsonl
 # Produces a small adapter in models/iteration_{NNN}
 
-import os, json, hashlib, argparse, math
+import os, json, time, hashlib, argparse, math, inspect
 from datasets import load_dataset
-from transformers import AutoTokenizer, DataCollatorForLanguageModeling, TrainingArguments, Trainer, AutoModelForCausalLM
+import torch
+from transformers import (AutoTokenizer, DataCollatorForLanguageModeling, TrainingArguments, Trainer, AutoModelForCausalLM,
+                          TrainerCallback)
 from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
+from packing import PackedBlocks, PackedCollator, padding_report, format_report
+from token_shards import (CACHE_ROOT, HOLDOUT_FRACTION, ShardWriter, TokenShards, tokenizer_fingerprint,
+                          tokenize_settings, tokenize_into, cache_key, lookup, in_holdout)
 
 BASE_MODEL = os.environ.get("THEFOOL_MODEL_ID", "mistralai/mistral-7b")
 CURATED_FILE = "unsupervised/curated.jsonl"
 MODELS_DIR = "models"
 
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
 def sha256_file(path):
     h = hashlib.sha256()
     with open(path, "rb") as fh:
@@ -26,7 +36,7 @@ def next_iteration(models_dir=MODELS_DIR):
     nums = [int(x.split("_")[1]) for x in existing if x.split("_")[1].isdigit()]
     return max(nums)+1 if nums else 1
 
-def prepare_dataset(curated_path=CURATED_FILE):
+def prepare_dataset(curated_path=CURATED_FILE, holdout=HOLDOUT_FRACTION):
     # dataset expects JSON lines, each object: {"meta":{...},"text":"..."}
     ds = load_dataset("json", data_files={"train": curated_path})
     # rename 'text' field (it should already be present nested in record)
@@ -35,7 +45,8 @@ def prepare_dataset(curated_path=CURATED_FILE):
         text = obj.get("text") or obj.get("content") or obj.get("raw") or ""
         return {"text": text}
     ds = ds["train"].map(lambda x: {"text": x.get("text","")}, remove_columns=ds["train"].column_names)
-    return ds
+    # records eval_adapters.py measures perplexity on are not trained on
+    return ds.filter(lambda x: not in_holdout(x["text"] or "", holdout))
 
 def tokenize_and_group(tokenizer, dataset, block_size=1024):
     def tokenize_fn(examples):
@@ -44,14 +55,161 @@ def tokenize_and_group(tokenizer, dataset, block_size=1024):
     tokenized.set_format(type="torch")
     return tokenized
 
+def cached_tokenize(tokenizer, curated_path, dataset_sha256, model, block_size, root=CACHE_ROOT, pack=False,
+                    holdout=HOLDOUT_FRACTION):
+    """Token ids of the curated file from the tokenization cache, tokenizing (and caching) on a miss."""
+    fingerprint = tokenizer_fingerprint(tokenizer)
+    settings = tokenize_settings(block_size, pack, holdout)
+    key = cache_key(dataset_sha256, fingerprint, settings)
+    path = lookup(root, key)
+    info = {"key": key, "tokenizer_fingerprint": fingerprint, "hit": path is not None}
+    if path is None:
+        t0 = time.perf_counter()
+        os.makedirs(root, exist_ok=True)
+        writer = ShardWriter(root, len(tokenizer), {"model": model, "dataset": curated_path,
+                                                    "dataset_sha256": dataset_sha256, "settings": settings})
+        try:
+            with open(curated_path, "r", encoding="utf-8") as fh:
+                texts = ((json.loads(line).get("text") or "") for line in fh if line.strip())
+                tokenize_into(writer, tokenizer, texts, settings)
+        except BaseException:
+            writer.abort()
+            raise
+        path = writer.close(key)
+        info["tokenize_seconds"] = round(time.perf_counter() - t0, 3)
+        print(f"[train] tokenized {writer.records} records in {info['tokenize_seconds']}s -> {path}")
+    else:
+        print(f"[train] token cache hit: {path}")
+    return TokenShards(path), info
+
+def cpu_threads():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1 << 20) if os.uname().sysname == "Darwin" else rss / 1024, 1)
+
+class TokenCounter:
+    """Collator wrapper counting the target tokens (labels != -100) handed to the model."""
+
+    def __init__(self, collator):
+        self.collator = collator
+        self.tokens = 0
+
+    def __call__(self, features):
+        batch = self.collator(features)
+        self.tokens += int((batch["labels"] != -100).sum())
+        return batch
+
+class ThroughputCallback(TrainerCallback):
+    """Optimizer step times, tokens/s and peak memory of a run, for the iteration manifest."""
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.step_times = []
+        self.t0 = self.t_step = None
+        self.wall = None
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.t0 = time.perf_counter()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self.t_step = time.perf_counter()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self.t_step is not None:
+            self.step_times.append(time.perf_counter() - self.t_step)
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.wall = time.perf_counter() - self.t0
+
+    def summary(self):
+        steps = sorted(self.step_times)
+        out = {
+            "train_wall_s": round(self.wall, 3) if self.wall is not None else None,
+            "steps": len(steps),
+            "step_time_mean_s": round(sum(steps) / len(steps), 4) if steps else None,
+            "step_time_p50_s": round(steps[len(steps) // 2], 4) if steps else None,
+            "step_time_p95_s": round(steps[min(len(steps) - 1, int(len(steps) * 0.95))], 4) if steps else None,
+            "tokens": self.counter.tokens,
+            "tokens_per_s": round(self.counter.tokens / self.wall, 1) if self.wall else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if torch.cuda.is_available():
+            out["peak_cuda_mb"] = round(torch.cuda.max_memory_allocated() / (1 << 20), 1)
+        return out
+
+def resolve_profile(args):
+    """Device/precision settings for this run; "auto" trains on CPU when CUDA is unavailable."""
+    device = args.profile
+    if device == "auto":
+        device = "gpu" if torch.cuda.is_available() else "cpu"
+    if device == "gpu":
+        return {"device": "gpu", "dtype": "fp16" if args.fp16 else "fp32", "load_in_8bit": True,
+                "gradient_checkpointing": True}
+    if args.fp16:
+        print("[train] --fp16 ignored by the CPU profile (use --cpu-dtype bf16)")
+    threads = args.threads or cpu_threads()
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(max(1, threads // 4))
+    except RuntimeError:
+        pass   # already set once in this process
+    return {"device": "cpu", "dtype": args.cpu_dtype, "load_in_8bit": False, "threads": threads,
+            "gradient_checkpointing": not args.no_grad_checkpointing}
+
+def load_model(args, profile):
+    if profile["device"] == "gpu":
+        model = AutoModelForCausalLM.from_pretrained(args.model, load_in_8bit=True, device_map="auto")
+        return prepare_model_for_kbit_training(model)
+    # weights stay fp32 on CPU; bf16 is applied as autocast by the Trainer
+    model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+    if profile["gradient_checkpointing"]:
+        model.gradient_checkpointing_enable()
+        model.enable_input_require_grads()   # LoRA leaves the embeddings frozen
+    model.config.use_cache = False
+    return model
+
+def precision_args(profile):
+    if profile["device"] == "gpu":
+        return {"fp16": profile["dtype"] == "fp16"}
+    cpu = {"use_cpu": True} if "use_cpu" in inspect.signature(TrainingArguments).parameters else {"no_cuda": True}
+    return dict(cpu, bf16=profile["dtype"] == "bf16", dataloader_pin_memory=False)
+
 def train(args):
-    ds = prepare_dataset(args.curated)
-    print(f"[train] dataset size: {len(ds)}")
+    t_start = time.perf_counter()
+    profile = resolve_profile(args)
+    print(f"[train] profile: {profile}")
+    ds_hash = sha256_file(args.curated)
     tokenizer = AutoTokenizer.from_pretrained(args.model)
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token
-    model = AutoModelForCausalLM.from_pretrained(args.model, load_in_8bit=True, device_map="auto")
-    model = prepare_model_for_kbit_training(model)
+    padding = None
+    if args.no_token_cache:
+        tokenized = tokenize_and_group(tokenizer, prepare_dataset(args.curated, args.holdout), block_size=args.block_size)
+        cache_info = None
+        data_collator = DataCollatorForLanguageModeling(tokenizer, mlm=False)
+    else:
+        tokenized, cache_info = cached_tokenize(tokenizer, args.curated, ds_hash, args.model, args.block_size,
+                                                args.token_cache, pack=args.pack, holdout=args.holdout)
+        # without --pack the cache holds ids already truncated to block_size
+        padding = padding_report(tokenized.lengths(), args.block_size, args.batch_size, truncated=not args.pack)
+        if args.pack:
+            padding["mode"] = "packed_doc_masks" if args.doc_masks else "packed"
+            tokenized = PackedBlocks(tokenized, args.block_size, tokenizer.eos_token_id, doc_masks=args.doc_masks)
+            data_collator = PackedCollator(tokenizer.pad_token_id, doc_masks=args.doc_masks)
+        else:
+            padding["mode"] = "truncate_pad"
+            data_collator = DataCollatorForLanguageModeling(tokenizer, mlm=False)
+        print(format_report(padding))
+    print(f"[train] dataset size: {len(tokenized)}")
+    model = load_model(args, profile)
 
     lora_config = LoraConfig(
         r=8,
@@ -63,9 +221,6 @@ def train(args):
     )
     model = get_peft_model(model, lora_config)
 
-    tokenized = tokenize_and_group(tokenizer, ds, block_size=args.block_size)
-    data_collator = DataCollatorForLanguageModeling(tokenizer, mlm=False)
-
     iteration = next_iteration(args.models_dir)
     outdir = os.path.join(args.models_dir, f"iteration_{iteration:03d}")
     os.makedirs(outdir, exist_ok=True)
@@ -75,25 +230,37 @@ def train(args):
         per_device_train_batch_size=args.batch_size,
         gradient_accumulation_steps=args.grad_accum,
         num_train_epochs=args.epochs,
-        fp16=True if args.fp16 else False,
         logging_steps=10,
         save_total_limit=2,
-        report_to="none"
+        report_to="none",
+        # Trainer would otherwise wrap the collator and drop every column the model's forward()
+        # does not take, including the "segments" PackedCollator builds the doc masks from
+        remove_unused_columns=not args.pack,
+        **precision_args(profile)
     )
 
-    trainer = Trainer(model=model, args=training_args, train_dataset=tokenized, data_collator=data_collator, tokenizer=tokenizer)
+    counter = TokenCounter(data_collator)
+    throughput = ThroughputCallback(counter)
+    trainer = Trainer(model=model, args=training_args, train_dataset=tokenized, data_collator=counter, tokenizer=tokenizer,
+                      callbacks=[throughput])
     trainer.train()
     model.save_pretrained(outdir)
     tokenizer.save_pretrained(outdir)
 
     # manifest
-    ds_hash = sha256_file(args.curated)
     model_manifest = {
         "iteration": iteration,
         "outdir": outdir,
         "dataset": args.curated,
-        "dataset_sha256": ds_hash
+        "dataset_sha256": ds_hash,
+        "holdout_fraction": args.holdout
     }
+    if cache_info is not None:
+        model_manifest["token_cache"] = cache_info
+    if padding is not None:
+        model_manifest["padding"] = padding
+    model_manifest["training"] = dict(throughput.summary(), profile=profile,
+                                      total_wall_s=round(time.perf_counter() - t_start, 3))
     manifest_path = os.path.join(outdir, "manifest.json")
     with open(manifest_path, "w", encoding="utf-8") as fh:
         json.dump(model_manifest, fh, indent=2)
@@ -108,6 +275,24 @@ if __name__ == "__main__":
     parser.add_argument("--batch_size", type=int, default=1)
     parser.add_argument("--grad_accum", type=int, default=8)
     parser.add_argument("--block_size", type=int, default=1024)
-    parser.add_argument("--fp16", action="store_true")
+    parser.add_argument("--fp16", action="store_true", help="GPU profile only")
+    parser.add_argument("--profile", choices=["auto", "gpu", "cpu"], default="auto",
+                        help="gpu: 8-bit weights on CUDA; cpu: fp32 weights, --cpu-dtype autocast (auto = cpu without CUDA)")
+    parser.add_argument("--cpu-dtype", choices=["fp32", "bf16"], default="fp32",
+                        help="bf16 autocast pays off on CPUs with native bf16 (AVX512-BF16/AMX)")
+    parser.add_argument("--threads", type=int, default=0, help="CPU profile intra-op threads (0 = CPUs available)")
+    parser.add_argument("--no-grad-checkpointing", action="store_true", help="CPU profile: keep activations (faster, more RAM)")
+    parser.add_argument("--token-cache", default=CACHE_ROOT, help="tokenization cache directory (see token_shards.py)")
+    parser.add_argument("--no-token-cache", action="store_true", help="tokenize in memory on every run")
+    parser.add_argument("--holdout", type=float, default=HOLDOUT_FRACTION,
+                        help="fraction of curated records kept out of training for eval_adapters.py (0 = train on all)")
+    parser.add_argument("--pack", action="store_true",
+                        help="concatenate records with EOS into full block_size blocks instead of truncate-and-pad")
+    parser.add_argument("--doc-masks", action="store_true",
+                        help="with --pack, keep attention within each record (needs a model that accepts 4D masks)")
     args = parser.parse_args()
+    if args.pack and args.no_token_cache:
+        parser.error("--pack reads token ids from the token cache; drop --no-token-cache")
+    if args.doc_masks and not args.pack:
+        parser.error("--doc-masks only applies with --pack")
     train(args)
@@ -1,21 +1,37 @@
 from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, Trainer
 from datasets import load_dataset
 import os
+import argparse
+
+from packing import IdLists, PackedBlocks, PackedCollator, padding_report, format_report
 
 MODEL_NAME = "mistralai/Mistral-7B-v0.1"
 DATASET_FILE = "unsupervised/dataset.jsonl"
 OUTPUT_DIR = "models/iteration_1"
+BLOCK_SIZE = 512
 
-def train():
+def train(pack=False, doc_masks=False):
     dataset = load_dataset("json", data_files=DATASET_FILE, split="train")
 
     tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
     model = AutoModelForCausalLM.from_pretrained(MODEL_NAME)
 
-    def tokenize(batch):
-        return tokenizer(batch["text"], padding="max_length", truncation=True, max_length=512)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    extra = {}
+    if pack:
+        # untruncated ids, concatenated with EOS into BLOCK_SIZE blocks over the whole dataset (see packing.py)
+        ids = dataset.map(lambda batch: tokenizer(batch["text"]), batched=True,
+                          remove_columns=dataset.column_names)["input_ids"]
+        print(format_report(padding_report((len(x) for x in ids), BLOCK_SIZE, 1)))
+        dataset = PackedBlocks(IdLists(ids), BLOCK_SIZE, tokenizer.eos_token_id, doc_masks=doc_masks)
+        extra["data_collator"] = PackedCollator(tokenizer.pad_token_id, doc_masks=doc_masks)
+    else:
+        def tokenize(batch):
+            return tokenizer(batch["text"], padding="max_length", truncation=True, max_length=BLOCK_SIZE)
 
-    dataset = dataset.map(tokenize, batched=True)
+        dataset = dataset.map(tokenize, batched=True)
 
     args = TrainingArguments(
         output_dir=OUTPUT_DIR,
@@ -24,6 +40,7 @@ def train():
         per_device_train_batch_size=1,
         save_steps=50,
         save_total_limit=2,
+        remove_unused_columns=not pack,     # keep PackedBlocks' "segments" for the doc masks
     )
 
     trainer = Trainer(
@@ -31,6 +48,7 @@ def train():
         args=args,
         train_dataset=dataset,
         tokenizer=tokenizer,
+        **extra,
     )
 
     trainer.train()
@@ -39,4 +57,12 @@ def train():
     print(f"[+] Model fine-tuned and saved to {OUTPUT_DIR}")
 
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pack", action="store_true",
+                        help="pack records into full BLOCK_SIZE blocks instead of padding each to BLOCK_SIZE")
+    parser.add_argument("--doc-masks", action="store_true",
+                        help="with --pack, keep attention within each record (needs a model that accepts 4D masks)")
+    args = parser.parse_args()
+    if args.doc_masks and not args.pack:
+        parser.error("--doc-masks only applies with --pack")
+    train(pack=args.pack, doc_masks=args.doc_masks)
@@ -1,14 +1,24 @@
 #!/usr/bin/env python3
 # web/scoreboard.py
 # Simple Flask app to serve the leaderboard JSON and a tiny HTML page.
+#
+# The leaderboard is held in memory as a snapshot: the JSON body and the rendered page are
+# built once per change of web/leaderboard.json (a watcher thread checks its mtime/size
+# every WATCH_INTERVAL), so a request never touches the disk or the template engine. Both
+# routes send ETag / Last-Modified and answer conditional requests with 304. /events is a
+# Server-Sent Events stream that pushes the leaderboard whenever it changes; the page uses
+# it to update in place instead of being reloaded.
 # Usage: python3 web/scoreboard.py
 
-from flask import Flask, jsonify, render_template_string
-import json, os
+from flask import Flask, Response, request
+import hashlib, json, os, threading, time
+from email.utils import formatdate
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
 LEADERBOARD_JSON = 'web/leaderboard.json'
+WATCH_INTERVAL = 0.5        # seconds between mtime checks of LEADERBOARD_JSON
+HEARTBEAT = 15.0            # SSE keep-alive comment interval (proxies drop idle streams)
 
 HTML = '''
 <!doctype html>
@@ -25,6 +35,7 @@ HTML = '''
 </head>
 <body>
   <h1>TheFool Leaderboard</h1>
+  <div id="board">
   {% if board %}
   <table>
     <tr><th>Rank</th><th>Author</th><th>Points</th><th>Reports</th></tr>
@@ -41,26 +52,159 @@ HTML = '''
   {% else %}
   <p>No leaderboard data yet. Run the scorer: <code>python3 tools/scorer/score.py</code></p>
   {% endif %}
+  </div>
+  <script>
+    // live updates: the server pushes the leaderboard JSON on every change
+    if (window.EventSource) {
+      new EventSource('events').addEventListener('leaderboard', function (ev) {
+        var data = JSON.parse(ev.data), board = data.leaderboard || [];
+        if (!board.length) {
+          // leaderboard cleared: same message as the server-rendered page
+          var empty = document.createElement('p'), code = document.createElement('code');
+          code.textContent = 'python3 tools/scorer/score.py';
+          empty.append('No leaderboard data yet. Run the scorer: ', code);
+          document.getElementById('board').replaceChildren(empty);
+          return;
+        }
+        var table = document.createElement('table'), head = table.insertRow();
+        ['Rank', 'Author', 'Points', 'Reports'].forEach(function (h) {
+          var th = document.createElement('th'); th.textContent = h; head.appendChild(th);
+        });
+        board.forEach(function (e, i) {
+          var row = table.insertRow();
+          [i + 1, e.author, e.points, e.reports].forEach(function (v) { row.insertCell().textContent = v; });
+        });
+        var updated = document.createElement('p');
+        updated.textContent = 'Updated: ' + (data.updated || 'unknown');
+        document.getElementById('board').replaceChildren(table, updated);
+      });
+    }
+  </script>
 </body>
 </html>
 '''
 
+class Snapshot:
+    """Serialized leaderboard + rendered page for one version of LEADERBOARD_JSON."""
+
+    def __init__(self, sig, data, page_template):
+        self.sig = sig
+        self.json = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        self.html = page_template.render(board=data.get('leaderboard', []),
+                                         updated=data.get('updated', 'unknown')).encode('utf-8')
+        digest = hashlib.sha256(self.json).hexdigest()[:32]
+        self.json_etag = digest
+        self.html_etag = 'h-' + digest      # the page embeds the same data
+        self.last_modified = int(sig[0] // 1_000_000_000) if sig else None
+        self.version = digest[:16]
+
+class Leaderboard:
+    """Keeps the current Snapshot and wakes SSE clients when it changes."""
+
+    def __init__(self, path, interval=WATCH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.page_template = app.jinja_env.from_string(HTML)     # compiled once
+        self.changed = threading.Condition()
+        self.snapshot = self._load(self._stat()) or Snapshot(None, {'updated': None, 'leaderboard': []},
+                                                             self.page_template)
+        self._watcher = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _load(self, sig):
+        """Snapshot of the file with signature `sig`, or None if it cannot be read right now."""
+        if sig is None:
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return None     # mid-write by a non-atomic writer: retried on the next check
+        return Snapshot(sig, data, self.page_template)
+
+    def refresh(self):
+        sig = self._stat()
+        if sig is None or sig == self.snapshot.sig:
+            return False
+        snap = self._load(sig)
+        if snap is None:
+            return False
+        if snap.version == self.snapshot.version:
+            self.snapshot = snap        # touched but same content: no push
+            return False
+        with self.changed:
+            self.snapshot = snap
+            self.changed.notify_all()
+        return True
+
+    def start(self):
+        with self.changed:
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, name='leaderboard-watch', daemon=True)
+                self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:      # keep watching; the next change may load fine
+                app.logger.warning('leaderboard reload failed: %s', e)
+
+    def wait(self, version, timeout):
+        """Block until the snapshot version differs from `version` (or timeout); returns the snapshot."""
+        with self.changed:
+            if self.snapshot.version == version:
+                self.changed.wait(timeout)
+            return self.snapshot
+
+board = Leaderboard(LEADERBOARD_JSON)
+
+def _cached(body, mimetype, etag, snap):
+    resp = Response(body, mimetype=mimetype)
+    resp.set_etag(etag)
+    if snap.last_modified:
+        resp.headers['Last-Modified'] = formatdate(snap.last_modified, usegmt=True)
+    resp.headers['Cache-Control'] = 'no-cache'      # cache, but revalidate (cheap 304) every time
+    return resp.make_conditional(request)
+
+@app.before_request
+def _start_watcher():
+    board.start()
+
 @app.route('/leaderboard.json')
 def leaderboard_json():
-    if not os.path.exists(LEADERBOARD_JSON):
-        return jsonify({'updated': None, 'leaderboard': []})
-    with open(LEADERBOARD_JSON, 'r', encoding='utf-8') as fh:
-        return jsonify(json.load(fh))
+    snap = board.snapshot
+    return _cached(snap.json, 'application/json', snap.json_etag, snap)
 
 @app.route('/')
 def index():
-    data = {}
-    if os.path.exists(LEADERBOARD_JSON):
-        with open(LEADERBOARD_JSON, 'r', encoding='utf-8') as fh:
-            data = json.load(fh)
-    board = data.get('leaderboard', [])
-    updated = data.get('updated', 'unknown')
-    return render_template_string(HTML, board=board, updated=updated)
+    snap = board.snapshot
+    return _cached(snap.html, 'text/html', snap.html_etag, snap)
+
+@app.route('/events')
+def events():
+    def stream(last):
+        snap = board.snapshot
+        while True:
+            if snap.version != last:
+                last = snap.version
+                yield f'id: {last}\nevent: leaderboard\ndata: {snap.json.decode("utf-8")}\n\n'
+            else:
+                yield ': ping\n\n'
+            snap = board.wait(last, HEARTBEAT)
+    # a reconnecting EventSource sends the id it last saw; skip the resend if still current
+    resp = Response(stream(request.headers.get('Last-Event-ID')), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080)
+    board.start()
+    app.run(host='0.0.0.0', port=8080, threaded=True)